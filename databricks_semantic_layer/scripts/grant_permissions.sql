@@ -1,11 +1,11 @@
 -- Grant Permissions Script
--- This script grants access to business views and metrics
+-- This script grants access to business aggregates and metrics
 -- Adjust catalog, schema, and user/group names as needed
 
--- Grant permissions on business views
-GRANT SELECT ON VIEW workspace.dbt_poc.business_revenue_metrics TO `account users`;
-GRANT SELECT ON VIEW workspace.dbt_poc.business_order_metrics TO `account users`;
-GRANT SELECT ON VIEW workspace.dbt_poc.business_customer_metrics TO `account users`;
+-- Grant permissions on business aggregates (dbt models in models/aggregates)
+GRANT SELECT ON TABLE workspace.dbt_poc.business_revenue_metrics TO `account users`;
+GRANT SELECT ON TABLE workspace.dbt_poc.business_order_metrics TO `account users`;
+GRANT SELECT ON TABLE workspace.dbt_poc.business_customer_metrics TO `account users`;
 
 -- Grant permissions on metrics
 -- Note: Metric permissions are managed through Unity Catalog
@@ -20,7 +20,7 @@ GRANT SELECT ON TABLE workspace.dbt_poc.dim_stores TO `account users`;
 -- - A service principal: `service-principal-name`
 
 -- Example for specific groups:
--- GRANT SELECT ON VIEW workspace.dbt_poc.business_revenue_metrics TO `analysts@company.com`;
--- GRANT SELECT ON VIEW workspace.dbt_poc.business_order_metrics TO `analysts@company.com`;
--- GRANT SELECT ON VIEW workspace.dbt_poc.business_customer_metrics TO `analysts@company.com`;
+-- GRANT SELECT ON TABLE workspace.dbt_poc.business_revenue_metrics TO `analysts@company.com`;
+-- GRANT SELECT ON TABLE workspace.dbt_poc.business_order_metrics TO `analysts@company.com`;
+-- GRANT SELECT ON TABLE workspace.dbt_poc.business_customer_metrics TO `analysts@company.com`;
 
@@ -0,0 +1,148 @@
+{#-
+  Physical layout of the fact marts on Databricks, configured per model in the
+  `mart_layouts` var (dbt_project.yml):
+
+    layout: liquid      liquid clustering on `cluster_by` (max 4 columns)
+    layout: partition   partition by `time_column` truncated to `partition_grain`
+                        (a `<time_column>_<grain>` column added by the model),
+                        plus OPTIMIZE ... ZORDER BY `zorder_by` after each run
+    layout: none        plain Delta table
+
+  The layout columns must come from the mart's semantic model: its
+  agg_time_dimension and its entities. validate_mart_layout() checks that at
+  compile time, so `dbt compile` catches a bad layout without a warehouse;
+  `dbt run-operation check_mart_layouts` validates and prints every layout.
+-#}
+
+{% macro mart_layout_spec(model_name) %}
+    {{ return(var('mart_layouts', {}).get(model_name, {})) }}
+{% endmacro %}
+
+
+{% macro mart_partition_column_name(model_name) %}
+    {%- set spec = mart_layout_spec(model_name) -%}
+    {{ return(spec.get('time_column') ~ '_' ~ spec.get('partition_grain', 'month')) }}
+{% endmacro %}
+
+
+{% macro mart_layout(model_name) %}
+    {#- config() kwargs for the model's layout -#}
+    {%- set spec = mart_layout_spec(model_name) -%}
+    {%- set kind = spec.get('layout', 'none') -%}
+    {%- if kind == 'liquid' -%}
+        {{ return({'liquid_clustered_by': spec.get('cluster_by', [])}) }}
+    {%- elif kind == 'partition' -%}
+        {{ return({'partition_by': [mart_partition_column_name(model_name)], 'zorder': spec.get('zorder_by') or none}) }}
+    {%- endif -%}
+    {{ return({}) }}
+{% endmacro %}
+
+
+{% macro mart_partition_column(model_name) %}
+    {#- Extra select column holding the partition value (partition layout only) -#}
+    {%- set spec = mart_layout_spec(model_name) -%}
+    {%- if spec.get('layout') == 'partition' -%}
+        , cast(date_trunc('{{ spec.get("partition_grain", "month") }}', {{ spec.get('time_column') }}) as date) as {{ mart_partition_column_name(model_name) }}
+    {%- endif -%}
+{% endmacro %}
+
+
+{% macro mart_semantic_columns(model_name) %}
+    {#- (agg time column, entity columns) of the semantic model built on this mart, or none -#}
+    {%- set node_id = 'model.' ~ project_name ~ '.' ~ model_name -%}
+    {%- for semantic_model in (graph.get('semantic_models') or {}).values() -%}
+        {%- if node_id in semantic_model.get('depends_on', {}).get('nodes', []) -%}
+            {%- set agg_time = (semantic_model.get('defaults') or {}).get('agg_time_dimension') -%}
+            {%- set time_column = [] -%}
+            {%- for dimension in semantic_model.get('dimensions', []) -%}
+                {%- if dimension.get('name') == agg_time -%}
+                    {%- do time_column.append(dimension.get('expr') or dimension.get('name')) -%}
+                {%- endif -%}
+            {%- endfor -%}
+            {%- set entity_columns = [] -%}
+            {%- for entity in semantic_model.get('entities', []) -%}
+                {%- do entity_columns.append(entity.get('expr') or entity.get('name')) -%}
+            {%- endfor -%}
+            {{ return({'semantic_model': semantic_model.get('name'), 'time_column': (time_column or [agg_time])[0], 'entity_columns': entity_columns}) }}
+        {%- endif -%}
+    {%- endfor -%}
+    {{ return(none) }}
+{% endmacro %}
+
+
+{% macro validate_mart_layout(model_name) %}
+    {%- set spec = mart_layout_spec(model_name) -%}
+    {%- set kind = spec.get('layout', 'none') -%}
+    {%- set prefix = "mart_layouts." ~ model_name ~ ": " -%}
+
+    {%- if kind not in ('liquid', 'partition', 'none') -%}
+        {{ exceptions.raise_compiler_error(prefix ~ "unknown layout '" ~ kind ~ "' (expected liquid, partition or none)") }}
+    {%- endif -%}
+    {%- if kind == 'none' -%}
+        {{ return(true) }}
+    {%- endif -%}
+
+    {%- set cluster_by = spec.get('cluster_by', []) -%}
+    {%- set zorder_by = spec.get('zorder_by', []) -%}
+    {%- if kind == 'liquid' -%}
+        {%- if not cluster_by -%}
+            {{ exceptions.raise_compiler_error(prefix ~ "liquid layout needs cluster_by columns") }}
+        {%- endif -%}
+        {%- if cluster_by | length > 4 -%}
+            {{ exceptions.raise_compiler_error(prefix ~ "liquid clustering supports at most 4 columns, got " ~ cluster_by | length) }}
+        {%- endif -%}
+        {%- if zorder_by -%}
+            {{ exceptions.raise_compiler_error(prefix ~ "zorder_by can't be combined with liquid clustering") }}
+        {%- endif -%}
+    {%- else -%}
+        {%- if spec.get('partition_grain', 'month') not in ('day', 'month', 'year') -%}
+            {{ exceptions.raise_compiler_error(prefix ~ "partition_grain must be day, month or year") }}
+        {%- endif -%}
+        {%- if spec.get('time_column') in zorder_by -%}
+            {{ exceptions.raise_compiler_error(prefix ~ "don't Z-order on the partition time column '" ~ spec.get('time_column') ~ "'") }}
+        {%- endif -%}
+    {%- endif -%}
+
+    {#- Layout columns must be the semantic model's time dimension and entities -#}
+    {%- set semantic = mart_semantic_columns(model_name) if execute else none -%}
+    {%- if semantic -%}
+        {%- set allowed = [semantic.time_column] + semantic.entity_columns -%}
+        {%- if spec.get('time_column') != semantic.time_column -%}
+            {{ exceptions.raise_compiler_error(prefix ~ "time_column '" ~ spec.get('time_column') ~ "' is not the agg_time_dimension of semantic model '" ~ semantic.semantic_model ~ "' (" ~ semantic.time_column ~ ")") }}
+        {%- endif -%}
+        {%- for column in cluster_by + zorder_by -%}
+            {%- if column not in allowed -%}
+                {{ exceptions.raise_compiler_error(prefix ~ "'" ~ column ~ "' is neither the time dimension nor an entity of semantic model '" ~ semantic.semantic_model ~ "' (allowed: " ~ allowed | join(', ') ~ ")") }}
+            {%- endif -%}
+        {%- endfor -%}
+        {%- if kind == 'liquid' and cluster_by[0] != semantic.time_column -%}
+            {{ exceptions.raise_compiler_error(prefix ~ "cluster_by should start with the time column '" ~ semantic.time_column ~ "'") }}
+        {%- endif -%}
+    {%- endif -%}
+    {{ return(true) }}
+{% endmacro %}
+
+
+{% macro mart_layout_ddl(model_name) %}
+    {#- The layout clause dbt-databricks generates for the model (for checks and docs) -#}
+    {%- set config = mart_layout(model_name) -%}
+    {%- if config.get('liquid_clustered_by') -%}
+        {{ return('CLUSTER BY (' ~ config.liquid_clustered_by | join(', ') ~ ')') }}
+    {%- elif config.get('partition_by') -%}
+        {%- set ddl = 'PARTITIONED BY (' ~ config.partition_by | join(', ') ~ ')' -%}
+        {%- if config.get('zorder') -%}
+            {%- set ddl = ddl ~ '; OPTIMIZE ... ZORDER BY (' ~ config.zorder | join(', ') ~ ')' -%}
+        {%- endif -%}
+        {{ return(ddl) }}
+    {%- endif -%}
+    {{ return('') }}
+{% endmacro %}
+
+
+{% macro check_mart_layouts() %}
+    {#- dbt run-operation check_mart_layouts: validate every configured layout -#}
+    {%- for model_name in var('mart_layouts', {}) -%}
+        {%- do validate_mart_layout(model_name) -%}
+        {{ log("✓ " ~ model_name ~ ": " ~ (mart_layout_ddl(model_name) or 'no layout'), info=true) }}
+    {%- endfor -%}
+{% endmacro %}
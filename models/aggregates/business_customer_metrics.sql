@@ -1,7 +1,33 @@
--- Business View: Customer Metrics
--- This view provides customer-level aggregations and metrics
+{{
+  config(
+    materialized='incremental',
+    unique_key='customer_id',
+    incremental_strategy='merge'
+  )
+}}
 
-CREATE OR REPLACE VIEW workspace.dbt_poc.business_customer_metrics AS
+-- Business aggregate: Customer Metrics
+-- Customer-level aggregations and metrics (one row per customer).
+--
+-- Incremental: each run recomputes only customers with orders in the last
+-- `incremental_lookback_days` before the latest order already aggregated,
+-- plus customers not yet in the table, and merges them on customer_id.
+
+{% if is_incremental() %}
+WITH affected_customers AS (
+    SELECT DISTINCT customer_id
+    FROM {{ ref('fct_orders') }}
+    WHERE order_date >= (
+        SELECT DATEADD(day, -{{ var('incremental_lookback_days') }}, MAX(last_order_date))
+        FROM {{ this }}
+    )
+    UNION
+    SELECT c.customer_id
+    FROM {{ ref('dim_customers') }} c
+    LEFT ANTI JOIN {{ this }} t ON c.customer_id = t.customer_id
+)
+
+{% endif %}
 SELECT
     -- Customer dimensions
     c.customer_id,
@@ -42,15 +68,14 @@ SELECT
         ELSE 'Bank Transfer'
     END AS preferred_payment_method
 
-FROM workspace.dbt_poc.dim_customers c
-LEFT JOIN workspace.dbt_poc.fct_orders o ON c.customer_id = o.customer_id
+FROM {{ ref('dim_customers') }} c
+{% if is_incremental() %}
+INNER JOIN affected_customers a ON c.customer_id = a.customer_id
+{% endif %}
+LEFT JOIN {{ ref('fct_orders') }} o ON c.customer_id = o.customer_id
 GROUP BY
     c.customer_id,
     c.first_name,
     c.last_name,
     c.name,
-    c.region;
-
--- Grant permissions (adjust as needed)
--- GRANT SELECT ON VIEW workspace.dbt_poc.business_customer_metrics TO `account users`;
-
+    c.region
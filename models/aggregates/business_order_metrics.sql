@@ -1,7 +1,22 @@
--- Business View: Order Metrics
--- This view provides order-level aggregations and statistics
+{{
+  config(
+    materialized='incremental',
+    incremental_strategy='microbatch',
+    event_time='order_day',
+    batch_size='day',
+    lookback=var('incremental_lookback_days'),
+    begin=var('aggregates_begin')
+  )
+}}
+
+-- Business aggregate: Order Metrics
+-- Order-level aggregations and statistics by day, store, customer region and order status.
+--
+-- Materialized as daily buckets with dbt microbatch: each run recomputes only
+-- the days from `incremental_lookback_days` ago through today (fct_orders is
+-- filtered to each batch via its event_time) and replaces those days in place.
+-- Backfill with: dbt run --select business_order_metrics --event-time-start <date> --event-time-end <date>
 
-CREATE OR REPLACE VIEW workspace.dbt_poc.business_order_metrics AS
 SELECT
     -- Time dimensions
     DATE_TRUNC('day', o.order_date) AS order_day,
@@ -39,9 +54,9 @@ SELECT
     SUM(o.amount) / NULLIF(COUNT(DISTINCT o.order_id), 0) AS average_order_value,
     SUM(o.amount) / NULLIF(COUNT(DISTINCT o.customer_id), 0) AS revenue_per_customer
 
-FROM workspace.dbt_poc.fct_orders o
-LEFT JOIN workspace.dbt_poc.dim_stores s ON o.store_id = s.store_id
-LEFT JOIN workspace.dbt_poc.dim_customers c ON o.customer_id = c.customer_id
+FROM {{ ref('fct_orders') }} o
+LEFT JOIN {{ ref('dim_stores') }} s ON o.store_id = s.store_id
+LEFT JOIN {{ ref('dim_customers') }} c ON o.customer_id = c.customer_id
 GROUP BY
     DATE_TRUNC('day', o.order_date),
     DATE_TRUNC('week', o.order_date),
@@ -51,8 +66,4 @@ GROUP BY
     s.store_type,
     s.region,
     c.region,
-    o.status;
-
--- Grant permissions (adjust as needed)
--- GRANT SELECT ON VIEW workspace.dbt_poc.business_order_metrics TO `account users`;
-
+    o.status
@@ -0,0 +1,82 @@
+{{
+  config(
+    materialized='incremental',
+    incremental_strategy='microbatch',
+    event_time='order_day',
+    batch_size='day',
+    lookback=var('incremental_lookback_days'),
+    begin=var('aggregates_begin'),
+    on_schema_change='append_new_columns'
+  )
+}}
+
+-- Business aggregate: Revenue Metrics
+-- Pre-aggregated revenue metrics by day, store, customer region and order status.
+--
+-- Materialized as daily buckets with dbt microbatch: each run recomputes only
+-- the days from `incremental_lookback_days` ago through today (fct_orders is
+-- filtered to each batch via its event_time) and replaces those days in place.
+-- With `rollup_sketches` on, HyperLogLog sketches of order_id are stored per
+-- bucket so distinct order counts can be merged across buckets approximately
+-- (aggregate_router.py, approximate mode). New columns (e.g. the sketches) are
+-- appended to an existing table, but are NULL for buckets built before they
+-- existed: backfill those days (below) or run once with --full-refresh.
+-- Backfill with: dbt run --select business_revenue_metrics --event-time-start <date> --event-time-end <date>
+
+SELECT
+    -- Time dimensions
+    DATE_TRUNC('day', o.order_date) AS order_day,
+    DATE_TRUNC('week', o.order_date) AS order_week,
+    DATE_TRUNC('month', o.order_date) AS order_month,
+    DATE_TRUNC('quarter', o.order_date) AS order_quarter,
+    DATE_TRUNC('year', o.order_date) AS order_year,
+    
+    -- Store dimensions
+    s.store_type,
+    s.region AS store_region,
+    s.store_name,
+    
+    -- Customer dimensions
+    c.region AS customer_region,
+    
+    -- Order dimensions
+    o.status AS order_status,
+    
+    -- Revenue metrics
+    SUM(o.amount) AS total_revenue,
+    SUM(o.credit_card_amount) AS credit_card_revenue,
+    SUM(o.coupon_amount) AS coupon_revenue,
+    SUM(o.bank_transfer_amount) AS bank_transfer_revenue,
+    SUM(CASE WHEN o.status = 'completed' THEN o.amount ELSE 0 END) AS completed_revenue,
+    
+    -- Order counts
+    COUNT(DISTINCT o.order_id) AS total_orders,
+    COUNT(DISTINCT CASE WHEN o.status = 'completed' THEN o.order_id END) AS completed_orders,
+    
+{%- if var('rollup_sketches') %}
+    
+    -- Distinct-count sketches (merge with hll_union_agg, read with hll_sketch_estimate)
+    hll_sketch_agg(o.order_id, {{ var('rollup_sketch_lg_k') }}) AS order_id_sketch,
+    hll_sketch_agg(CASE WHEN o.status = 'completed' THEN o.order_id END, {{ var('rollup_sketch_lg_k') }}) AS completed_order_id_sketch,
+{%- endif %}
+    
+    -- Calculated metrics
+    SUM(o.amount) / NULLIF(COUNT(DISTINCT o.order_id), 0) AS average_order_value,
+    SUM(o.credit_card_amount) / NULLIF(SUM(o.amount), 0) AS credit_card_payment_ratio,
+    COUNT(DISTINCT CASE WHEN o.status = 'completed' THEN o.order_id END) / 
+        NULLIF(COUNT(DISTINCT o.order_id), 0) AS order_completion_rate
+
+FROM {{ ref('fct_orders') }} o
+LEFT JOIN {{ ref('dim_stores') }} s ON o.store_id = s.store_id
+LEFT JOIN {{ ref('dim_customers') }} c ON o.customer_id = c.customer_id
+GROUP BY
+    DATE_TRUNC('day', o.order_date),
+    DATE_TRUNC('week', o.order_date),
+    DATE_TRUNC('month', o.order_date),
+    DATE_TRUNC('quarter', o.order_date),
+    DATE_TRUNC('year', o.order_date),
+    s.store_type,
+    s.region,
+    s.store_name,
+    c.region,
+    o.status
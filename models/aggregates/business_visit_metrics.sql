@@ -0,0 +1,54 @@
+{{
+  config(
+    materialized='incremental',
+    incremental_strategy='microbatch',
+    event_time='visit_day',
+    batch_size='day',
+    lookback=var('incremental_lookback_days'),
+    begin=var('aggregates_begin'),
+    on_schema_change='append_new_columns'
+  )
+}}
+
+-- Business aggregate: Visit Metrics
+-- Visit counts by day, page type and referrer.
+--
+-- Materialized as daily buckets with dbt microbatch, like the order aggregates
+-- (fct_visits is filtered to each batch via its event_time). Distinct visit and
+-- visitor counts per bucket can't be summed across buckets, so with
+-- `rollup_sketches` on each bucket also stores HyperLogLog sketches of visit_id
+-- and customer_id for approximate roll-ups (aggregate_router.py). Columns added
+-- later are appended to the existing table, NULL until their days are rebuilt.
+-- Backfill with: dbt run --select business_visit_metrics --event-time-start <date> --event-time-end <date>
+
+SELECT
+    -- Time dimensions
+    DATE_TRUNC('day', v.visit_date) AS visit_day,
+    DATE_TRUNC('week', v.visit_date) AS visit_week,
+    DATE_TRUNC('month', v.visit_date) AS visit_month,
+    DATE_TRUNC('quarter', v.visit_date) AS visit_quarter,
+    DATE_TRUNC('year', v.visit_date) AS visit_year,
+    
+    -- Visit dimensions
+    v.page_type,
+    v.referrer,
+    
+    -- Visit counts (exact per bucket)
+    COUNT(DISTINCT v.visit_id) AS total_visits,
+    COUNT(DISTINCT v.customer_id) AS unique_visitors
+{%- if var('rollup_sketches') %},
+    
+    -- Distinct-count sketches (merge with hll_union_agg, read with hll_sketch_estimate)
+    hll_sketch_agg(v.visit_id, {{ var('rollup_sketch_lg_k') }}) AS visit_id_sketch,
+    hll_sketch_agg(v.customer_id, {{ var('rollup_sketch_lg_k') }}) AS visitor_id_sketch
+{%- endif %}
+
+FROM {{ ref('fct_visits') }} v
+GROUP BY
+    DATE_TRUNC('day', v.visit_date),
+    DATE_TRUNC('week', v.visit_date),
+    DATE_TRUNC('month', v.visit_date),
+    DATE_TRUNC('quarter', v.visit_date),
+    DATE_TRUNC('year', v.visit_date),
+    v.page_type,
+    v.referrer
@@ -1,9 +1,33 @@
+{{
+  config(
+    materialized='incremental',
+    unique_key='order_id',
+    event_time='order_date',
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns',
+    **mart_layout('fct_orders')
+  )
+}}
+
+{% do validate_mart_layout('fct_orders') %}
+
+-- Incremental: each run merges only orders from the last
+-- `incremental_lookback_days` before the latest loaded order_date, so
+-- late-arriving and restated orders in that window are picked up without
+-- rebuilding the full table. Run with --full-refresh to rebuild everything.
+
 with customers as (
     select * from {{ ref('stg_customers') }}
 ),
 
 orders as (
     select * from {{ ref('stg_orders') }}
+    {% if is_incremental() %}
+    where order_date >= (
+        select dateadd(day, -{{ var('incremental_lookback_days') }}, max(order_date))
+        from {{ this }}
+    )
+    {% endif %}
 ),
 
 final as (
@@ -22,9 +46,9 @@ final as (
         0 as bank_transfer_amount,
         orders.tax_paid,
         orders.store_id
+        {{ mart_partition_column('fct_orders') }}
     from orders
     left join customers on orders.customer_id = customers.customer_id
 )
 
 select * from final
-
@@ -0,0 +1,108 @@
+{{
+  config(
+    materialized='incremental',
+    unique_key='visit_id',
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns',
+    **mart_layout('fct_visit_conversions')
+  )
+}}
+
+{% do validate_mart_layout('fct_visit_conversions') %}
+
+-- Visit -> order conversions: one row per visit with the customer's next order
+-- and, for each window in `conversion_windows_days`, whether that order came
+-- within the window (converted_7d, converted_30d, ...).
+--
+-- As-of join over customer timelines instead of a range join: visits and orders
+-- are unioned into one event stream, sorted per customer by date (a visit sorts
+-- before an order on the same day, so same-day orders convert), and a single
+-- reverse window pass carries the next order back onto every visit. Every
+-- window is derived from that one next-order date, so adding a window costs a
+-- column, not another join.
+--
+-- A visit's conversion can change when a later order arrives, so incremental
+-- runs recompute whole timelines for customers with a visit or order inside
+-- the lookback window and merge them on visit_id.
+
+{%- set windows = var('conversion_windows_days') %}
+
+with
+
+{% if is_incremental() %}
+watermark as (
+    select dateadd(
+        day,
+        -{{ var('incremental_lookback_days') }},
+        coalesce(max(greatest(visit_date, coalesce(next_order_date, visit_date))), '1900-01-01')
+    ) as since
+    from {{ this }}
+),
+
+affected_customers as (
+    select customer_id from {{ ref('fct_orders') }}
+    where order_date >= (select since from watermark)
+    union
+    select customer_id from {{ ref('fct_visits') }}
+    where visit_date >= (select since from watermark)
+),
+{% endif %}
+
+events as (
+    select
+        visits.customer_id,
+        visits.visit_date as event_date,
+        0 as event_rank,
+        visits.visit_id,
+        visits.page_type,
+        visits.referrer,
+        null as order_id
+    from {{ ref('fct_visits') }} visits
+    {% if is_incremental() %}
+    inner join affected_customers on visits.customer_id = affected_customers.customer_id
+    {% endif %}
+
+    union all
+
+    select
+        orders.customer_id,
+        orders.order_date as event_date,
+        1 as event_rank,
+        cast(null as string) as visit_id,
+        cast(null as string) as page_type,
+        cast(null as string) as referrer,
+        orders.order_id
+    from {{ ref('fct_orders') }} orders
+    {% if is_incremental() %}
+    inner join affected_customers on orders.customer_id = affected_customers.customer_id
+    {% endif %}
+),
+
+timeline as (
+    select
+        *,
+        first_value(case when event_rank = 1 then event_date end, true) over following_events as next_order_date,
+        first_value(order_id, true) over following_events as next_order_id
+    from events
+    window following_events as (
+        partition by customer_id
+        order by event_date, event_rank
+        rows between current row and unbounded following
+    )
+)
+
+select
+    visit_id,
+    customer_id,
+    event_date as visit_date,
+    page_type,
+    referrer,
+    next_order_id,
+    next_order_date,
+    datediff(next_order_date, event_date) as days_to_order
+    {%- for days in windows %},
+    case when next_order_date <= dateadd(day, {{ days }}, event_date) then 1 else 0 end as converted_{{ days }}d
+    {%- endfor %}
+    {{ mart_partition_column('fct_visit_conversions') }}
+from timeline
+where event_rank = 0
@@ -1,19 +1,52 @@
-{{ config(materialized='table') }}
+{{
+  config(
+    materialized='incremental',
+    unique_key='visit_id',
+    event_time='visit_date',
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns',
+    **mart_layout('fct_visits')
+  )
+}}
+
+{% do validate_mart_layout('fct_visits') %}
 
 -- Visits table for conversion metrics
 -- Base event: Customer visits to the Jaffle Shop website
 -- Conversion event: Orders placed (fct_orders)
 -- Linked by customer_id entity
+--
+-- Visits are a pure function of (customer_id, visit number, first order date):
+-- one xxhash64 per visit row drives the day offset, page type and referrer.
+-- Incremental runs regenerate visits only for customers with orders inside the
+-- lookback window (new customers, or a late order that moves a first order
+-- date) and merge them on visit_id, which is stable across runs.
 
-with customer_first_orders as (
-    select 
-        customer_id,
-        min(order_date) as first_order_date
+with
+
+{% if is_incremental() %}
+affected_customers as (
+    select distinct customer_id
     from {{ ref('fct_orders') }}
-    group by customer_id
+    where order_date >= (
+        select dateadd(day, -{{ var('incremental_lookback_days') }}, coalesce(max(first_order_date), '1900-01-01'))
+        from {{ this }}
+    )
+),
+{% endif %}
+
+customer_first_orders as (
+    select
+        orders.customer_id,
+        min(orders.order_date) as first_order_date
+    from {{ ref('fct_orders') }} orders
+    {% if is_incremental() %}
+    inner join affected_customers on orders.customer_id = affected_customers.customer_id
+    {% endif %}
+    group by orders.customer_id
 ),
 
--- Generate visits: 2-4 visits per customer, 1-30 days before first order
+-- 4 visits per customer, 1-30 days before their first order
 visit_numbers as (
     select 1 as n
     union all select 2
@@ -21,37 +54,35 @@ visit_numbers as (
     union all select 4
 ),
 
-visits_generated as (
+visits_hashed as (
     select
         cfo.customer_id,
-        dateadd(day, 
-            -(abs(hash(concat(cfo.customer_id, '_', vn.n))) % 30 + 1),
-            cfo.first_order_date
-        ) as visit_date,
-        concat('visit_', cfo.customer_id, '_', vn.n) as visit_id,
-        case (abs(hash(concat(cfo.customer_id, '_page_', vn.n))) % 4)
+        cfo.first_order_date,
+        vn.n,
+        xxhash64(cfo.customer_id, vn.n) as h
+    from customer_first_orders cfo
+    cross join visit_numbers vn
+),
+
+visits_generated as (
+    select
+        concat('visit_', customer_id, '_', n) as visit_id,
+        customer_id,
+        dateadd(day, -(pmod(h, 30) + 1), first_order_date) as visit_date,
+        case pmod(h div 30, 4)
             when 0 then 'home'
             when 1 then 'products'
             when 2 then 'product_detail'
             else 'checkout'
         end as page_type,
-        case (abs(hash(concat(cfo.customer_id, '_ref_', vn.n))) % 4)
+        case pmod(h div 120, 4)
             when 0 then 'direct'
             when 1 then 'google'
             when 2 then 'facebook'
             else 'email'
         end as referrer,
-        abs(hash(concat(cfo.customer_id, '_', vn.n))) % 3 as visit_selector
-    from customer_first_orders cfo
-    cross join visit_numbers vn
-),
-
-customer_info as (
-    select distinct
-        customer_id,
-        first_name,
-        last_name
-    from {{ ref('fct_orders') }}
+        first_order_date
+    from visits_hashed
 )
 
 select
@@ -60,12 +91,9 @@ select
     vg.visit_date,
     vg.page_type,
     vg.referrer,
-    ci.first_name,
-    ci.last_name
+    customers.first_name,
+    customers.last_name,
+    vg.first_order_date
+    {{ mart_partition_column('fct_visits') }}
 from visits_generated vg
-left join customer_info ci on vg.customer_id = ci.customer_id
-left join customer_first_orders cfo_check on vg.customer_id = cfo_check.customer_id
-where vg.visit_date is not null
-  and vg.visit_selector < 3
-  and vg.visit_date < cfo_check.first_order_date
-order by vg.customer_id, vg.visit_date
+left join {{ ref('stg_customers') }} customers on vg.customer_id = customers.customer_id
@@ -1,7 +1,51 @@
-{{ dbt_utils.date_spine(
-    datepart="day",
-    start_date="cast('2020-01-01' as date)",
-    end_date="cast('2025-12-31' as date)"
-   )
+{{
+  config(
+    materialized='incremental',
+    unique_key='date_day',
+    incremental_strategy='merge'
+  )
 }}
 
+-- Daily time spine that extends itself from the data: it covers the earliest
+-- order/visit date through the latest one plus `time_spine_future_days`
+-- (and never ends before today + that horizon). Incremental runs only add
+-- the days outside the range already built, so the spine never silently
+-- stops covering new data.
+
+with data_bounds as (
+    select
+        least(
+            (select min(cast(order_date as date)) from {{ ref('fct_orders') }}),
+            (select min(cast(visit_date as date)) from {{ ref('fct_visits') }}),
+            current_date()
+        ) as min_date,
+        date_add(
+            greatest(
+                (select max(cast(order_date as date)) from {{ ref('fct_orders') }}),
+                (select max(cast(visit_date as date)) from {{ ref('fct_visits') }}),
+                current_date()
+            ),
+            {{ var('time_spine_future_days') }}
+        ) as max_date
+),
+
+{% if is_incremental() %}
+built as (
+    select min(date_day) as min_day, max(date_day) as max_day
+    from {{ this }}
+),
+{% endif %}
+
+spine as (
+    select explode(sequence(min_date, max_date, interval 1 day)) as date_day
+    from data_bounds
+)
+
+select cast(spine.date_day as date) as date_day
+from spine
+{% if is_incremental() %}
+cross join built
+where built.max_day is null
+   or spine.date_day < built.min_day
+   or spine.date_day > built.max_day
+{% endif %}
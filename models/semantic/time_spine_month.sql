@@ -0,0 +1,7 @@
+{{ config(materialized='table') }}
+
+-- Month time spine derived from the daily spine; MetricFlow joins against
+-- this smaller table for month-grain queries
+
+select distinct cast(date_trunc('month', date_day) as date) as date_month
+from {{ ref('time_spine') }}
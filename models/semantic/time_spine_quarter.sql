@@ -0,0 +1,7 @@
+{{ config(materialized='table') }}
+
+-- Quarter time spine derived from the daily spine; MetricFlow joins against
+-- this smaller table for quarter-grain queries
+
+select distinct cast(date_trunc('quarter', date_day) as date) as date_quarter
+from {{ ref('time_spine') }}
@@ -0,0 +1,7 @@
+{{ config(materialized='table') }}
+
+-- Week time spine derived from the daily spine; MetricFlow joins against
+-- this smaller table for week-grain queries
+
+select distinct cast(date_trunc('week', date_day) as date) as date_week
+from {{ ref('time_spine') }}
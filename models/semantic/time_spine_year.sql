@@ -0,0 +1,7 @@
+{{ config(materialized='table') }}
+
+-- Year time spine derived from the daily spine; MetricFlow joins against
+-- this smaller table for year-grain queries
+
+select distinct cast(date_trunc('year', date_day) as date) as date_year
+from {{ ref('time_spine') }}
@@ -0,0 +1,229 @@
+"""
+Admission Control for Metric Queries
+
+Keeps expensive or bulk queries from starving interactive dashboards on the
+shared MCP session / warehouse:
+
+- two priority queues: `interactive` and `batch` (tier chosen by query_cost.py,
+  or downgraded by the caller with `X-Query-Priority: batch`)
+- per-queue concurrency caps plus a total cap across queues; batch work only
+  takes a free slot when no interactive query is waiting
+- within a queue, waiting requests are ordered by weighted fair queuing across
+  tenants (see tenancy.py): each request gets a virtual start tag
+  max(queue virtual time, tenant's last finish tag) and the smallest tag runs
+  next, so a tenant with many queued requests can't crowd out the others and
+  a tenant with weight 2 gets roughly twice the share of one with weight 1
+- bounded queues: a full queue answers 429, a request that waits longer than
+  its queue's max wait answers 503; both carry Retry-After
+- queue depth, running requests, waits and rejections exported to server_stats
+
+Limits are read from the environment (ADMISSION_TOTAL_SLOTS,
+INTERACTIVE_CONCURRENCY, BATCH_CONCURRENCY, INTERACTIVE_QUEUE, BATCH_QUEUE,
+INTERACTIVE_MAX_WAIT, BATCH_MAX_WAIT, MCP_CONCURRENCY, MCP_QUEUE, MCP_MAX_WAIT).
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from query_cost import TIER_BATCH, TIER_INTERACTIVE
+from server_stats import stats
+
+DEFAULT_TENANT = "default"
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+@dataclass
+class QueueConfig:
+    name: str
+    priority: int               # lower runs first
+    max_concurrency: int
+    max_queue: int              # waiting requests before 429
+    max_wait_seconds: float     # waiting time before 503
+
+
+DEFAULT_QUEUES = [
+    QueueConfig(
+        TIER_INTERACTIVE,
+        priority=0,
+        max_concurrency=_env_int("INTERACTIVE_CONCURRENCY", 3),
+        max_queue=_env_int("INTERACTIVE_QUEUE", 20),
+        max_wait_seconds=_env_int("INTERACTIVE_MAX_WAIT", 10),
+    ),
+    QueueConfig(
+        TIER_BATCH,
+        priority=1,
+        max_concurrency=_env_int("BATCH_CONCURRENCY", 1),
+        max_queue=_env_int("BATCH_QUEUE", 50),
+        max_wait_seconds=_env_int("BATCH_MAX_WAIT", 120),
+    ),
+]
+
+# Metadata / compile calls on the MCP session (list metrics, compiled SQL)
+MCP_QUEUES = [
+    QueueConfig(
+        "mcp",
+        priority=0,
+        max_concurrency=_env_int("MCP_CONCURRENCY", 4),
+        max_queue=_env_int("MCP_QUEUE", 50),
+        max_wait_seconds=_env_int("MCP_MAX_WAIT", 30),
+    ),
+]
+
+
+@dataclass
+class _QueueState:
+    config: QueueConfig
+    running: int = 0
+    waiters: List[Tuple[float, int, asyncio.Future]] = field(default_factory=list)   # (start tag, seq, future)
+    virtual_time: float = 0.0
+    finish_tags: Dict[str, float] = field(default_factory=dict)                       # tenant -> last finish tag
+    avg_seconds: float = 1.0                                                          # EWMA of run time
+
+
+class AdmissionController:
+    """Priority queues with concurrency caps and per-tenant fair ordering."""
+
+    def __init__(self, queues: Optional[List[QueueConfig]] = None, total_slots: Optional[int] = None, name: str = "admission"):
+        configs = queues or DEFAULT_QUEUES
+        self.name = name
+        self.queues: Dict[str, _QueueState] = {q.name: _QueueState(q) for q in configs}
+        self.total_slots = total_slots or _env_int("ADMISSION_TOTAL_SLOTS", sum(q.max_concurrency for q in configs))
+        self._seq = itertools.count()
+
+    # -- scheduling ------------------------------------------------------
+
+    def _running_total(self) -> int:
+        return sum(q.running for q in self.queues.values())
+
+    def _has_capacity(self, queue: _QueueState) -> bool:
+        return queue.running < queue.config.max_concurrency and self._running_total() < self.total_slots
+
+    def _blocked_by_higher_priority(self, queue: _QueueState) -> bool:
+        return any(
+            other.waiters
+            for other in self.queues.values()
+            if other.config.priority < queue.config.priority
+        )
+
+    def _tag(self, queue: _QueueState, tenant: str, weight: float, size: float) -> float:
+        """Start-time fair queuing: start tag now, finish tag advances by size / weight."""
+        start = max(queue.virtual_time, queue.finish_tags.get(tenant, 0.0))
+        queue.finish_tags[tenant] = start + size / max(weight, 1e-6)
+        return start
+
+    def _dispatch(self):
+        """Hand free slots to waiters: highest priority queue first, smallest tag first."""
+        for queue in sorted(self.queues.values(), key=lambda q: q.config.priority):
+            while queue.waiters and self._has_capacity(queue):
+                tag, _, future = heapq.heappop(queue.waiters)
+                if future.done():       # timed out or cancelled while waiting
+                    continue
+                queue.virtual_time = max(queue.virtual_time, tag)
+                queue.running += 1
+                future.set_result(None)
+            if queue.waiters:
+                break                   # lower priority queues wait for this one
+        for queue in self.queues.values():
+            self._publish(queue)
+
+    # -- stats / errors --------------------------------------------------
+
+    def retry_after(self, queue: _QueueState) -> int:
+        """Seconds until the queue has likely drained enough to accept this request."""
+        ahead = len(queue.waiters) + queue.running
+        return max(1, math.ceil(queue.avg_seconds * ahead / queue.config.max_concurrency))
+
+    def _publish(self, queue: _QueueState):
+        stats.set_gauge(f"{self.name}_queue_depth", len(queue.waiters), queue=queue.config.name)
+        stats.set_gauge(f"{self.name}_running", queue.running, queue=queue.config.name)
+
+    def _reject(self, queue: _QueueState, tenant: str, status_code: int, reason: str):
+        stats.increment(f"{self.name}_rejections", queue=queue.config.name, status=status_code)
+        stats.increment("tenant_rejections", tenant=tenant, status=status_code)
+        raise HTTPException(
+            status_code=status_code,
+            detail=f"{reason} ({queue.config.name} queue); retry later",
+            headers={"Retry-After": str(self.retry_after(queue))},
+        )
+
+    # -- public API ------------------------------------------------------
+
+    @asynccontextmanager
+    async def admit(self, tier: str, tenant: str = DEFAULT_TENANT, weight: float = 1.0, size: float = 1.0):
+        """
+        Wait for a slot in the tier's queue; raises 429/503 when saturated.
+
+        `size` is the request's share of work for fair queuing (e.g. estimated
+        cost), `weight` the tenant's share of capacity.
+        """
+        queue = self.queues.get(tier) or max(self.queues.values(), key=lambda q: q.config.priority)
+        enqueued = time.perf_counter()
+
+        if self._has_capacity(queue) and not queue.waiters and not self._blocked_by_higher_priority(queue):
+            queue.virtual_time = max(queue.virtual_time, self._tag(queue, tenant, weight, size))
+            queue.running += 1
+            self._publish(queue)
+        else:
+            if len(queue.waiters) >= queue.config.max_queue:
+                self._reject(queue, tenant, 429, "Too many queued requests")
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(queue.waiters, (self._tag(queue, tenant, weight, size), next(self._seq), future))
+            self._publish(queue)
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout=queue.config.max_wait_seconds)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    if isinstance(e, asyncio.CancelledError):
+                        self._release(queue, 0.0)   # slot was granted as we were cancelled
+                        raise
+                else:
+                    future.cancel()
+                    queue.waiters = [w for w in queue.waiters if w[2] is not future]
+                    heapq.heapify(queue.waiters)
+                    self._dispatch()
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    self._reject(queue, tenant, 503, "Server saturated")
+
+        started = time.perf_counter()
+        wait_ms = (started - enqueued) * 1000
+        stats.observe(f"{self.name}_wait_ms", wait_ms, queue=queue.config.name)
+        stats.observe("tenant_wait_ms", wait_ms, tenant=tenant)
+        stats.increment(f"{self.name}_admitted", queue=queue.config.name)
+        try:
+            yield
+        finally:
+            self._release(queue, time.perf_counter() - started)
+
+    def _release(self, queue: _QueueState, elapsed: float):
+        queue.running -= 1
+        if elapsed:
+            queue.avg_seconds = 0.8 * queue.avg_seconds + 0.2 * elapsed
+        self._dispatch()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "total_slots": self.total_slots,
+            "queues": {
+                name: {
+                    "running": queue.running,
+                    "waiting": len(queue.waiters),
+                    "max_concurrency": queue.config.max_concurrency,
+                    "max_queue": queue.config.max_queue,
+                    "avg_seconds": round(queue.avg_seconds, 3),
+                }
+                for name, queue in self.queues.items()
+            },
+        }
@@ -0,0 +1,258 @@
+"""
+Aggregate-Aware Query Routing
+
+`business_revenue_metrics` (models/aggregates) already holds revenue sums per
+day/week/month/quarter/year, store, customer region and order status. Queries
+it can answer don't need MetricFlow SQL over the base tables:
+
+1. check the request against the tables registered in aggregates.yml: every
+   metric, group-by dimension and filter dimension must be mapped
+2. if one matches, generate the roll-up SQL against it directly (filter values
+   as bind parameters), executed on the warehouse (warehouse.py)
+3. otherwise fall back to MetricFlow
+
+Metrics under `metrics` re-aggregate exactly (sums and ratios of sums).
+Distinct counts don't: a count per bucket can't be summed across buckets. The
+aggregates store HyperLogLog sketches for them instead (`rollup_sketches` in
+dbt_project.yml), and `approximate_metrics` merges those sketches across the
+matching rows (hll_union_agg + hll_sketch_estimate). They're only used when
+the query asks for approximate results; the decision then carries the error
+bound, derived from the sketch precision:
+
+    relative standard error = 1.04 / sqrt(2^lg_k)      (1.6% at lg_k = 12)
+
+Without approximate mode those queries fall back to MetricFlow for exact
+counts. When `rollup_sketches` is off the sketch columns aren't built, so
+`approximate_metrics` are ignored and those queries use MetricFlow too.
+Every decision is logged and counted in server_stats
+(`aggregate_routing`).
+"""
+
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from metric_filters import RANGE_OPERATORS, Condition, Eq, In, IsNull, MetricFilter, Not, Range, TimeRange
+from server_stats import stats
+
+AGGREGATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aggregates.yml")
+DEFAULT_SKETCH_LG_K = 12
+DEFAULT_ROLLUP_SKETCHES = True      # rollup_sketches default in dbt_project.yml
+
+
+def sketches_enabled(project_dir: Optional[str]) -> bool:
+    """
+    The rollup_sketches var in dbt_project.yml; DEFAULT_ROLLUP_SKETCHES when
+    the var is missing or the project can't be read.
+    """
+    if not project_dir:
+        return DEFAULT_ROLLUP_SKETCHES
+    try:
+        with open(os.path.join(project_dir, "dbt_project.yml"), "r", encoding="utf-8") as f:
+            project_vars = (yaml.safe_load(f) or {}).get("vars") or {}
+    except OSError:
+        return DEFAULT_ROLLUP_SKETCHES
+    return bool(project_vars.get("rollup_sketches", DEFAULT_ROLLUP_SKETCHES))
+
+
+def sketch_error_bound(lg_k: int) -> Dict[str, Any]:
+    """Error of an HLL distinct count estimate at precision lg_k."""
+    rse = 1.04 / math.sqrt(2 ** lg_k)
+    return {
+        "method": "hll",
+        "lg_k": lg_k,
+        "relative_standard_error": round(rse, 4),
+        "relative_error_95": round(2 * rse, 4),
+    }
+
+
+@dataclass
+class AggregateTable:
+    name: str
+    table: str
+    dimensions: Dict[str, str]
+    metrics: Dict[str, str]
+    approximate_metrics: Dict[str, str] = field(default_factory=dict)
+    sketch_lg_k: int = DEFAULT_SKETCH_LG_K
+
+    def expression(self, metric: str, approximate: bool = False) -> Optional[str]:
+        """SQL for a metric; sketch estimates only in approximate mode, exact preferred."""
+        if metric in self.metrics:
+            return self.metrics[metric]
+        if approximate:
+            return self.approximate_metrics.get(metric)
+        return None
+
+
+@dataclass
+class RouteDecision:
+    routed: bool
+    reason: str
+    aggregate: Optional[str] = None
+    sql: Optional[str] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+    approximation: Optional[Dict[str, Any]] = None      # error bound when sketches are used
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "routed": self.routed,
+            "aggregate": self.aggregate,
+            "reason": self.reason,
+            "sql": self.sql,
+            "approximation": self.approximation,
+        }
+
+
+class _Unroutable(Exception):
+    pass
+
+
+def _render_condition(condition: Condition, columns: Dict[str, str], params: Dict[str, Any]) -> str:
+    """Render a filter condition over aggregate columns, binding every value."""
+    def bind(value: Any) -> str:
+        name = f"p{len(params)}"
+        params[name] = value
+        return f":{name}"
+
+    column = columns[condition.dimension]
+    if isinstance(condition, Not):
+        return f"NOT ({_render_condition(condition.operand, columns, params)})"
+    if isinstance(condition, Eq):
+        return f"{column} = {bind(condition.value)}"
+    if isinstance(condition, In):
+        return f"{column} IN ({', '.join(bind(v) for v in condition.values)})"
+    if isinstance(condition, Range):
+        return " AND ".join(f"{column} {RANGE_OPERATORS[key]} {bind(value)}" for key, value in condition.bounds())
+    if isinstance(condition, TimeRange):
+        parts = []
+        if condition.start is not None:
+            parts.append(f"{column} >= {bind(condition.start)}")
+        if condition.end is not None:
+            parts.append(f"{column} < {bind(condition.end)}")
+        return " AND ".join(parts)
+    if isinstance(condition, IsNull):
+        return f"{column} IS NULL"
+    raise _Unroutable(f"unsupported filter condition '{condition.op}'")
+
+
+class AggregateRouter:
+    """Matches metric queries against the registered aggregate tables."""
+
+    def __init__(self, path: str = AGGREGATES_FILE, project_dir: Optional[str] = None):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = yaml.safe_load(f) or {}
+        except OSError:
+            raw = {}
+        sketches = sketches_enabled(project_dir)
+        if not sketches:
+            print("  rollup_sketches is off: approximate_metrics in aggregates.yml are ignored")
+        self.aggregates: List[AggregateTable] = [
+            AggregateTable(
+                name=entry["name"],
+                table=entry["table"],
+                dimensions=entry.get("dimensions", {}),
+                metrics=entry.get("metrics", {}),
+                approximate_metrics=entry.get("approximate_metrics", {}) if sketches else {},
+                sketch_lg_k=int(entry.get("sketch_lg_k", DEFAULT_SKETCH_LG_K)),
+            )
+            for entry in raw.get("aggregates", [])
+        ]
+
+    def _match(
+        self,
+        aggregate: AggregateTable,
+        metrics: List[str],
+        dimensions: List[str],
+        metric_filter: MetricFilter,
+        approximate: bool,
+    ) -> Optional[str]:
+        """None if the aggregate can answer the query, else why not."""
+        missing = [m for m in metrics if aggregate.expression(m, approximate) is None]
+        if missing:
+            reason = f"metrics not in {aggregate.name}: {', '.join(missing)}"
+            if not approximate and all(m in aggregate.approximate_metrics for m in missing):
+                reason += " (approximate only)"
+            return reason
+        missing = [d for d in dimensions + metric_filter.dimensions() if d not in aggregate.dimensions]
+        if missing:
+            return f"dimensions not in {aggregate.name}: {', '.join(sorted(set(missing)))}"
+        return None
+
+    def _sql(
+        self,
+        aggregate: AggregateTable,
+        metrics: List[str],
+        dimensions: List[str],
+        metric_filter: MetricFilter,
+        approximate: bool,
+    ) -> Tuple[str, Dict[str, Any]]:
+        select = [f"{aggregate.dimensions[d]} AS {d}" for d in dimensions]
+        select += [f"{aggregate.expression(m, approximate)} AS {m}" for m in metrics]
+        params: Dict[str, Any] = {}
+        where = [
+            f"({_render_condition(c, aggregate.dimensions, params)})"
+            for c in metric_filter.normalized().conditions
+        ]
+
+        sql = "SELECT\n    " + ",\n    ".join(select) + f"\nFROM {aggregate.table}"
+        if where:
+            sql += "\nWHERE " + "\n  AND ".join(where)
+        if dimensions:
+            sql += "\nGROUP BY " + ", ".join(aggregate.dimensions[d] for d in dimensions)
+        return sql, params
+
+    def route(
+        self,
+        metrics: List[str],
+        dimensions: Optional[List[str]] = None,
+        metric_filter: Optional[MetricFilter] = None,
+        approximate: bool = False,
+    ) -> RouteDecision:
+        """
+        Pick an aggregate for the query, or explain why it falls back to MetricFlow.
+
+        With approximate=True, distinct-count metrics may be estimated from
+        sketches; exact tables are still preferred when one covers the query.
+        """
+        dimensions = list(dict.fromkeys(dimensions or []))
+        metric_filter = metric_filter or MetricFilter()
+
+        reasons: List[str] = []
+        for use_sketches in ([False, True] if approximate else [False]):
+            reasons = []
+            for aggregate in self.aggregates:
+                reason = self._match(aggregate, metrics, dimensions, metric_filter, use_sketches)
+                if reason is None:
+                    try:
+                        sql, params = self._sql(aggregate, metrics, dimensions, metric_filter, use_sketches)
+                    except _Unroutable as e:
+                        reasons.append(f"{aggregate.name}: {e}")
+                        continue
+                    estimated = [m for m in metrics if m not in aggregate.metrics]
+                    if not estimated:
+                        return RouteDecision(True, "all metrics and dimensions covered", aggregate.name, sql, params)
+                    return RouteDecision(
+                        True,
+                        f"covered; {', '.join(estimated)} estimated from sketches",
+                        aggregate.name,
+                        sql,
+                        params,
+                        {**sketch_error_bound(aggregate.sketch_lg_k), "metrics": estimated},
+                    )
+                reasons.append(reason)
+
+        return RouteDecision(False, "; ".join(reasons) or "no aggregates registered")
+
+    def record(self, decision: RouteDecision, metrics: List[str], dimensions: Optional[List[str]] = None):
+        """Log and count a routing decision."""
+        if decision.routed:
+            mode = "approximate" if decision.approximation else "exact"
+            stats.increment("aggregate_routing", decision="aggregate", aggregate=decision.aggregate, mode=mode)
+            print(f"✓ Aggregate router: {metrics} by {dimensions or []} -> {decision.aggregate} ({mode})")
+        else:
+            stats.increment("aggregate_routing", decision="metricflow")
+            print(f"  Aggregate router: {metrics} by {dimensions or []} -> MetricFlow ({decision.reason})")
@@ -0,0 +1,446 @@
+"""
+Vectorized Metric Alerting
+
+Evaluates many alert rules across every dimension slice (per store type, per
+region, ...) from one grouped query per rule set (see alerts.yml):
+
+1. Query the rule set's metrics by time dimension + slice dimensions
+2. Pivot the columnar result (MetricFrame) into (slices x periods) NumPy
+   matrices, one per metric. The period axis is the full grid of periods
+   (not just those with rows), and a slice without a row for a period counts
+   as 0 for sum / count metrics, so a slice dropping to zero orders still
+   fires its threshold and pct_change rules
+3. Evaluate each rule over whole matrices at once:
+   - threshold:  value below/above a constant
+   - pct_change: change vs the previous period
+   - zscore:     deviation from the trailing window (mean/std via cumulative sums)
+4. Only periods newer than the last evaluated one are checked; the last
+   evaluated period per rule set is kept in alert_state.json, and each run only
+   queries the history the rules need
+
+Usage:
+    python alerting.py               # evaluate all rule sets once
+    python alerting.py --loop 300    # evaluate every 5 minutes
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import yaml
+
+from headless_bi_mcp_client import HeadlessBIClient
+from metric_filters import GRAIN_DAYS, TIME_GRANULARITIES, MetricFilter, add_periods, period_start
+from metric_frame import MetricFrame
+from semantic_graph import load_semantic_graph
+from server_stats import stats
+
+ALERTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alerts.yml")
+
+RULE_TYPES = ("threshold", "pct_change", "zscore")
+
+
+# -----------------------------
+# Rule Definitions
+# -----------------------------
+
+@dataclass
+class AlertRule:
+    name: str
+    type: str
+    metric: str
+    below: Optional[float] = None
+    above: Optional[float] = None
+    window: int = 28            # zscore: trailing periods
+    threshold: float = 3.0      # zscore: |z| that fires
+    min_periods: int = 7        # zscore: minimum non-null periods in the window
+
+    def __post_init__(self):
+        if self.type not in RULE_TYPES:
+            raise ValueError(f"Rule '{self.name}': unknown type '{self.type}' (expected one of {RULE_TYPES})")
+        if self.type != "zscore" and self.below is None and self.above is None:
+            raise ValueError(f"Rule '{self.name}': set 'below' and/or 'above'")
+
+    @property
+    def history_periods(self) -> int:
+        """Periods before the evaluated one that this rule needs."""
+        if self.type == "zscore":
+            return self.window
+        if self.type == "pct_change":
+            return 1
+        return 0
+
+
+@dataclass
+class RuleSet:
+    name: str
+    metrics: List[str]
+    rules: List[AlertRule]
+    time_dimension: str = "order__order_date__day"
+    slice_by: List[str] = field(default_factory=list)
+    filters: Dict[str, Any] = field(default_factory=dict)
+    initial_periods: int = 7     # periods evaluated on the first run
+    complete_only: bool = True   # skip the current, still-filling period
+
+    def __post_init__(self):
+        missing = sorted({rule.metric for rule in self.rules} - set(self.metrics))
+        if missing:
+            raise ValueError(f"Rule set '{self.name}': rules use metrics not queried: {', '.join(missing)}")
+
+    @property
+    def grain(self) -> str:
+        grain = self.time_dimension.rsplit("__", 1)[-1]
+        return grain if grain in TIME_GRANULARITIES else "day"
+
+    @property
+    def history_periods(self) -> int:
+        return max((rule.history_periods for rule in self.rules), default=0)
+
+    def evaluate_after(self, last_evaluated: Optional[str], today: date) -> str:
+        """Periods after this one are new; on the first run, the last `initial_periods`."""
+        if last_evaluated:
+            return last_evaluated
+        first = today - timedelta(days=(self.initial_periods + 1) * GRAIN_DAYS[self.grain])
+        return period_start(first, self.grain)
+
+    def query(self, since: str) -> Dict[str, Any]:
+        """One grouped query covering the periods after `since` plus the history the rules need."""
+        start = date.fromisoformat(since)
+        start -= timedelta(days=self.history_periods * GRAIN_DAYS[self.grain])
+
+        metric_filter = MetricFilter.from_spec(
+            {**self.filters, self.time_dimension: {"start": start.isoformat()}}
+        )
+        return {
+            "metrics": self.metrics,
+            "dimensions": [self.time_dimension] + self.slice_by,
+            "where": metric_filter.to_where(),
+        }
+
+
+def load_rule_sets(path: str = ALERTS_FILE) -> List[RuleSet]:
+    with open(path, "r", encoding="utf-8") as f:
+        raw = yaml.safe_load(f) or {}
+
+    rule_sets = []
+    for entry in raw.get("rule_sets", []):
+        rules = [AlertRule(**rule) for rule in entry.pop("rules", [])]
+        rule_sets.append(RuleSet(rules=rules, **entry))
+    return rule_sets
+
+
+# -----------------------------
+# Columnar Evaluation
+# -----------------------------
+
+@dataclass
+class Alert:
+    rule_set: str
+    rule: str
+    metric: str
+    slice: Dict[str, Any]
+    period: str
+    value: float
+    baseline: Optional[float] = None
+    score: Optional[float] = None
+    message: str = ""
+
+
+@dataclass
+class SliceMatrix:
+    """A grouped result pivoted to one (slices x periods) matrix per metric."""
+    periods: np.ndarray                 # ISO dates, every period from first to last
+    slices: List[Tuple[Any, ...]]       # slice_by values per row
+    values: Dict[str, np.ndarray]       # metric -> float matrix, NaN (or 0) where missing
+
+
+def _period_strings(column: np.ndarray) -> np.ndarray:
+    if column.dtype.kind == "M":
+        return np.datetime_as_string(column, unit="D")
+    return np.array([str(v)[:10] for v in column.tolist()], dtype=str)
+
+
+def _float_column(column: np.ndarray) -> np.ndarray:
+    if column.dtype.kind in "biuf":
+        return column.astype(np.float64, copy=False)
+    return np.array([np.nan if v is None else v for v in column.tolist()], dtype=np.float64)
+
+
+def period_grid(first: str, last: str, grain: str) -> np.ndarray:
+    """Every period start from `first` through `last` (ISO dates)."""
+    day, stop = date.fromisoformat(period_start(date.fromisoformat(first), grain)), date.fromisoformat(last)
+    periods = []
+    while day <= stop:
+        periods.append(day.isoformat())
+        day = add_periods(day, grain, 1)
+    return np.array(periods, dtype=str)
+
+
+def pivot(
+    frame: MetricFrame,
+    rule_set: RuleSet,
+    last: Optional[str] = None,
+    zero_fill: Optional[Set[str]] = None,
+) -> SliceMatrix:
+    """
+    Pivot a grouped result over the full period grid, from the first period
+    with rows through `last` (or the last period with rows). Metrics in
+    `zero_fill` are 0 where a slice has no row; others stay NaN.
+    """
+    periods_col = _period_strings(frame.column(rule_set.time_dimension, fill=None))
+    valid = (periods_col != "NaT") & (periods_col != "None")
+
+    slice_keys = np.full(len(frame), "", dtype=object)
+    for i, dim in enumerate(rule_set.slice_by):
+        part = frame.column(dim, fill=None).astype(str).astype(object)
+        slice_keys = part if i == 0 else slice_keys + "\x1f" + part
+
+    observed = periods_col[valid]
+    seen = np.unique(observed)
+    if len(seen):
+        grid_last = max(last, str(seen[-1])) if last else str(seen[-1])
+        periods = period_grid(str(seen[0]), grid_last, rule_set.grain)
+    else:
+        periods = seen
+    period_idx = np.searchsorted(periods, observed)
+    unique_slices, slice_idx = np.unique(slice_keys[valid].astype(str), return_inverse=True)
+
+    values = {}
+    for metric in rule_set.metrics:
+        fill = 0.0 if metric in (zero_fill or ()) else np.nan
+        matrix = np.full((len(unique_slices), len(periods)), fill)
+        matrix[slice_idx, period_idx] = _float_column(frame.column(metric))[valid]
+        values[metric] = matrix
+
+    slices = [tuple(key.split("\x1f")) if rule_set.slice_by else () for key in unique_slices]
+    return SliceMatrix(periods=periods, slices=slices, values=values)
+
+
+def _bounds_mask(values: np.ndarray, rule: AlertRule) -> np.ndarray:
+    mask = np.zeros(values.shape, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        if rule.below is not None:
+            mask |= values < rule.below
+        if rule.above is not None:
+            mask |= values > rule.above
+    return mask
+
+
+def _trailing_stats(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Mean, sample std and count of the `window` periods before each column (NaN-aware)."""
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    pad = np.zeros((values.shape[0], 1))
+    count = np.concatenate([pad, np.cumsum(present, axis=1)], axis=1)
+    total = np.concatenate([pad, np.cumsum(filled, axis=1)], axis=1)
+    squares = np.concatenate([pad, np.cumsum(filled * filled, axis=1)], axis=1)
+
+    end = np.arange(values.shape[1])              # window is [end - window, end)
+    start = np.maximum(end - window, 0)
+    n = count[:, end] - count[:, start]
+    s = total[:, end] - total[:, start]
+    sq = squares[:, end] - squares[:, start]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s / n
+        var = (sq - n * mean * mean) / (n - 1)
+        std = np.sqrt(np.maximum(var, 0.0))
+    return mean, std, n
+
+
+def evaluate_rule(rule: AlertRule, matrix: np.ndarray, new: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Evaluate one rule over a (slices x periods) matrix.
+
+    Returns (fired mask, baseline, score), each shaped like the matrix;
+    only columns flagged in `new` can fire.
+    """
+    baseline = np.full(matrix.shape, np.nan)
+    score = np.full(matrix.shape, np.nan)
+
+    if rule.type == "threshold":
+        fired = _bounds_mask(matrix, rule)
+    elif rule.type == "pct_change":
+        baseline[:, 1:] = matrix[:, :-1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            score = np.where(baseline != 0, (matrix - baseline) / np.abs(baseline), np.nan)
+        fired = _bounds_mask(score, rule)
+    else:
+        mean, std, n = _trailing_stats(matrix, rule.window)
+        baseline = mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            score = np.where((n >= rule.min_periods) & (std > 0), (matrix - mean) / std, np.nan)
+            fired = np.abs(score) >= rule.threshold
+
+    return fired & new[np.newaxis, :], baseline, score
+
+
+def evaluate_rule_set(
+    rule_set: RuleSet,
+    result: Any,
+    since: Optional[str],
+    until: Optional[str] = None,
+    zero_fill: Optional[Set[str]] = None,
+) -> Tuple[List[Alert], Optional[str]]:
+    """
+    Evaluate every rule of a rule set against a grouped result (a MetricFrame
+    or anything MetricFrame.from_result accepts).
+
+    Only periods after `since` (and before `until`, if given) are evaluated;
+    the period grid extends up to `until`, so periods where no slice has a row
+    are evaluated too. Metrics in `zero_fill` count missing rows as 0.
+    Returns the alerts and the latest evaluated period.
+    """
+    last = add_periods(date.fromisoformat(until), rule_set.grain, -1).isoformat() if until else None
+    frame = pivot(MetricFrame.from_result(result), rule_set, last, zero_fill)
+    new = np.ones(len(frame.periods), dtype=bool)
+    if since:
+        new &= frame.periods > since
+    if until:
+        new &= frame.periods < until
+    if not new.any():
+        return [], since
+
+    alerts = []
+    for rule in rule_set.rules:
+        matrix = frame.values[rule.metric]
+        fired, baseline, score = evaluate_rule(rule, matrix, new)
+        for slice_i, period_i in zip(*np.nonzero(fired)):
+            alerts.append(_make_alert(rule_set, rule, frame, slice_i, period_i, matrix, baseline, score))
+
+    return alerts, str(frame.periods[new][-1])
+
+
+def _make_alert(rule_set, rule, frame, slice_i, period_i, matrix, baseline, score) -> Alert:
+    value = float(matrix[slice_i, period_i])
+    base = baseline[slice_i, period_i]
+    sc = score[slice_i, period_i]
+    slice_values = dict(zip(rule_set.slice_by, frame.slices[slice_i]))
+    where = ", ".join(f"{k}={v}" for k, v in slice_values.items()) or "all"
+
+    if rule.type == "threshold":
+        message = f"{rule.metric} = {value:,.2f} outside bounds (below={rule.below}, above={rule.above})"
+    elif rule.type == "pct_change":
+        message = f"{rule.metric} changed {sc:+.1%} vs previous period ({base:,.2f} → {value:,.2f})"
+    else:
+        message = f"{rule.metric} = {value:,.2f} is {sc:+.1f}σ from trailing mean {base:,.2f}"
+
+    return Alert(
+        rule_set=rule_set.name,
+        rule=rule.name,
+        metric=rule.metric,
+        slice=slice_values,
+        period=str(frame.periods[period_i]),
+        value=value,
+        baseline=None if np.isnan(base) else float(base),
+        score=None if np.isnan(sc) else float(sc),
+        message=f"[{frame.periods[period_i]} {where}] {message}",
+    )
+
+
+# -----------------------------
+# Alert Engine
+# -----------------------------
+
+class AlertEngine:
+    """Runs all rule sets (one query each) and remembers what was already evaluated."""
+
+    def __init__(
+        self,
+        client: HeadlessBIClient,
+        rule_sets: List[RuleSet],
+        state_path: Optional[str] = "alert_state.json",
+        notify: Optional[Callable[[Alert], None]] = None,
+    ):
+        self.client = client
+        self.rule_sets = rule_sets
+        self.state_path = state_path
+        self.notify = notify or (lambda alert: print(f"⚠️  ALERT {alert.rule}: {alert.message}"))
+        self.state: Dict[str, str] = self._load_state()   # rule set -> last evaluated period
+
+    def _load_state(self) -> Dict[str, str]:
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self):
+        if self.state_path:
+            with open(self.state_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2)
+
+    def _zero_fill_metrics(self) -> Set[str]:
+        """Rule set metrics that are 0 for a period without rows (needs the semantic manifest)."""
+        graph = load_semantic_graph(self.client.project_dir)
+        if graph is None:
+            return set()
+        metrics = {metric for rule_set in self.rule_sets for metric in rule_set.metrics}
+        return {metric for metric in metrics if graph.is_zero_when_empty(metric)}
+
+    async def run(self, today: Optional[date] = None) -> List[Alert]:
+        today = today or datetime.now().date()
+        start = time.perf_counter()
+
+        since = {
+            rule_set.name: rule_set.evaluate_after(self.state.get(rule_set.name), today)
+            for rule_set in self.rule_sets
+        }
+        queries = [rule_set.query(since[rule_set.name]) for rule_set in self.rule_sets]
+        results = await self.client.query_many(queries, return_exceptions=True, as_frames=True)
+        zero_fill = self._zero_fill_metrics()
+
+        alerts: List[Alert] = []
+        for rule_set, result in zip(self.rule_sets, results):
+            if isinstance(result, Exception):
+                print(f"✗ Rule set '{rule_set.name}' query failed: {result}")
+                stats.increment("alert_rule_set_errors", rule_set=rule_set.name)
+                continue
+
+            current = period_start(today, rule_set.grain)
+            if not rule_set.complete_only:
+                current = add_periods(date.fromisoformat(current), rule_set.grain, 1).isoformat()
+            fired, last_period = evaluate_rule_set(rule_set, result, since[rule_set.name], current, zero_fill)
+            if last_period != since[rule_set.name]:
+                self.state[rule_set.name] = last_period
+            alerts.extend(fired)
+
+        self._save_state()
+        for alert in alerts:
+            self.notify(alert)
+            stats.increment("alerts_fired", rule=alert.rule)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        stats.observe("alert_run_ms", elapsed)
+        rule_count = sum(len(rule_set.rules) for rule_set in self.rule_sets)
+        print(f"✓ Evaluated {rule_count} rules in {len(self.rule_sets)} queries ({elapsed:.0f} ms): {len(alerts)} alert(s)")
+        return alerts
+
+    async def run_forever(self, interval_seconds: int = 300):
+        while True:
+            await self.run()
+            await asyncio.sleep(interval_seconds)
+
+
+async def main(loop_seconds: Optional[int] = None):
+    engine = AlertEngine(HeadlessBIClient.shared(), load_rule_sets())
+    try:
+        if loop_seconds:
+            await engine.run_forever(loop_seconds)
+        else:
+            await engine.run()
+    finally:
+        await HeadlessBIClient.close_shared()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate metric alert rules")
+    parser.add_argument("--loop", type=int, metavar="SECONDS", help="Re-evaluate every SECONDS")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.loop))
@@ -0,0 +1,171 @@
+"""
+Exposure-Driven Cache Warming
+
+The dashboards and reports in models/exposures.yml list the metric queries
+they run under `meta.warm_queries`:
+
+    - name: revenue_dashboard
+      meta:
+        warm_priority: 1            # lower warms first (default 100)
+        warm_queries:
+          - metrics: [total_revenue, total_orders]
+            dimensions: [order__order_date__day]
+            filters:
+              order__order_date__day: {start: "{month_ago}"}
+            limit: 100
+
+headless_bi_api_server.py pre-compiles and pre-executes these through the
+query cache (query_cache.py):
+
+- at startup
+- after every successful `dbt run` / `dbt build` (target/run_results.json is
+  polled; a new run changes the cache's data version, so the old entries are
+  already stale)
+
+Queries start in priority order with at most WARM_CONCURRENCY running at once,
+and run on the batch admission queue so user traffic keeps priority. Filter
+values may use the report date placeholders ({today}, {week_ago}, ...).
+
+Disable with CACHE_WARMING=false.
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import yaml
+
+from query_cache import load_run_results
+from report_scheduler import date_context, resolve_placeholders
+
+CACHE_WARMING = os.environ.get("CACHE_WARMING", "true").lower() == "true"
+WARM_CONCURRENCY = int(os.environ.get("WARM_CONCURRENCY", 2))
+WARM_POLL_SECONDS = int(os.environ.get("WARM_POLL_SECONDS", 30))
+
+EXPOSURES_FILE = os.path.join("models", "exposures.yml")
+DEFAULT_PRIORITY = 100
+
+# A run counts as successful when no node ended in one of these states
+FAILED_STATUSES = {"error", "fail", "runtime error"}
+WARM_AFTER_COMMANDS = {"run", "build"}
+
+
+@dataclass
+class WarmQuery:
+    exposure: str
+    priority: int
+    metrics: List[str]
+    dimensions: List[str] = field(default_factory=list)
+    filters: Dict[str, Any] = field(default_factory=dict)
+    limit: Optional[int] = 100
+
+    def resolved_filters(self, today: date) -> Dict[str, Any]:
+        return resolve_placeholders(self.filters, date_context(today))
+
+
+def load_warm_queries(project_dir: str) -> List[WarmQuery]:
+    """Queries attached to exposures, highest priority (lowest number) first."""
+    path = os.path.join(project_dir, EXPOSURES_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = yaml.safe_load(f) or {}
+    except OSError:
+        return []
+
+    queries = []
+    for exposure in raw.get("exposures", []):
+        meta = {**(exposure.get("config") or {}).get("meta", {}), **(exposure.get("meta") or {})}
+        priority = int(meta.get("warm_priority", DEFAULT_PRIORITY))
+        for spec in meta.get("warm_queries", []):
+            queries.append(WarmQuery(
+                exposure=exposure["name"],
+                priority=priority,
+                metrics=spec["metrics"],
+                dimensions=spec.get("dimensions", []),
+                filters=spec.get("filters", {}),
+                limit=spec.get("limit", 100),
+            ))
+    return sorted(queries, key=lambda q: q.priority)
+
+
+def run_succeeded(run_results: Dict[str, Any]) -> bool:
+    """True for a `dbt run` / `dbt build` without failed nodes."""
+    command = (run_results.get("args") or {}).get("which")
+    if command not in WARM_AFTER_COMMANDS:
+        return False
+    return not any(r.get("status") in FAILED_STATUSES for r in run_results.get("results", []))
+
+
+class CacheWarmer:
+    """Runs the exposure queries through `warm` in priority order with a concurrency budget."""
+
+    def __init__(
+        self,
+        project_dir: str,
+        warm: Callable[[WarmQuery, Dict[str, Any]], Awaitable[Any]],
+        concurrency: int = WARM_CONCURRENCY,
+        poll_seconds: int = WARM_POLL_SECONDS,
+    ):
+        self.project_dir = project_dir
+        self.warm = warm
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.last_run: Dict[str, Any] = {}
+
+    async def warm_all(self, reason: str) -> Dict[str, Any]:
+        """Warm every exposure query once; returns a summary of the pass."""
+        queries = load_warm_queries(self.project_dir)
+        if not queries:
+            return {}
+
+        start = time.perf_counter()
+        today = date.today()
+        pending = list(queries)
+        failures: List[str] = []
+
+        async def worker():
+            while pending:
+                query = pending.pop(0)
+                try:
+                    await self.warm(query, query.resolved_filters(today))
+                except Exception as e:
+                    failures.append(query.exposure)
+                    print(f"⚠ Cache warming: {query.exposure} {query.metrics} failed: {e}")
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(queries)))))
+
+        self.last_run = {
+            "reason": reason,
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "queries": len(queries),
+            "failed": len(failures),
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+        print(
+            f"✓ Cache warming ({reason}): {len(queries) - len(failures)}/{len(queries)} queries "
+            f"in {self.last_run['seconds']}s"
+        )
+        return self.last_run
+
+    def _run_results_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(os.path.join(self.project_dir, "target", "run_results.json"))
+        except OSError:
+            return None
+
+    async def run_forever(self):
+        """Warm at startup, then again after every successful dbt run."""
+        seen = self._run_results_mtime()
+        await self.warm_all("startup")
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            mtime = self._run_results_mtime()
+            if mtime is None or mtime == seen:
+                continue
+            seen = mtime
+            run_results = load_run_results(self.project_dir)
+            if run_results and run_succeeded(run_results):
+                await self.warm_all(f"dbt {run_results['args']['which']}")
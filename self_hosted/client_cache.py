@@ -0,0 +1,167 @@
+"""
+Persistent Client-Side Cache (SQLite)
+
+Opt-in on-disk cache for short-lived scripts (alerts, reports) built on
+DbtMetricQueryClient / HeadlessBIClient. Catalog data, compiled SQL and query
+results are stored under a key made of:
+- the canonical query (see metric_filters.query_cache_key)
+- a hash of target/semantic_manifest.json, so entries from an older project
+  state are never served
+
+Entries expire after a TTL and the file is kept under a size limit by evicting
+the least recently used entries. A cache hit needs no MCP connection at all.
+
+Usage:
+    cache = ClientCache(".headless_bi_cache.sqlite", ttl_seconds=900)
+    client = HeadlessBIClient(cache=cache)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional, Tuple
+
+KIND_CATALOG = "catalog"
+KIND_SQL = "sql"
+KIND_RESULT = "result"
+
+_manifest_hashes: Dict[str, Tuple[float, str]] = {}
+
+
+def manifest_hash(project_dir: str) -> str:
+    """Content hash of target/semantic_manifest.json (memoized by mtime)."""
+    path = os.path.join(project_dir, "target", "semantic_manifest.json")
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return "no-manifest"
+
+    cached = _manifest_hashes.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _manifest_hashes[path] = (mtime, digest)
+    return digest
+
+
+def to_jsonable(value: Any) -> Any:
+    """Convert MCP result content (pydantic models) into plain JSON data."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    return value
+
+
+class ClientCache:
+    """SQLite-backed cache with per-kind TTLs and an LRU size limit."""
+
+    def __init__(
+        self,
+        path: str = ".headless_bi_cache.sqlite",
+        ttl_seconds: int = 900,
+        metadata_ttl_seconds: int = 24 * 3600,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.metadata_ttl_seconds = metadata_ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(path, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                manifest_hash TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_last_accessed ON cache_entries (last_accessed)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def entry_key(kind: str, query_key: str, manifest: str) -> str:
+        return hashlib.sha256(f"{kind}:{manifest}:{query_key}".encode("utf-8")).hexdigest()
+
+    def _ttl(self, kind: str) -> int:
+        return self.ttl_seconds if kind == KIND_RESULT else self.metadata_ttl_seconds
+
+    def get(self, kind: str, query_key: str, manifest: str) -> Optional[Any]:
+        key = self.entry_key(kind, query_key, manifest)
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < now:
+            self.misses += 1
+            return None
+
+        self._conn.execute("UPDATE cache_entries SET last_accessed = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, kind: str, query_key: str, manifest: str, value: Any, ttl_seconds: Optional[int] = None):
+        encoded = json.dumps(to_jsonable(value), default=str)
+        now = time.time()
+        expires_at = now + (ttl_seconds if ttl_seconds is not None else self._ttl(kind))
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO cache_entries
+                (key, kind, manifest_hash, value, size, created_at, expires_at, last_accessed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (self.entry_key(kind, query_key, manifest), kind, manifest, encoded,
+             len(encoded), now, expires_at, now),
+        )
+        self._evict(now)
+        self._conn.commit()
+
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        self._conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM cache_entries ORDER BY last_accessed ASC"
+        ).fetchall()
+        evict = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evict.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", evict)
+
+    def clear(self):
+        self._conn.execute("DELETE FROM cache_entries")
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        entries, size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self._conn.close()
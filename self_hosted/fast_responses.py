@@ -0,0 +1,181 @@
+"""
+Fast JSON Serialization & Response Compression
+
+Opt-in response path for query and catalog endpoints (set FAST_RESPONSES=true):
+- orjson encoding when installed, stdlib json otherwise
+- encoding of very large payloads is offloaded to a worker thread so it does
+  not block the event loop
+- gzip / zstd compression negotiated via Accept-Encoding, above a size threshold
+- encode/compress timings and byte counts recorded in server_stats
+
+When disabled, `fast_response` returns the payload unchanged and FastAPI's
+default encoder is used.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional
+
+from fastapi import Request
+from starlette.responses import Response
+
+from server_stats import stats
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+FAST_RESPONSES = os.environ.get("FAST_RESPONSES", "false").lower() == "true"
+
+COMPRESSION_MIN_BYTES = 1024            # don't compress tiny responses
+OFFLOAD_ENCODE_MIN_BYTES = 512 * 1024   # encode in a worker thread above this (estimated) size
+OFFLOAD_MIN_BYTES = 256 * 1024          # compress in a worker thread above this size
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+JSON_MEDIA_TYPE = "application/json"
+
+
+# -----------------------------
+# Encoding
+# -----------------------------
+
+def _default(obj: Any) -> Any:
+    """Fallback for types neither encoder handles natively (MCP content, Decimal, ...)."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_json(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+SIZE_SAMPLE = 64                        # list elements measured per list when estimating size
+
+
+def _estimated_bytes(payload: Any, depth: int = 0) -> int:
+    """
+    Rough encoded size of a payload. Counts string lengths, including MCP
+    TextContent holding a whole result as one JSON string, and extrapolates
+    long lists from a sample.
+    """
+    if isinstance(payload, str):
+        return len(payload) + 2
+    if isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    if hasattr(payload, "text") and isinstance(getattr(payload, "text"), str):
+        return len(payload.text) + 40
+    if depth > 6:
+        return 16
+    if isinstance(payload, dict):
+        return sum(len(str(k)) + 4 + _estimated_bytes(v, depth + 1) for k, v in payload.items()) + 2
+    if isinstance(payload, (list, tuple)):
+        if not payload:
+            return 2
+        sample = payload[:SIZE_SAMPLE]
+        measured = sum(_estimated_bytes(v, depth + 1) + 1 for v in sample)
+        return measured * len(payload) // len(sample) + 2
+    return 8
+
+
+# -----------------------------
+# Compression
+# -----------------------------
+
+def _accepted_encodings(header: Optional[str]) -> List[str]:
+    """Accept-Encoding values ordered by q-value, dropping q=0."""
+    weighted = []
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            weighted.append((q, token.strip().lower()))
+    return [token for _, token in sorted(weighted, key=lambda item: -item[0])]
+
+
+def choose_encoding(header: Optional[str]) -> Optional[str]:
+    for token in _accepted_encodings(header):
+        if token == "zstd" and zstandard is not None:
+            return "zstd"
+        if token in ("gzip", "*"):
+            return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+# -----------------------------
+# Response Helper
+# -----------------------------
+
+async def fast_response(payload: Any, request: Request, status_code: int = 200) -> Any:
+    """Encode (and optionally compress) a payload on the fast path, if enabled."""
+    if not FAST_RESPONSES:
+        return payload
+
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", request.url.path)
+    offload = _estimated_bytes(payload) >= OFFLOAD_ENCODE_MIN_BYTES
+
+    start = time.perf_counter()
+    if offload:
+        body = await asyncio.to_thread(encode_json, payload)
+    else:
+        body = encode_json(payload)
+    stats.observe("response_encode_ms", (time.perf_counter() - start) * 1000, offloaded=offload)
+    stats.increment("response_bytes_raw", len(body))
+
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if len(body) < COMPRESSION_MIN_BYTES:
+        encoding = None
+    if encoding:
+        start = time.perf_counter()
+        if len(body) >= OFFLOAD_MIN_BYTES:
+            body = await asyncio.to_thread(compress, body, encoding)
+        else:
+            body = compress(body, encoding)
+        stats.observe("response_compress_ms", (time.perf_counter() - start) * 1000, encoding=encoding)
+        headers["Content-Encoding"] = encoding
+    stats.increment("response_bytes_sent", len(body), encoding=encoding or "identity")
+    stats.increment("fast_responses", endpoint=endpoint)
+
+    return Response(
+        content=body,
+        status_code=status_code,
+        headers=headers,
+        media_type=JSON_MEDIA_TYPE,
+    )
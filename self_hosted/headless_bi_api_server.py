@@ -5,13 +5,14 @@ This creates a REST API server that exposes dbt metrics as API endpoints.
 Perfect for building custom dashboards, mobile apps, or integrating with other systems.
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from contextlib import asynccontextmanager
 import asyncio
 import os
+import time
 import uvicorn
 
 # MCP client imports
@@ -22,6 +23,22 @@ except ImportError:
     print("Install MCP client: pip install mcp")
     exit(1)
 
+from admission import MCP_QUEUES, AdmissionController
+from aggregate_router import AggregateRouter
+from cache_warmer import CACHE_WARMING, CacheWarmer, WarmQuery
+from client_cache import manifest_hash
+from fast_responses import fast_response
+from metric_filters import FilterError, MetricFilter, TimeRange, query_cache_key
+from metric_frame import MetricFrame
+from period_comparison import ComparisonError, compare_rows, plan_comparison
+from query_cache import QUERY_CACHE, QueryCache, data_version, sql_hash
+from query_cost import MAX_QUERY_COST, TIER_BATCH, TIER_INTERACTIVE, CostEstimator, QueryCost, load_dimension_stats
+from semantic_graph import SemanticValidationError, load_semantic_graph
+from server_stats import stats
+from tenancy import Tenant, TenantError, TenantRegistry
+from warehouse import SqlTemplate, Warehouse
+from windowed_metrics import DAY_DIMENSION, WindowError, WindowedMetrics, daily_values, parse_window, window_column
+
 # Global MCP client session
 mcp_session: Optional[ClientSession] = None
 
@@ -38,6 +55,8 @@ class DbtMcpManager:
         import sys
         self.python_exe = sys.executable  # Use current Python (from venv)
         self.dbt_path = r"C:\Users\Timer\.local\bin\dbt.exe"  # Fallback
+        # Concurrent first requests (and cache-warming workers) start one MCP process
+        self._connect_lock = asyncio.Lock()
     
     async def ensure_connected(self):
         """Ensure MCP connection is established (lazy connection)"""
@@ -48,6 +67,10 @@ class DbtMcpManager:
     
     async def connect(self):
         """Connect to dbt MCP server"""
+        async with self._connect_lock:
+            await self._connect()
+    
+    async def _connect(self):
         if self.session:
             return
         
@@ -100,15 +123,17 @@ class DbtMcpManager:
                 timeout=60.0
             )
             print("  Creating client session...")
-            self.session = ClientSession(read_stream, write_stream)
+            session = ClientSession(read_stream, write_stream)
             print("  Initializing session (this may take 2-5 minutes on first run)...")
             print("  The MCP server is parsing your dbt project and loading semantic models...")
             # MCP initialization can take much longer, especially on first run
             # The server needs to parse the dbt project, load semantic models, and initialize LSP
             await asyncio.wait_for(
-                self.session.initialize(),
+                session.initialize(),
                 timeout=300.0  # 5 minutes - first run can be very slow
             )
+            # Only publish the session once it's usable (ensure_connected checks it unlocked)
+            self.session = session
             print("✓ Connected to dbt MCP server")
         except asyncio.TimeoutError:
             print("✗ Connection timeout - MCP server took too long to respond")
@@ -131,6 +156,305 @@ class DbtMcpManager:
 
 
 manager = DbtMcpManager()
+tenants = TenantRegistry(manager.project_dir)
+
+# Warehouse executions (query_metrics) and metadata/compile calls on the MCP
+# session are scheduled separately, both fair across tenants
+admission = AdmissionController()
+mcp_calls = AdmissionController(MCP_QUEUES, name="mcp")
+
+# Semantic request -> compiled SQL -> result; equivalent queries share results
+query_cache = QueryCache()
+
+# Direct Databricks connection for parameterized SQL templates (optional)
+warehouse = Warehouse()
+
+# Roll-ups from pre-aggregated tables (aggregates.yml) instead of MetricFlow SQL
+aggregate_router = AggregateRouter(project_dir=manager.project_dir)
+
+
+def parse_filters(filters) -> MetricFilter:
+    """Parse a filter spec (JSON string or dict) and validate it against the catalog."""
+    try:
+        if isinstance(filters, str):
+            metric_filter = MetricFilter.from_json(filters)
+        else:
+            metric_filter = MetricFilter.from_spec(filters)
+        graph = load_semantic_graph(manager.project_dir)
+        catalog = graph.dimension_catalog() if graph else None
+        return metric_filter.validate(catalog).normalized()
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def validate_query(
+    metrics: List[str],
+    dimensions: Optional[List[str]] = None,
+    metric_filter: Optional[MetricFilter] = None,
+):
+    """Reject invalid metric/dimension combinations before they consume an MCP slot."""
+    graph = load_semantic_graph(manager.project_dir)
+    if graph is None:
+        return
+    try:
+        graph.validate_query(metrics, dimensions, metric_filter)
+    except SemanticValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def estimate_cost(
+    request: Optional[Request],
+    metrics: List[str],
+    dimensions: Optional[List[str]] = None,
+    metric_filter: Optional[MetricFilter] = None,
+    limit: Optional[int] = None,
+) -> Optional[QueryCost]:
+    """Estimate a query's cost and pick its admission tier; rejects queries over MAX_QUERY_COST."""
+    graph = load_semantic_graph(manager.project_dir)
+    if graph is None:
+        return None
+    cost = CostEstimator(graph, load_dimension_stats(manager.project_dir)).estimate(
+        metrics, dimensions, metric_filter, limit
+    )
+    if cost.cost > MAX_QUERY_COST:
+        stats.increment("admission_rejections", queue=cost.tier, status=400)
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Query too expensive (estimated cost {cost.cost:,.0f} > {MAX_QUERY_COST:,.0f}); "
+                "narrow the time range, drop dimensions or use a coarser time grain"
+            ),
+        )
+    if request is not None and request.headers.get("x-query-priority", "").lower() == TIER_BATCH:
+        cost.tier = TIER_BATCH
+    return cost
+
+
+def metric_query_params(
+    metrics: List[str],
+    dimensions: Optional[List[str]] = None,
+    metric_filter: Optional[MetricFilter] = None,
+    limit: Optional[int] = None,
+) -> dict:
+    """MCP tool arguments for a metric query."""
+    query_params = {"metrics": metrics}
+    if dimensions:
+        query_params["dimensions"] = dimensions
+    if metric_filter:
+        graph = load_semantic_graph(manager.project_dir)
+        query_params["where"] = metric_filter.to_where(graph.dimension_catalog() if graph else None)
+    if limit:
+        query_params["limit"] = limit
+    return query_params
+
+
+class McpToolError(RuntimeError):
+    """An MCP tool call that reported an error (never cached)."""
+
+
+def tool_content(result, tool: str):
+    """Content of an MCP tool result; raises McpToolError if the tool failed."""
+    if result is not None and getattr(result, "isError", False):
+        text = " ".join(getattr(item, "text", str(item)) for item in (result.content or []))
+        raise McpToolError(f"{tool} failed: {text or 'unknown error'}")
+    return result.content if result else None
+
+
+def result_rows(result) -> List[dict]:
+    """Query output as row dicts, whichever path (MCP, SQL template, aggregate) produced it."""
+    return MetricFrame.from_result(result if result is not None else []).rows()
+
+
+async def compile_metric_sql(tenant, metrics, dimensions=None, metric_filter=None) -> str:
+    """Compiled SQL for a metric query (one MCP call, admitted on the mcp queue)."""
+    async with mcp_calls.admit("mcp", tenant.id, tenant.weight):
+        result = await manager.session.call_tool(
+            "get_metrics_compiled_sql", metric_query_params(metrics, dimensions, metric_filter)
+        )
+    content = tool_content(result, "get_metrics_compiled_sql")
+    return content[0].text if content else ""
+
+
+async def run_metric_query(
+    tenant,
+    metrics: List[str],
+    dimensions: Optional[List[str]] = None,
+    metric_filter: Optional[MetricFilter] = None,
+    limit: Optional[int] = None,
+    cost: Optional[QueryCost] = None,
+    approximate: bool = False,
+):
+    """
+    Run a metric query through the two-tier query cache (see query_cache.py).
+
+    With a warehouse configured, queries a registered aggregate table can
+    answer are rolled up from it (aggregate_router.py; with approximate=True
+    distinct counts may be estimated from sketches), and filtered queries
+    run from a parameterized SQL template; everything else runs through MCP
+    query_metrics, exactly. Returns (rows, cache info). Only cache
+    misses take an admission slot and are charged to the tenant.
+    """
+    async def execute():
+        async with admission.admit(
+            cost.tier if cost else TIER_INTERACTIVE,
+            tenant.id,
+            tenant.weight,
+            cost.size if cost else 1.0,
+        ):
+            stats.increment("tenant_cost", cost.cost if cost else 0, tenant=tenant.id)
+            result = await manager.session.call_tool(
+                "query_metrics", metric_query_params(metrics, dimensions, metric_filter, limit)
+            )
+        return result_rows(tool_content(result, "query_metrics"))
+
+    if warehouse.enabled:
+        routed = await run_aggregate_query(tenant, metrics, dimensions, metric_filter, limit, approximate, cost)
+        if routed is not None:
+            return routed
+    if warehouse.enabled and metric_filter:
+        templated = await run_templated_query(tenant, metrics, dimensions, metric_filter, limit, cost)
+        if templated is not None:
+            return templated
+    if not QUERY_CACHE:
+        return await execute(), None
+    return await query_cache.fetch(
+        query_cache_key(metrics, dimensions, metric_filter),
+        lambda: compile_metric_sql(tenant, metrics, dimensions, metric_filter),
+        execute,
+        data_version(manager.project_dir),
+        limit,
+        manifest_hash(manager.project_dir),
+    )
+
+
+async def run_aggregate_query(
+    tenant,
+    metrics: List[str],
+    dimensions: Optional[List[str]],
+    metric_filter: Optional[MetricFilter],
+    limit: Optional[int] = None,
+    approximate: bool = False,
+    cost: Optional[QueryCost] = None,
+):
+    """
+    Answer a query from a pre-aggregated table, if one covers it.
+
+    Returns (rows, cache info), or None to fall back to MetricFlow. Cache
+    info carries the error bound when metrics were estimated from sketches.
+    Cache misses are admitted and charged like any other query (`cost`).
+    """
+    decision = aggregate_router.route(metrics, dimensions, metric_filter, approximate)
+    aggregate_router.record(decision, metrics, dimensions)
+    if not decision.routed:
+        return None
+
+    template = SqlTemplate(decision.sql, tuple(decision.params))
+
+    async def execute():
+        async with admission.admit(
+            cost.tier if cost else TIER_INTERACTIVE,
+            tenant.id,
+            tenant.weight,
+            cost.size if cost else 1.0,
+        ):
+            stats.increment("tenant_cost", cost.cost if cost else 0, tenant=tenant.id)
+            return result_rows(await warehouse.execute(template, decision.params, limit))
+
+    if not QUERY_CACHE:
+        return await execute(), {"aggregate": decision.aggregate, "approximation": decision.approximation}
+    digest = sql_hash(template.sql)
+    rows, result_hit = await query_cache.result(
+        digest, execute, data_version(manager.project_dir), limit, decision.params
+    )
+    return rows, {
+        "sql": "aggregate",
+        "result": "hit" if result_hit else "miss",
+        "sql_hash": digest[:16],
+        "aggregate": decision.aggregate,
+        "approximation": decision.approximation,
+    }
+
+
+async def run_templated_query(
+    tenant,
+    metrics: List[str],
+    dimensions: Optional[List[str]],
+    metric_filter: MetricFilter,
+    limit: Optional[int] = None,
+    cost: Optional[QueryCost] = None,
+):
+    """
+    Run a filtered query from a parameterized SQL template (see warehouse.py).
+
+    The query shape compiles once per semantic manifest (templates are kept
+    even with QUERY_CACHE=false, which only skips the result tier); filter
+    values are bound by the driver. Returns (rows, cache info), or None to
+    fall back to MCP execution.
+    """
+    template_filter, params = metric_filter.parameterized()
+    if not params:
+        return None
+    shape_key = query_cache_key(metrics, dimensions, template_filter)
+    try:
+        sql, _, sql_hit = await query_cache.compiled_sql(
+            shape_key,
+            lambda: compile_metric_sql(tenant, metrics, dimensions, template_filter),
+            manifest_hash(manager.project_dir),
+        )
+    except Exception as e:
+        print(f"⚠ SQL template: compile failed ({type(e).__name__}: {e}); using MCP")
+        return None
+    template = SqlTemplate.from_compiled(sql, params) if sql else None
+    if template is None:
+        stats.increment("sql_template_fallbacks")
+        return None
+
+    async def execute():
+        async with admission.admit(
+            cost.tier if cost else TIER_INTERACTIVE,
+            tenant.id,
+            tenant.weight,
+            cost.size if cost else 1.0,
+        ):
+            stats.increment("tenant_cost", cost.cost if cost else 0, tenant=tenant.id)
+            return result_rows(await warehouse.execute(template, params, limit))
+
+    digest = sql_hash(template.sql)
+    stats.increment("sql_template_queries", sql="hit" if sql_hit else "miss")
+    if QUERY_CACHE:
+        rows, result_hit = await query_cache.result(digest, execute, data_version(manager.project_dir), limit, params)
+        result = "hit" if result_hit else "miss"
+    else:
+        rows, result = await execute(), "bypass"
+    return rows, {
+        "sql": "hit" if sql_hit else "miss",
+        "result": result,
+        "sql_hash": digest[:16],
+        "template": True,
+    }
+
+
+# Exposure queries (models/exposures.yml meta.warm_queries) are warmed as their
+# own tenant on the batch queue
+WARMER_TENANT = Tenant("cache-warmer", name="Cache warming")
+
+
+async def warm_query(query: WarmQuery, filters: dict):
+    """Pre-compile and pre-execute one exposure query into the query cache."""
+    metric_filter = parse_filters(filters)
+    dimensions = query.dimensions or None
+    validate_query(query.metrics, dimensions, metric_filter)
+    cost = estimate_cost(None, query.metrics, dimensions, metric_filter, query.limit)
+    if cost:
+        cost.tier = TIER_BATCH
+    await manager.ensure_connected()
+    if not manager.session:
+        raise RuntimeError("MCP server connection failed")
+    await run_metric_query(WARMER_TENANT, query.metrics, dimensions, metric_filter, query.limit, cost)
+
+
+cache_warmer = CacheWarmer(manager.project_dir, warm_query)
+windowed_metrics = WindowedMetrics(manager.project_dir)
 
 
 @asynccontextmanager
@@ -139,8 +463,17 @@ async def lifespan(app: FastAPI):
     # Startup - Don't connect immediately, use lazy connection
     print("MCP server will connect on first request...")
     
+    # Cache warming connects in the background and keeps watching for dbt runs
+    warming = None
+    if CACHE_WARMING and QUERY_CACHE:
+        warming = asyncio.create_task(cache_warmer.run_forever())
+    
     yield
     
+    if warming:
+        warming.cancel()
+    warehouse.close()
+    
     # Shutdown
     print("Disconnecting from dbt MCP server...")
     try:
@@ -158,6 +491,32 @@ app = FastAPI(
 )
 
 
+TENANT_EXEMPT_PATHS = {"/", "/api/health", "/docs", "/redoc", "/openapi.json"}
+
+
+@app.middleware("http")
+async def tenant_middleware(request: Request, call_next):
+    """Attribute each request to a tenant, apply its rate limit and record its usage."""
+    if request.url.path in TENANT_EXEMPT_PATHS:
+        return await call_next(request)
+    
+    tenant = None
+    try:
+        tenant = tenants.identify(request.headers)
+        tenants.check_rate(tenant)
+    except TenantError as e:
+        stats.increment("tenant_rejections", tenant=tenant.id if tenant else "unknown", status=e.status_code)
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        return JSONResponse(status_code=e.status_code, content={"detail": e.detail}, headers=headers)
+    
+    request.state.tenant = tenant
+    start = time.perf_counter()
+    response = await call_next(request)
+    stats.observe("tenant_latency_ms", (time.perf_counter() - start) * 1000, tenant=tenant.id)
+    stats.increment("tenant_requests", tenant=tenant.id, status=response.status_code)
+    return response
+
+
 # ============================================================================
 # API ENDPOINTS
 # ============================================================================
@@ -172,8 +531,14 @@ async def root():
         "endpoints": {
             "metrics": "/api/metrics",
             "query": "/api/query",
+            "estimate": "/api/query/estimate",
+            "route": "/api/query/route",
+            "windowed": "/api/query/windowed",
+            "conversions": "/api/query/conversions",
             "sql": "/api/sql",
-            "health": "/api/health"
+            "health": "/api/health",
+            "stats": "/api/stats",
+            "tenants": "/api/tenants"
         }
     }
 
@@ -188,8 +553,26 @@ async def health_check():
     }
 
 
+@app.get("/api/stats")
+async def server_stats():
+    """In-process server stats (encoding/compression timings, response sizes, queues, per-tenant usage, query cache)"""
+    return {
+        **stats.snapshot(),
+        "admission": admission.snapshot(),
+        "mcp": mcp_calls.snapshot(),
+        "query_cache": {**query_cache.snapshot(), "last_warming": cache_warmer.last_run},
+        "windowed_metrics": windowed_metrics.snapshot(),
+    }
+
+
+@app.get("/api/tenants")
+async def list_tenants(request: Request):
+    """Configured tenants, their weights and rate limits, and the caller's tenant"""
+    return {"tenant": request.state.tenant.id, "tenants": tenants.snapshot()}
+
+
 @app.get("/api/metrics")
-async def list_metrics():
+async def list_metrics(request: Request):
     """List all available metrics"""
     try:
         await manager.ensure_connected()
@@ -198,10 +581,12 @@ async def list_metrics():
                 status_code=503, 
                 detail="MCP server connection failed. Check server logs for details."
             )
-        result = await manager.session.call_tool("list_metrics", {})
+        tenant = request.state.tenant
+        async with mcp_calls.admit("mcp", tenant.id, tenant.weight):
+            result = await manager.session.call_tool("list_metrics", {})
         metrics = result.content if result else []
         
-        return {
+        return await fast_response({
             "count": len(metrics),
             "metrics": [
                 {
@@ -212,7 +597,7 @@ async def list_metrics():
                 }
                 for m in metrics
             ]
-        }
+        }, request)
     except HTTPException:
         raise
     except Exception as e:
@@ -225,55 +610,176 @@ async def list_metrics():
 
 @app.post("/api/query")
 async def query_metrics(
+    request: Request,
     metrics: List[str] = Query(..., description="List of metric names to query"),
     dimensions: Optional[List[str]] = Query(None, description="Dimensions to group by"),
     filters: Optional[str] = Query(None, description="JSON string of filters"),
-    limit: Optional[int] = Query(100, description="Maximum rows to return")
+    limit: Optional[int] = Query(100, description="Maximum rows to return"),
+    approximate: bool = Query(False, description="Allow distinct counts estimated from aggregate sketches"),
+    compare: Optional[List[str]] = Query(None, description="Period comparisons: previous_period, year_over_year, <n>_periods")
 ):
     """
     Query metrics with optional dimensions and filters
     
     Example:
         POST /api/query?metrics=total_revenue&metrics=total_orders&dimensions=store__store_type
+        
+    Filters (see metric_filters.py for all operators):
+        filters={"store__store_type": "Premium", "order__order_date__day": {"start": "2024-01-01"}}
+
+    With approximate=true, distinct-count metrics (total_orders,
+    average_order_value, ...) may be answered from HyperLogLog sketches in an
+    aggregate table; `approximation` in the response then states the error
+    bound. It's null when the result is exact.
+
+    Period comparison (see period_comparison.py): group by one time dimension,
+    filter it to the base periods and list the offsets; every period is read
+    in a single query and each row gets the earlier values, deltas and
+    percent changes:
+        POST /api/query?metrics=total_revenue&dimensions=metric_time__month
+            &filters={"metric_time__month": "2024-06-01"}
+            &compare=previous_period&compare=year_over_year
     """
     try:
+        metric_filter = parse_filters(filters)
+        validate_query(metrics, dimensions, metric_filter)
+        plan = plan_comparison(dimensions, metric_filter, compare) if compare else None
+        query_filter = plan.metric_filter if plan else metric_filter
+        query_limit = None if plan else limit
+        cost = estimate_cost(request, metrics, dimensions, query_filter, query_limit)
         await manager.ensure_connected()
-        import json
-        
-        query_params = {"metrics": metrics}
-        
-        if dimensions:
-            query_params["dimensions"] = dimensions
-        
-        if filters:
-            filter_dict = json.loads(filters)
-            # Convert filter dict to WHERE clause
-            conditions = []
-            for key, value in filter_dict.items():
-                if isinstance(value, str):
-                    conditions.append(f"{{{{ Dimension('{key}') }}}} = '{value}'")
-                else:
-                    conditions.append(f"{{{{ Dimension('{key}') }}}} = {value}")
-            query_params["where"] = " AND ".join(conditions)
-        
-        if limit:
-            query_params["limit"] = limit
         
-        result = await manager.session.call_tool("query_metrics", query_params)
+        data, cache = await run_metric_query(
+            request.state.tenant, metrics, dimensions, query_filter, query_limit, cost, approximate
+        )
+        if plan:
+            data = compare_rows(plan, data, metrics, dimensions)
+            data = data[:limit] if limit else data
         
-        return {
+        return await fast_response({
             "metrics": metrics,
             "dimensions": dimensions or [],
             "filters": filters,
-            "data": result.content if result else {},
+            "data": data,
+            "cost": cost.to_dict() if cost else None,
+            "cache": cache,
+            "approximation": (cache or {}).get("approximation"),
+            "comparison": plan.to_dict() if plan else None,
             "timestamp": datetime.now().isoformat()
-        }
+        }, request)
+    except HTTPException:
+        raise
+    except ComparisonError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/query/estimate")
+async def estimate_query(
+    request: Request,
+    metrics: List[str] = Query(..., description="List of metric names to query"),
+    dimensions: Optional[List[str]] = Query(None, description="Dimensions to group by"),
+    filters: Optional[str] = Query(None, description="JSON string of filters"),
+    limit: Optional[int] = Query(100, description="Maximum rows to return")
+):
+    """Estimated cost and admission tier for a query, without running it"""
+    metric_filter = parse_filters(filters)
+    validate_query(metrics, dimensions, metric_filter)
+    graph = load_semantic_graph(manager.project_dir)
+    if graph is None:
+        raise HTTPException(status_code=503, detail="Semantic manifest not available; run 'dbt parse'")
+    cost = CostEstimator(graph, load_dimension_stats(manager.project_dir)).estimate(
+        metrics, dimensions, metric_filter, limit
+    )
+    return {
+        **cost.to_dict(),
+        "max_query_cost": MAX_QUERY_COST,
+        "admitted": cost.cost <= MAX_QUERY_COST,
+    }
+
+
+@app.post("/api/query/route")
+async def route_query(
+    metrics: List[str] = Query(..., description="List of metric names to query"),
+    dimensions: Optional[List[str]] = Query(None, description="Dimensions to group by"),
+    filters: Optional[str] = Query(None, description="JSON string of filters"),
+    approximate: bool = Query(False, description="Allow distinct counts estimated from aggregate sketches")
+):
+    """Whether a query would be answered from an aggregate table (and its SQL), without running it"""
+    metric_filter = parse_filters(filters)
+    validate_query(metrics, dimensions, metric_filter)
+    decision = aggregate_router.route(metrics, dimensions, metric_filter, approximate)
+    return {**decision.to_dict(), "warehouse_enabled": warehouse.enabled}
+
+
+@app.post("/api/query/windowed")
+async def query_windowed(
+    request: Request,
+    metrics: List[str] = Query(..., description="Additive metrics (sums / counts)"),
+    windows: List[str] = Query(["cumulative", "7d", "30d"], description="'cumulative' and/or trailing day counts ('7d')"),
+    start: Optional[str] = Query(None, description="First day (YYYY-MM-DD), default 30 days before end"),
+    end: Optional[str] = Query(None, description="Last day (YYYY-MM-DD), default today"),
+    filters: Optional[str] = Query(None, description="JSON string of filters")
+):
+    """
+    Daily cumulative and rolling-window values for additive metrics
+
+    Example:
+        POST /api/query/windowed?metrics=total_revenue&windows=cumulative&windows=7d&start=2024-01-01
+
+    Each row has metric_time__day, the metric's daily value and one column per
+    window (`total_revenue__cumulative`, `total_revenue__rolling_7d`), computed
+    from cached daily series with prefix sums (see windowed_metrics.py).
+    """
+    try:
+        metric_filter = parse_filters(filters)
+        validate_query(metrics, [DAY_DIMENSION], metric_filter)
+        graph = load_semantic_graph(manager.project_dir)
+        if graph is not None:
+            non_additive = [m for m in metrics if not graph.is_additive(m)]
+            if non_additive:
+                raise WindowError(
+                    f"Windowed values need additive metrics (sum / count measures): {', '.join(non_additive)}"
+                )
+        spans = list(dict.fromkeys(parse_window(w) for w in windows))
+        try:
+            last = date.fromisoformat(end) if end else date.today()
+            first = date.fromisoformat(start) if start else last - timedelta(days=29)
+        except ValueError:
+            raise WindowError("start and end must be dates (YYYY-MM-DD)")
+        await manager.ensure_connected()
+
+        async def fetch_daily(stale: List[str], base_filter: MetricFilter, first_day: date, last_day: date):
+            day_range = TimeRange(DAY_DIMENSION, first_day.isoformat(), (last_day + timedelta(days=1)).isoformat())
+            day_filter = MetricFilter(base_filter.conditions + (day_range,))
+            cost = estimate_cost(request, stale, [DAY_DIMENSION], day_filter)
+            data, _ = await run_metric_query(request.state.tenant, stale, [DAY_DIMENSION], day_filter, None, cost)
+            return daily_values(data)
+
+        rows, info = await windowed_metrics.query(
+            metrics, spans, first, last, metric_filter, data_version(manager.project_dir), fetch_daily
+        )
+
+        return await fast_response({
+            "metrics": metrics,
+            "windows": [window_column(m, days) for m in metrics for days in spans],
+            "filters": filters,
+            "data": rows,
+            "series": info,
+            "timestamp": datetime.now().isoformat()
+        }, request)
+    except HTTPException:
+        raise
+    except WindowError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/query/revenue")
 async def query_revenue(
+    request: Request,
     dimension: Optional[str] = Query(None, description="Dimension to group by"),
     store_type: Optional[str] = Query(None, description="Filter by store type"),
     status: Optional[str] = Query(None, description="Filter by order status"),
@@ -286,7 +792,6 @@ async def query_revenue(
         GET /api/query/revenue?dimension=store__store_type&store_type=Premium
     """
     try:
-        await manager.ensure_connected()
         metrics = ["total_revenue", "completed_revenue", "average_order_value"]
         dimensions = [dimension] if dimension else None
         
@@ -295,76 +800,130 @@ async def query_revenue(
             filters["store__store_type"] = store_type
         if status:
             filters["order__order_status"] = status
+        metric_filter = parse_filters(filters)
+        validate_query(metrics, dimensions, metric_filter)
+        cost = estimate_cost(request, metrics, dimensions, metric_filter, limit)
+        await manager.ensure_connected()
         
-        query_params = {"metrics": metrics}
-        if dimensions:
-            query_params["dimensions"] = dimensions
-        if filters:
-            conditions = []
-            for key, value in filters.items():
-                conditions.append(f"{{{{ Dimension('{key}') }}}} = '{value}'")
-            query_params["where"] = " AND ".join(conditions)
-        if limit:
-            query_params["limit"] = limit
-        
-        result = await manager.session.call_tool("query_metrics", query_params)
+        data, cache = await run_metric_query(
+            request.state.tenant, metrics, dimensions, metric_filter, limit, cost
+        )
         
-        return {
+        return await fast_response({
             "metrics": metrics,
             "dimension": dimension,
             "filters": filters,
-            "data": result.content if result else {},
+            "data": data,
+            "cost": cost.to_dict() if cost else None,
+            "cache": cache,
             "timestamp": datetime.now().isoformat()
-        }
+        }, request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+CONVERSION_METRICS = [
+    "conversion_base_visits",
+    "visit_to_order_conversions_7d",
+    "visit_to_order_conversions_30d",
+    "visit_to_order_conversion_rate_7d",
+    "visit_to_order_conversion_rate_30d",
+]
+
+
+@app.get("/api/query/conversions")
+async def query_conversions(
+    request: Request,
+    dimension: Optional[str] = Query(None, description="Dimension to group by"),
+    referrer: Optional[str] = Query(None, description="Filter by traffic source of the visit"),
+    page_type: Optional[str] = Query(None, description="Filter by page type of the visit"),
+    limit: int = Query(100, description="Maximum rows")
+):
+    """
+    Convenience endpoint for visit -> order conversion (7 and 30 day windows)
+
+    The conversions are precomputed per visit by fct_visit_conversions.
+
+    Example:
+        GET /api/query/conversions?dimension=metric_time__month&referrer=google
+    """
+    try:
+        metrics = CONVERSION_METRICS
+        dimensions = [dimension] if dimension else None
+
+        filters = {}
+        if referrer:
+            filters["visit_conversion__conversion_referrer"] = referrer
+        if page_type:
+            filters["visit_conversion__conversion_page_type"] = page_type
+        metric_filter = parse_filters(filters)
+        validate_query(metrics, dimensions, metric_filter)
+        cost = estimate_cost(request, metrics, dimensions, metric_filter, limit)
+        await manager.ensure_connected()
+
+        data, cache = await run_metric_query(
+            request.state.tenant, metrics, dimensions, metric_filter, limit, cost
+        )
+
+        return await fast_response({
+            "metrics": metrics,
+            "dimension": dimension,
+            "filters": filters,
+            "data": data,
+            "cost": cost.to_dict() if cost else None,
+            "cache": cache,
+            "timestamp": datetime.now().isoformat()
+        }, request)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/sql")
 async def get_sql(
+    request: Request,
     metrics: List[str] = Query(..., description="List of metric names"),
     dimensions: Optional[List[str]] = Query(None, description="Dimensions to group by"),
     filters: Optional[str] = Query(None, description="JSON string of filters")
 ):
     """Get compiled SQL for a metric query"""
     try:
+        metric_filter = parse_filters(filters)
+        validate_query(metrics, dimensions, metric_filter)
         await manager.ensure_connected()
-        import json
-        
-        query_params = {"metrics": metrics}
-        
-        if dimensions:
-            query_params["dimensions"] = dimensions
         
-        if filters:
-            filter_dict = json.loads(filters)
-            conditions = []
-            for key, value in filter_dict.items():
-                if isinstance(value, str):
-                    conditions.append(f"{{{{ Dimension('{key}') }}}} = '{value}'")
-                else:
-                    conditions.append(f"{{{{ Dimension('{key}') }}}} = {value}")
-            query_params["where"] = " AND ".join(conditions)
-        
-        result = await manager.session.call_tool("get_metrics_compiled_sql", query_params)
-        sql = result.content[0].text if result and result.content else ""
+        tenant = request.state.tenant
+        compile_sql = lambda: compile_metric_sql(tenant, metrics, dimensions, metric_filter)
+        if QUERY_CACHE:
+            sql, _, _ = await query_cache.compiled_sql(
+                query_cache_key(metrics, dimensions, metric_filter), compile_sql, manifest_hash(manager.project_dir)
+            )
+        else:
+            sql = await compile_sql()
         
-        return {
+        return await fast_response({
             "sql": sql,
             "metrics": metrics,
             "dimensions": dimensions or [],
             "timestamp": datetime.now().isoformat()
-        }
+        }, request)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/metrics/{metric_name}")
-async def get_metric_details(metric_name: str):
+async def get_metric_details(request: Request, metric_name: str):
     """Get details about a specific metric"""
     try:
         await manager.ensure_connected()
-        result = await manager.session.call_tool("list_metrics", {})
+        tenant = request.state.tenant
+        async with mcp_calls.admit("mcp", tenant.id, tenant.weight):
+            result = await manager.session.call_tool("list_metrics", {})
         metrics = result.content if result else []
         
         metric = next((m for m in metrics if m.get("name") == metric_name), None)
@@ -372,13 +931,13 @@ async def get_metric_details(metric_name: str):
         if not metric:
             raise HTTPException(status_code=404, detail=f"Metric '{metric_name}' not found")
         
-        return {
+        return await fast_response({
             "name": metric.get("name"),
             "label": metric.get("label"),
             "description": metric.get("description"),
             "type": metric.get("type"),
             "details": metric
-        }
+        }, request)
     except HTTPException:
         raise
     except Exception as e:
@@ -18,17 +18,57 @@ except ImportError:
     print("Install MCP client: pip install mcp")
     exit(1)
 
+from client_cache import KIND_CATALOG, KIND_RESULT, KIND_SQL, ClientCache, manifest_hash, to_jsonable
+from metric_filters import MetricFilter, query_cache_key
+from metric_frame import MetricFrame
+
 
 class DbtMetricQueryClient:
-    """Client for querying dbt metrics via MCP server"""
+    """
+    Client for querying dbt metrics via MCP server
+    
+    Pass a ClientCache to reuse catalog data, compiled SQL and results across
+    script runs; the MCP connection is only opened on a cache miss.
+    """
     
-    def __init__(self, project_dir: str, profiles_dir: str, dbt_path: str):
+    def __init__(
+        self,
+        project_dir: str,
+        profiles_dir: str,
+        dbt_path: str,
+        cache: Optional[ClientCache] = None
+    ):
         self.project_dir = project_dir
         self.profiles_dir = profiles_dir
         self.dbt_path = dbt_path
+        self.cache = cache
         self.session: Optional[ClientSession] = None
         self.transport_context = None
     
+    async def ensure_connected(self):
+        """Connect on first use"""
+        if not self.session:
+            await self.connect()
+    
+    def _cache_get(self, kind: str, key: str) -> Optional[Any]:
+        if not self.cache:
+            return None
+        return self.cache.get(kind, key, manifest_hash(self.project_dir))
+    
+    def _cache_set(self, kind: str, key: str, value: Any):
+        if self.cache and value:
+            self.cache.set(kind, key, manifest_hash(self.project_dir), value)
+    
+    @staticmethod
+    def _content(result) -> Any:
+        """Tool result content as plain JSON data, the form cache hits return"""
+        if not result:
+            return None
+        if getattr(result, "isError", False):
+            text = " ".join(getattr(item, "text", str(item)) for item in (result.content or []))
+            raise RuntimeError(f"dbt-MCP tool error: {text or 'unknown error'}")
+        return to_jsonable(result.content)
+    
     async def connect(self):
         """Connect to dbt MCP server"""
         server_params = StdioServerParameters(
@@ -50,8 +90,15 @@ class DbtMetricQueryClient:
     
     async def list_metrics(self) -> List[Dict[str, Any]]:
         """List all available metrics"""
+        cached = self._cache_get(KIND_CATALOG, "list_metrics")
+        if cached is not None:
+            return cached
+        
+        await self.ensure_connected()
         result = await self.session.call_tool("list_metrics", {})
-        return result.content if result else []
+        metrics = self._content(result) or []
+        self._cache_set(KIND_CATALOG, "list_metrics", metrics)
+        return metrics
     
     async def query_metrics(
         self,
@@ -67,7 +114,8 @@ class DbtMetricQueryClient:
         Args:
             metrics: List of metric names (e.g., ["total_revenue", "total_orders"])
             dimensions: List of dimensions to group by (e.g., ["order__order_date__month"])
-            filters: Dictionary of filters (e.g., {"order__order_status": "completed"})
+            filters: Dictionary of filters (e.g., {"order__order_status": "completed"},
+                     {"order__order_date__day": {"start": "2024-01-01"}})
             time_grain: Time grain for time dimensions (e.g., "month")
             limit: Maximum number of rows to return
         """
@@ -87,21 +135,27 @@ class DbtMetricQueryClient:
         if limit:
             query_params["limit"] = limit
         
+        cache_key = query_cache_key(
+            metrics, dimensions, MetricFilter.from_spec(filters), time_grain=time_grain, limit=limit
+        )
+        cached = self._cache_get(KIND_RESULT, cache_key)
+        if cached is not None:
+            return cached
+        
+        await self.ensure_connected()
         result = await self.session.call_tool("query_metrics", query_params)
-        return result.content if result else {}
+        content = self._content(result)
+        content = content if content is not None else {}
+        self._cache_set(KIND_RESULT, cache_key, content)
+        return content
+    
+    async def query_frame(self, metrics: List[str], **kwargs) -> MetricFrame:
+        """Query metrics and decode the result into a columnar MetricFrame (see metric_frame.py)"""
+        return MetricFrame.from_result(await self.query_metrics(metrics, **kwargs))
     
     def _build_where_clause(self, filters: Dict[str, Any]) -> str:
-        """Build WHERE clause from filter dictionary"""
-        conditions = []
-        for key, value in filters.items():
-            if isinstance(value, str):
-                conditions.append(f"{{{{ Dimension('{key}') }}}} = '{value}'")
-            elif isinstance(value, list):
-                values = "', '".join(str(v) for v in value)
-                conditions.append(f"{{{{ Dimension('{key}') }}}} IN ('{values}')")
-            else:
-                conditions.append(f"{{{{ Dimension('{key}') }}}} = {value}")
-        return " AND ".join(conditions)
+        """Build WHERE clause from filter dictionary (see metric_filters.py for operators)"""
+        return MetricFilter.from_spec(filters).to_where()
     
     async def get_metric_sql(
         self,
@@ -120,8 +174,18 @@ class DbtMetricQueryClient:
         if filters:
             query_params["where"] = self._build_where_clause(filters)
         
+        cache_key = query_cache_key(metrics, dimensions, MetricFilter.from_spec(filters), kind="sql")
+        cached = self._cache_get(KIND_SQL, cache_key)
+        if cached is not None:
+            return cached
+        
+        await self.ensure_connected()
         result = await self.session.call_tool("get_metrics_compiled_sql", query_params)
-        return result.content[0].text if result and result.content else ""
+        content = self._content(result)
+        sql = content[0].get("text", "") if content else ""
+        if sql:
+            self._cache_set(KIND_SQL, cache_key, sql)
+        return sql
     
     async def close(self):
         """Close the MCP session"""
@@ -147,24 +211,28 @@ async def generate_daily_revenue_report(client: DbtMetricQueryClient):
     end_date = datetime.now()
     start_date = end_date - timedelta(days=7)
     
-    result = await client.query_metrics(
+    frame = await client.query_frame(
         metrics=["total_revenue", "completed_revenue", "total_orders"],
         dimensions=["order__order_date__day"],
         filters={
-            "order__order_date__day": f">= '{start_date.strftime('%Y-%m-%d')}'"
+            "order__order_date__day": {"start": start_date.strftime('%Y-%m-%d')}
         },
         limit=100
     )
     
     print("\nDaily Revenue Report (Last 7 Days):")
     print("-" * 60)
-    if result and "data" in result:
-        for row in result["data"]:
-            print(f"Date: {row.get('order__order_date__day', 'N/A')}")
-            print(f"  Total Revenue: ${row.get('total_revenue', 0):,.2f}")
-            print(f"  Completed Revenue: ${row.get('completed_revenue', 0):,.2f}")
-            print(f"  Total Orders: {row.get('total_orders', 0)}")
-            print()
+    for day, total, completed, orders in zip(
+        frame.format("order__order_date__day", "text"),
+        frame.format("total_revenue", "currency"),
+        frame.format("completed_revenue", "currency"),
+        frame.format("total_orders", "integer"),
+    ):
+        print(f"Date: {day}")
+        print(f"  Total Revenue: {total}")
+        print(f"  Completed Revenue: {completed}")
+        print(f"  Total Orders: {orders}")
+        print()
 
 
 # ============================================================================
@@ -178,7 +246,7 @@ async def get_store_performance_data(client: DbtMetricQueryClient):
     print("="*60)
     
     # Query revenue by store type
-    result = await client.query_metrics(
+    frame = await client.query_frame(
         metrics=["total_revenue", "average_order_value", "total_orders"],
         dimensions=["store__store_type"],
         limit=50
@@ -186,17 +254,16 @@ async def get_store_performance_data(client: DbtMetricQueryClient):
     
     print("\nStore Performance by Type:")
     print("-" * 60)
-    if result and "data" in result:
-        for row in result["data"]:
-            store_type = row.get("store__store_type", "Unknown")
-            revenue = row.get("total_revenue", 0)
-            aov = row.get("average_order_value", 0)
-            orders = row.get("total_orders", 0)
-            
-            print(f"\n{store_type}:")
-            print(f"  Revenue: ${revenue:,.2f}")
-            print(f"  Average Order Value: ${aov:,.2f}")
-            print(f"  Total Orders: {orders}")
+    for store_type, revenue, aov, orders in zip(
+        frame.format("store__store_type", "text", missing="Unknown"),
+        frame.format("total_revenue", "currency"),
+        frame.format("average_order_value", "currency"),
+        frame.format("total_orders", "integer"),
+    ):
+        print(f"\n{store_type}:")
+        print(f"  Revenue: {revenue}")
+        print(f"  Average Order Value: {aov}")
+        print(f"  Total Orders: {orders}")
 
 
 # ============================================================================
@@ -210,32 +277,31 @@ async def analyze_conversion_funnel(client: DbtMetricQueryClient):
     print("="*60)
     
     # Get conversion metrics
-    result = await client.query_metrics(
+    frame = await client.query_frame(
         metrics=[
             "visit_to_order_conversion_rate_7d",
             "visit_to_order_conversion_rate_30d",
             "order_completion_rate",
             "credit_card_adoption_rate"
         ],
-        dimensions=["visit__visit_date__month"],
+        dimensions=["metric_time__month"],
         limit=12
     )
     
     print("\nConversion Metrics by Month:")
     print("-" * 60)
-    if result and "data" in result:
-        for row in result["data"]:
-            month = row.get("visit__visit_date__month", "N/A")
-            conv_7d = row.get("visit_to_order_conversion_rate_7d", 0)
-            conv_30d = row.get("visit_to_order_conversion_rate_30d", 0)
-            completion = row.get("order_completion_rate", 0)
-            cc_adoption = row.get("credit_card_adoption_rate", 0)
-            
-            print(f"\n{month}:")
-            print(f"  Visit→Order (7d): {conv_7d:.2f}%")
-            print(f"  Visit→Order (30d): {conv_30d:.2f}%")
-            print(f"  Order Completion: {completion:.2f}%")
-            print(f"  Credit Card Adoption: {cc_adoption:.2f}%")
+    for month, conv_7d, conv_30d, completion, cc_adoption in zip(
+        frame.format("metric_time__month", "text"),
+        frame.format("visit_to_order_conversion_rate_7d", "percent"),
+        frame.format("visit_to_order_conversion_rate_30d", "percent"),
+        frame.format("order_completion_rate", "percent"),
+        frame.format("credit_card_adoption_rate", "percent"),
+    ):
+        print(f"\n{month}:")
+        print(f"  Visit→Order (7d): {conv_7d}")
+        print(f"  Visit→Order (30d): {conv_30d}")
+        print(f"  Order Completion: {completion}")
+        print(f"  Credit Card Adoption: {cc_adoption}")
 
 
 # ============================================================================
@@ -253,7 +319,7 @@ async def get_metric_api_response(
     dimensions = [dimension] if dimension else None
     filters = {dimension: filter_value} if filter_value else None
     
-    result = await client.query_metrics(
+    frame = await client.query_frame(
         metrics=metrics,
         dimensions=dimensions,
         filters=filters,
@@ -265,7 +331,7 @@ async def get_metric_api_response(
         "dimension": dimension,
         "filter": filter_value,
         "timestamp": datetime.now().isoformat(),
-        "data": result.get("data", []) if result else []
+        "data": frame.rows()
     }
 
 
@@ -281,15 +347,15 @@ async def check_revenue_threshold(client: DbtMetricQueryClient, threshold: float
     
     # Get today's revenue
     today = datetime.now().strftime('%Y-%m-%d')
-    result = await client.query_metrics(
+    frame = await client.query_frame(
         metrics=["total_revenue"],
         dimensions=["order__order_date__day"],
-        filters={"order__order_date__day": f"= '{today}'"},
+        filters={"order__order_date__day": today},
         limit=1
     )
     
-    if result and "data" in result and len(result["data"]) > 0:
-        revenue = result["data"][0].get("total_revenue", 0)
+    if len(frame) > 0:
+        revenue = float(frame.column("total_revenue", fill=0.0)[0])
         
         print(f"\nToday's Revenue: ${revenue:,.2f}")
         print(f"Threshold: ${threshold:,.2f}")
@@ -346,16 +412,16 @@ async def generate_custom_analysis_sql(client: DbtMetricQueryClient):
 async def main():
     """Main function demonstrating headless BI use cases"""
     
-    # Initialize client
+    # Initialize client (the on-disk cache lets repeated runs skip MCP for unchanged data)
     client = DbtMetricQueryClient(
         project_dir=r"C:\Rif\dbt_poc\metricflow_poc",
         profiles_dir=r"C:\Rif\dbt_poc\metricflow_poc",
-        dbt_path=r"C:\Users\Timer\.local\bin\dbt.exe"
+        dbt_path=r"C:\Users\Timer\.local\bin\dbt.exe",
+        cache=ClientCache(".headless_bi_cache.sqlite", ttl_seconds=900)
     )
     
     try:
-        # Connect to MCP server
-        await client.connect()
+        # MCP connects lazily on the first cache miss
         
         # List available metrics
         print("\n" + "="*60)
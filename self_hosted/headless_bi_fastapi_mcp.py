@@ -5,35 +5,44 @@ Responsibilities:
 - Expose dbt semantic layer over HTTP
 - Delegate ALL computation to dbt-MCP
 - Return dbt/MetricFlow-generated SQL & metadata
+
+Serves every dbt project in projects.yml (see project_registry.py): pick one
+with a `/projects/<name>` URL prefix or the `X-Dbt-Project` header.
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from contextlib import asynccontextmanager
 import asyncio
-import sys
+import os
 
-# MCP imports (stdio mode)
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from fast_responses import fast_response
+from lineage_graph import load_lineage_graph
+from metric_filters import FilterError, MetricFilter
+from project_registry import ProjectConfig, ProjectError, ProjectRegistry
+from semantic_graph import SemanticValidationError, load_semantic_graph
+from server_stats import stats
 
 # -----------------------------
 # Configuration
 # -----------------------------
 
-PROJECT_DIR = r"C:\Rif\dbt_poc\metricflow_poc"
-PROFILES_DIR = r"C:\Rif\dbt_poc\metricflow_poc"
-DBT_PATH = r"C:\Users\Timer\.local\bin\dbt.exe"
+# The project served when there is no projects.yml
+PROJECT_DIR = os.environ.get("DBT_PROJECT_DIR", r"C:\Rif\dbt_poc\metricflow_poc")
+PROFILES_DIR = os.environ.get("DBT_PROFILES_DIR", r"C:\Rif\dbt_poc\metricflow_poc")
+DBT_PATH = os.environ.get("DBT_PATH", r"C:\Users\Timer\.local\bin\dbt.exe")
 
-MCP_INIT_TIMEOUT_SECONDS = 900  # 15 minutes (first run)
+PROJECT_PREFIX = "/projects/"
 
 # -----------------------------
-# Global MCP State
+# Project Registry (one dbt-MCP backend per project)
 # -----------------------------
 
-mcp_session: Optional[ClientSession] = None
-mcp_transport = None
+registry = ProjectRegistry.from_file(
+    ProjectConfig("default", PROJECT_DIR, PROFILES_DIR, DBT_PATH)
+)
 
 # -----------------------------
 # Request Models
@@ -52,57 +61,35 @@ class ValidateDimensionsRequest(BaseModel):
     dimensions: List[str]
 
 # -----------------------------
-# MCP Connection Handling
+# MCP Session per Request
 # -----------------------------
 
-async def connect_mcp():
-    """Start and initialize dbt-MCP via stdio (lazy)."""
-    global mcp_session, mcp_transport
-
-    if mcp_session:
-        return
-
-    server_params = StdioServerParameters(
-        command=sys.executable,
-        args=["-m", "dbt_mcp.main"],
-        env={
-            "DBT_PROJECT_DIR": PROJECT_DIR,
-            "DBT_PROFILES_DIR": PROFILES_DIR,
-            "DBT_PATH": DBT_PATH,
-        },
-    )
-
-    print("Connecting to dbt-MCP server...")
-    mcp_transport = stdio_client(server_params)
+def project_dir(request: Request) -> str:
+    return request.state.project.project_dir
 
-    read_stream, write_stream = await mcp_transport.__aenter__()
-    mcp_session = ClientSession(read_stream, write_stream)
 
-    print("Initializing MCP session (first run may take several minutes)...")
-    await asyncio.wait_for(
-        mcp_session.initialize(),
-        timeout=MCP_INIT_TIMEOUT_SECONDS,
-    )
-
-    print("✓ dbt-MCP connected and ready")
-
-
-async def disconnect_mcp():
-    """Gracefully shut down MCP."""
-    global mcp_session, mcp_transport
-
-    if mcp_transport:
-        await mcp_transport.__aexit__(None, None, None)
-
-    mcp_transport = None
-    mcp_session = None
+def mcp_session(request: Request):
+    """`async with mcp_session(request) as session`: the request's project backend, started lazily."""
+    return registry.session(request.state.project.name)
 
+# -----------------------------
+# Local Validation (no MCP round trip)
+# -----------------------------
 
-async def ensure_mcp():
-    if not mcp_session:
-        await connect_mcp()
-    if not mcp_session:
-        raise HTTPException(status_code=503, detail="dbt-MCP not available")
+def validate_locally(
+    request: Request,
+    metric_names: List[str],
+    dimensions: Optional[List[str]] = None,
+    where: Optional[Dict[str, Any]] = None,
+):
+    """Reject bad requests before they reach dbt-MCP (skipped until a manifest exists)."""
+    graph = load_semantic_graph(project_dir(request))
+    if graph is None:
+        return
+    try:
+        graph.validate_query(metric_names, dimensions, MetricFilter.from_spec(where))
+    except (FilterError, SemanticValidationError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # -----------------------------
 # FastAPI Lifecycle
@@ -111,8 +98,10 @@ async def ensure_mcp():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("FastAPI starting (MCP will connect on first request)...")
+    sweeper = asyncio.create_task(registry.run_forever())
     yield
-    await disconnect_mcp()
+    sweeper.cancel()
+    await registry.close()
 
 app = FastAPI(
     title="dbt MCP Semantic API",
@@ -121,321 +110,107 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-# -----------------------------
-# Health
-# -----------------------------
-
-@app.get("/health")
-async def health():
-    return {
-        "status": "ok",
-        "mcp_connected": mcp_session is not None,
-        "project_dir": PROJECT_DIR,
-    }
-
-# -----------------------------
-# MetricFlow APIs
-# -----------------------------
-
-@app.get("/metrics")
-async def list_metrics():
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "metricflow.list_metrics",
-        {},
-    )
-    return {
-        "metrics": result.content if result else [],
-        "count": len(result.content) if result else 0,
-    }
 
+@app.exception_handler(ProjectError)
+async def project_error_handler(request: Request, exc: ProjectError):
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=headers)
 
-@app.get("/metrics/{metric_name}")
-async def get_metric(metric_name: str):
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "metricflow.get_metric",
-        {"metric_name": metric_name},
-    )
-    if not result or not result.content:
-        raise HTTPException(status_code=404, detail="Metric not found")
-    return result.content
 
-
-@app.post("/metrics/sql")
-async def generate_metric_sql(req: MetricSQLRequest):
-    await ensure_mcp()
-
-    payload = {
-        "metric_names": req.metric_names,
-        "dimensions": req.dimensions,
-        "time_granularity": req.time_granularity,
-        "where": req.where,
-        "limit": req.limit,
-    }
-
-    payload = {k: v for k, v in payload.items() if v is not None}
-
-    result = await mcp_session.call_tool(
-        "metricflow.generate_sql",
-        payload,
-    )
-
-    if not result or not result.content:
-        raise HTTPException(status_code=400, detail="SQL generation failed")
-
-    return {"sql": result.content}
-
-
-@app.post("/metrics/validate-dimensions")
-async def validate_dimensions(req: ValidateDimensionsRequest):
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "metricflow.validate_dimensions",
-        {
-            "metric_name": req.metric_name,
-            "dimensions": req.dimensions,
-        },
-    )
-    return result.content
+@app.middleware("http")
+async def project_middleware(request: Request, call_next):
+    """Pick the dbt project from a /projects/<name>/... prefix or the X-Dbt-Project header."""
+    name = request.headers.get("x-dbt-project")
+    path = request.scope["path"]
+    if path.startswith(PROJECT_PREFIX):
+        name, _, rest = path[len(PROJECT_PREFIX):].partition("/")
+        request.scope["path"] = "/" + rest
+    try:
+        request.state.project = registry.project(name)
+    except ProjectError as e:
+        return await project_error_handler(request, e)
+    return await call_next(request)
 
 # -----------------------------
-# Semantic Models
-# -----------------------------
-
-@app.get("/semantic-models")
-async def list_semantic_models():
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "metricflow.list_semantic_models",
-        {},
-    )
-    return result.content if result else []
-
-# -----------------------------
-# dbt Metadata APIs
-# -----------------------------
-
-@app.get("/dbt/models")
-async def list_models():
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "dbt.list_models",
-        {},
-    )
-    return result.content if result else []
-
-
-@app.get("/dbt/models/{model_name}")
-async def get_model(model_name: str):
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "dbt.get_model",
-        {"model_name": model_name},
-    )
-    if not result or not result.content:
-        raise HTTPException(status_code=404, detail="Model not found")
-    return result.content
-
-
-@app.get("/dbt/sources")
-async def list_sources():
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "dbt.list_sources",
-        {},
-    )
-    return result.content if result else []
-
-
-@app.get("/dbt/lineage/{model_name}")
-async def get_lineage(model_name: str):
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "dbt.get_lineage",
-        {"model_name": model_name},
-    )
-    return result.content if result else []
-
-# -----------------------------
-# Entrypoint
-# -----------------------------
-
-if __name__ == "__main__":
-    import uvicorn
-
-    print("Starting dbt MCP Semantic API")
-    print("→ http://localhost:8080")
-    print("→ MCP will initialize on first request")
-
-    uvicorn.run(app, host="0.0.0.0", port=8080)
-"""
-FastAPI Consumption Layer over dbt-MCP (stdio-based)
-
-Responsibilities:
-- Expose dbt semantic layer over HTTP
-- Delegate ALL computation to dbt-MCP
-- Return dbt/MetricFlow-generated SQL & metadata
-"""
-
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from contextlib import asynccontextmanager
-import asyncio
-import sys
-
-# MCP imports (stdio mode)
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-
-# -----------------------------
-# Configuration
-# -----------------------------
-
-PROJECT_DIR = r"C:\Rif\dbt_poc\metricflow_poc"
-PROFILES_DIR = r"C:\Rif\dbt_poc\metricflow_poc"
-DBT_PATH = r"C:\Users\Timer\.local\bin\dbt.exe"
-
-MCP_INIT_TIMEOUT_SECONDS = 900  # 15 minutes (first run)
-
-# -----------------------------
-# Global MCP State
-# -----------------------------
-
-mcp_session: Optional[ClientSession] = None
-mcp_transport = None
-
-# -----------------------------
-# Request Models
-# -----------------------------
-
-class MetricSQLRequest(BaseModel):
-    metric_names: List[str]
-    dimensions: Optional[List[str]] = None
-    time_granularity: Optional[str] = None
-    where: Optional[Dict[str, Any]] = None
-    limit: Optional[int] = None
-
-
-class ValidateDimensionsRequest(BaseModel):
-    metric_name: str
-    dimensions: List[str]
-
-# -----------------------------
-# MCP Connection Handling
-# -----------------------------
-
-async def connect_mcp():
-    """Start and initialize dbt-MCP via stdio (lazy)."""
-    global mcp_session, mcp_transport
-
-    if mcp_session:
-        return
-
-    server_params = StdioServerParameters(
-        command=sys.executable,
-        args=["-m", "dbt_mcp.main"],
-        env={
-            "DBT_PROJECT_DIR": PROJECT_DIR,
-            "DBT_PROFILES_DIR": PROFILES_DIR,
-            "DBT_PATH": DBT_PATH,
-        },
-    )
-
-    print("Connecting to dbt-MCP server...")
-    mcp_transport = stdio_client(server_params)
-
-    read_stream, write_stream = await mcp_transport.__aenter__()
-    mcp_session = ClientSession(read_stream, write_stream)
-
-    print("Initializing MCP session (first run may take several minutes)...")
-    await asyncio.wait_for(
-        mcp_session.initialize(),
-        timeout=MCP_INIT_TIMEOUT_SECONDS,
-    )
-
-    print("✓ dbt-MCP connected and ready")
-
-
-async def disconnect_mcp():
-    """Gracefully shut down MCP."""
-    global mcp_session, mcp_transport
-
-    if mcp_transport:
-        await mcp_transport.__aexit__(None, None, None)
-
-    mcp_transport = None
-    mcp_session = None
-
-
-async def ensure_mcp():
-    if not mcp_session:
-        await connect_mcp()
-    if not mcp_session:
-        raise HTTPException(status_code=503, detail="dbt-MCP not available")
-
-# -----------------------------
-# FastAPI Lifecycle
-# -----------------------------
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    print("FastAPI starting (MCP will connect on first request)...")
-    yield
-    await disconnect_mcp()
-
-app = FastAPI(
-    title="dbt MCP Semantic API",
-    description="Headless semantic layer powered by dbt-MCP",
-    version="1.0.0",
-    lifespan=lifespan,
-)
-
-# -----------------------------
-# Health
+# Health & Stats
 # -----------------------------
 
 @app.get("/health")
-async def health():
+async def health(request: Request):
+    project = request.state.project
     return {
         "status": "ok",
-        "mcp_connected": mcp_session is not None,
-        "project_dir": PROJECT_DIR,
+        "project": project.name,
+        "mcp_connected": registry.backends[project.name].session is not None,
+        "project_dir": project.project_dir,
     }
 
+
+@app.get("/stats")
+async def server_stats():
+    return {**stats.snapshot(), "projects": registry.snapshot()}
+
+
+@app.get("/projects")
+async def list_projects():
+    """Configured projects and the state of their dbt-MCP backends"""
+    return registry.snapshot()
+
 # -----------------------------
 # MetricFlow APIs
 # -----------------------------
 
 @app.get("/metrics")
-async def list_metrics():
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "metricflow.list_metrics",
-        {},
-    )
-    return {
+async def list_metrics(request: Request):
+    async with mcp_session(request) as session:
+        result = await session.call_tool(
+            "metricflow.list_metrics",
+            {},
+        )
+    return await fast_response({
         "metrics": result.content if result else [],
         "count": len(result.content) if result else 0,
-    }
+    }, request)
 
 
 @app.get("/metrics/{metric_name}")
-async def get_metric(metric_name: str):
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "metricflow.get_metric",
-        {"metric_name": metric_name},
-    )
+async def get_metric(request: Request, metric_name: str):
+    async with mcp_session(request) as session:
+        result = await session.call_tool(
+            "metricflow.get_metric",
+            {"metric_name": metric_name},
+        )
     if not result or not result.content:
         raise HTTPException(status_code=404, detail="Metric not found")
     return result.content
 
 
+@app.get("/metrics/{metric_name}/dimensions")
+async def list_metric_dimensions(request: Request, metric_name: str):
+    """All dimensions that can group a metric, with their join paths (no MCP call)."""
+    graph = load_semantic_graph(project_dir(request))
+    if graph is None:
+        async with mcp_session(request) as session:
+            result = await session.call_tool(
+                "metricflow.get_dimensions",
+                {"metrics": [metric_name]},
+            )
+        return result.content if result else []
+
+    if metric_name not in graph.metrics:
+        raise HTTPException(status_code=404, detail="Metric not found")
+
+    dimensions = graph.dimension_paths(metric_name)
+    return await fast_response({
+        "metric_name": metric_name,
+        "count": len(dimensions),
+        "dimensions": [d.to_dict() for d in dimensions],
+    }, request)
+
+
 @app.post("/metrics/sql")
-async def generate_metric_sql(req: MetricSQLRequest):
-    await ensure_mcp()
+async def generate_metric_sql(request: Request, req: MetricSQLRequest):
+    validate_locally(request, req.metric_names, req.dimensions, req.where)
 
     payload = {
         "metric_names": req.metric_names,
@@ -447,27 +222,34 @@ async def generate_metric_sql(req: MetricSQLRequest):
 
     payload = {k: v for k, v in payload.items() if v is not None}
 
-    result = await mcp_session.call_tool(
-        "metricflow.generate_sql",
-        payload,
-    )
+    async with mcp_session(request) as session:
+        result = await session.call_tool(
+            "metricflow.generate_sql",
+            payload,
+        )
 
     if not result or not result.content:
         raise HTTPException(status_code=400, detail="SQL generation failed")
 
-    return {"sql": result.content}
+    return await fast_response({"sql": result.content}, request)
 
 
 @app.post("/metrics/validate-dimensions")
-async def validate_dimensions(req: ValidateDimensionsRequest):
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "metricflow.validate_dimensions",
-        {
-            "metric_name": req.metric_name,
-            "dimensions": req.dimensions,
-        },
-    )
+async def validate_dimensions(request: Request, req: ValidateDimensionsRequest):
+    graph = load_semantic_graph(project_dir(request))
+    if graph is not None:
+        if req.metric_name not in graph.metrics:
+            raise HTTPException(status_code=404, detail="Metric not found")
+        return graph.check_dimensions(req.metric_name, req.dimensions)
+
+    async with mcp_session(request) as session:
+        result = await session.call_tool(
+            "metricflow.validate_dimensions",
+            {
+                "metric_name": req.metric_name,
+                "dimensions": req.dimensions,
+            },
+        )
     return result.content
 
 # -----------------------------
@@ -475,57 +257,80 @@ async def validate_dimensions(req: ValidateDimensionsRequest):
 # -----------------------------
 
 @app.get("/semantic-models")
-async def list_semantic_models():
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "metricflow.list_semantic_models",
-        {},
-    )
-    return result.content if result else []
+async def list_semantic_models(request: Request):
+    async with mcp_session(request) as session:
+        result = await session.call_tool(
+            "metricflow.list_semantic_models",
+            {},
+        )
+    return await fast_response(result.content if result else [], request)
 
 # -----------------------------
 # dbt Metadata APIs
 # -----------------------------
 
 @app.get("/dbt/models")
-async def list_models():
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "dbt.list_models",
-        {},
-    )
+async def list_models(request: Request):
+    graph = load_lineage_graph(project_dir(request))
+    if graph is not None:
+        return await fast_response(graph.models(), request)
+
+    async with mcp_session(request) as session:
+        result = await session.call_tool(
+            "dbt.list_models",
+            {},
+        )
     return result.content if result else []
 
 
 @app.get("/dbt/models/{model_name}")
-async def get_model(model_name: str):
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "dbt.get_model",
-        {"model_name": model_name},
-    )
+async def get_model(request: Request, model_name: str):
+    graph = load_lineage_graph(project_dir(request))
+    if graph is not None:
+        node_id = graph.resolve(model_name)
+        if node_id is None:
+            raise HTTPException(status_code=404, detail="Model not found")
+        return graph.model_details(node_id)
+
+    async with mcp_session(request) as session:
+        result = await session.call_tool(
+            "dbt.get_model",
+            {"model_name": model_name},
+        )
     if not result or not result.content:
         raise HTTPException(status_code=404, detail="Model not found")
     return result.content
 
 
 @app.get("/dbt/sources")
-async def list_sources():
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "dbt.list_sources",
-        {},
-    )
+async def list_sources(request: Request):
+    async with mcp_session(request) as session:
+        result = await session.call_tool(
+            "dbt.list_sources",
+            {},
+        )
     return result.content if result else []
 
 
 @app.get("/dbt/lineage/{model_name}")
-async def get_lineage(model_name: str):
-    await ensure_mcp()
-    result = await mcp_session.call_tool(
-        "dbt.get_lineage",
-        {"model_name": model_name},
-    )
+async def get_lineage(
+    request: Request,
+    model_name: str,
+    direction: str = Query("both", pattern="^(upstream|downstream|both)$"),
+    depth: Optional[int] = Query(None, ge=1, description="Max hops (omit for full lineage)"),
+):
+    graph = load_lineage_graph(project_dir(request))
+    if graph is not None:
+        node_id = graph.resolve(model_name)
+        if node_id is None:
+            raise HTTPException(status_code=404, detail="Model not found")
+        return await fast_response(graph.lineage(node_id, direction, depth), request)
+
+    async with mcp_session(request) as session:
+        result = await session.call_tool(
+            "dbt.get_lineage",
+            {"model_name": model_name},
+        )
     return result.content if result else []
 
 # -----------------------------
@@ -537,6 +342,6 @@ if __name__ == "__main__":
 
     print("Starting dbt MCP Semantic API")
     print("→ http://localhost:8080")
-    print("→ MCP will initialize on first request")
+    print("→ MCP will initialize per project on first request")
 
     uvicorn.run(app, host="0.0.0.0", port=8080)
@@ -8,10 +8,14 @@ and queries metrics that execute on Databricks.
 import asyncio
 import json
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+from client_cache import KIND_CATALOG, KIND_RESULT, KIND_SQL, ClientCache, manifest_hash, to_jsonable
+from metric_filters import MetricFilter, query_cache_key
+from metric_frame import MetricFrame
+
 
 class HeadlessBIClient:
     """
@@ -24,19 +28,85 @@ class HeadlessBIClient:
     4. → MetricFlow generates SQL
     5. → SQL executes on Databricks
     6. → Results returned to Headless BI App
+    
+    Connecting is expensive (pre-parse plus MCP initialization), so scripts
+    that run several reports should share one connection:
+    
+        async with HeadlessBIClient.shared() as client:
+            results = await client.query_many([...])
+    
+    A client created directly and used with `async with` is closed on exit;
+    the shared client stays open until `HeadlessBIClient.close_shared()`.
+    The MCP connection is opened lazily, so with a `ClientCache` (see
+    client_cache.py) a run answered entirely from cache never starts MCP.
     """
     
+    _shared_clients: Dict[Tuple[str, str, str], "HeadlessBIClient"] = {}
+    
     def __init__(
         self,
         project_dir: str = r"C:\Rif\dbt_poc\metricflow_poc",
         profiles_dir: str = r"C:\Rif\dbt_poc\metricflow_poc",
-        dbt_path: str = r"C:\Users\Timer\.local\bin\dbt.exe"
+        dbt_path: str = r"C:\Users\Timer\.local\bin\dbt.exe",
+        max_concurrency: int = 4,
+        cache: Optional[ClientCache] = None
     ):
         self.project_dir = project_dir
         self.profiles_dir = profiles_dir
         self.dbt_path = dbt_path
+        self.max_concurrency = max_concurrency
+        self.cache = cache
         self.session: Optional[ClientSession] = None
         self.transport_context = None
+        self._connect_lock = asyncio.Lock()
+        self._query_slots = asyncio.Semaphore(max_concurrency)  # client-wide cap on in-flight queries
+        self._is_shared = False
+    
+    @classmethod
+    def shared(
+        cls,
+        project_dir: str = r"C:\Rif\dbt_poc\metricflow_poc",
+        profiles_dir: str = r"C:\Rif\dbt_poc\metricflow_poc",
+        dbt_path: str = r"C:\Users\Timer\.local\bin\dbt.exe",
+        max_concurrency: int = 4,
+        cache: Optional[ClientCache] = None
+    ) -> "HeadlessBIClient":
+        """Process-wide client per project, connected lazily and reused across calls
+        
+        The MCP session is bound to the running event loop, so share it within one
+        long-running process (e.g. a scheduler), not across separate asyncio.run() calls.
+        """
+        key = (project_dir, profiles_dir, dbt_path)
+        client = cls._shared_clients.get(key)
+        if client is None:
+            client = cls(project_dir, profiles_dir, dbt_path, max_concurrency, cache)
+            client._is_shared = True
+            cls._shared_clients[key] = client
+        return client
+    
+    @classmethod
+    async def close_shared(cls):
+        """Close every shared client (call once at process exit)"""
+        clients = list(cls._shared_clients.values())
+        cls._shared_clients.clear()
+        for client in clients:
+            await client.close()
+    
+    async def __aenter__(self) -> "HeadlessBIClient":
+        # Connection is lazy: the first call that misses the cache connects
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self._is_shared:
+            await self.close()
+    
+    async def ensure_connected(self):
+        """Connect once; concurrent callers wait for the same connection"""
+        if self.session:
+            return
+        async with self._connect_lock:
+            if not self.session:
+                await self.connect()
     
     async def connect(self):
         """Connect to dbt MCP server"""
@@ -119,17 +189,47 @@ class HeadlessBIClient:
             print(f"✗ Connection error: {e}")
             raise
     
+    def _cache_get(self, kind: str, key: str) -> Optional[Any]:
+        if not self.cache:
+            return None
+        return self.cache.get(kind, key, manifest_hash(self.project_dir))
+    
+    def _cache_set(self, kind: str, key: str, value: Any):
+        if self.cache and value:
+            self.cache.set(kind, key, manifest_hash(self.project_dir), value)
+    
+    @staticmethod
+    def _content(result) -> Any:
+        """
+        Tool result content as plain JSON data ({"type": "text", "text": ...} items),
+        the form the cache stores, so hits and misses return the same types
+        """
+        if not result:
+            return None
+        if getattr(result, "isError", False):
+            text = " ".join(getattr(item, "text", str(item)) for item in (result.content or []))
+            raise RuntimeError(f"dbt-MCP tool error: {text or 'unknown error'}")
+        return to_jsonable(result.content)
+    
     async def list_metrics(self) -> List[Dict[str, Any]]:
         """List all available metrics"""
+        cached = self._cache_get(KIND_CATALOG, "list_metrics")
+        if cached is not None:
+            return cached
+        
+        await self.ensure_connected()
         result = await self.session.call_tool("list_metrics", {})
-        return result.content if result else []
+        metrics = self._content(result) or []
+        self._cache_set(KIND_CATALOG, "list_metrics", metrics)
+        return metrics
     
     async def query_metrics(
         self,
         metrics: List[str],
         dimensions: Optional[List[str]] = None,
         where: Optional[str] = None,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Query metrics - SQL executes on Databricks
@@ -137,8 +237,10 @@ class HeadlessBIClient:
         Args:
             metrics: List of metric names (e.g., ["total_revenue", "total_orders"])
             dimensions: Optional dimensions to group by (e.g., ["store__store_type"])
-            where: Optional WHERE clause filter
+            where: Optional raw MetricFlow WHERE clause filter
             limit: Optional row limit
+            filters: Optional structured filters (see metric_filters.py),
+                     combined with `where` using AND
         
         Returns:
             Query results from Databricks
@@ -150,21 +252,39 @@ class HeadlessBIClient:
         if dimensions:
             query_params["dimensions"] = dimensions
         
-        if where:
-            query_params["where"] = where
+        combined_where = self._combine_where(where, filters)
+        if combined_where:
+            query_params["where"] = combined_where
         
         if limit:
             query_params["limit"] = limit
         
+        cache_key = query_cache_key(
+            metrics, dimensions, MetricFilter.from_spec(filters), where=where, limit=limit
+        )
+        cached = self._cache_get(KIND_RESULT, cache_key)
+        if cached is not None:
+            return cached
+        
         # This calls MCP server -> MetricFlow -> Generates SQL -> Executes on Databricks
-        result = await self.session.call_tool("query_metrics", query_params)
-        return result.content if result else {}
+        await self.ensure_connected()
+        async with self._query_slots:
+            result = await self.session.call_tool("query_metrics", query_params)
+        content = self._content(result)
+        content = content if content is not None else {}
+        self._cache_set(KIND_RESULT, cache_key, content)
+        return content
+    
+    async def query_frame(self, metrics: List[str], **kwargs) -> MetricFrame:
+        """Query metrics and decode the result into a columnar MetricFrame (see metric_frame.py)"""
+        return MetricFrame.from_result(await self.query_metrics(metrics, **kwargs))
     
     async def get_sql(
         self,
         metrics: List[str],
         dimensions: Optional[List[str]] = None,
-        where: Optional[str] = None
+        where: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None
     ) -> str:
         """Get the compiled SQL that will execute on Databricks"""
         query_params = {"metrics": metrics}
@@ -172,11 +292,66 @@ class HeadlessBIClient:
         if dimensions:
             query_params["dimensions"] = dimensions
         
-        if where:
-            query_params["where"] = where
+        combined_where = self._combine_where(where, filters)
+        if combined_where:
+            query_params["where"] = combined_where
+        
+        cache_key = query_cache_key(
+            metrics, dimensions, MetricFilter.from_spec(filters), where=where, kind="sql"
+        )
+        cached = self._cache_get(KIND_SQL, cache_key)
+        if cached is not None:
+            return cached
         
+        await self.ensure_connected()
         result = await self.session.call_tool("get_metrics_compiled_sql", query_params)
-        return result.content[0].text if result and result.content else ""
+        content = self._content(result)
+        sql = content[0].get("text", "") if content else ""
+        if sql:
+            self._cache_set(KIND_SQL, cache_key, sql)
+        return sql
+    
+    async def query_many(
+        self,
+        queries: List[Dict[str, Any]],
+        concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+        as_frames: bool = False
+    ) -> List[Any]:
+        """
+        Run several queries concurrently over the shared MCP session
+        
+        Args:
+            queries: List of keyword-argument dicts for query_metrics
+                     (e.g., [{"metrics": ["total_revenue"], "dimensions": ["store__store_type"]}])
+            concurrency: Max queries in flight for this call; the client-wide
+                         max_concurrency cap always applies
+            return_exceptions: Return exceptions in place of results instead of raising
+            as_frames: Decode each result into a MetricFrame
+        
+        Returns:
+            Results in the same order as `queries`
+        """
+        semaphore = asyncio.Semaphore(concurrency or len(queries) or 1)
+        
+        async def run(query: Dict[str, Any]):
+            async with semaphore:
+                if as_frames:
+                    return await self.query_frame(**query)
+                return await self.query_metrics(**query)
+        
+        return await asyncio.gather(
+            *(run(query) for query in queries),
+            return_exceptions=return_exceptions
+        )
+    
+    @staticmethod
+    def _combine_where(where: Optional[str], filters: Optional[Dict[str, Any]]) -> Optional[str]:
+        """AND a raw where clause with the canonical rendering of structured filters"""
+        rendered = MetricFilter.from_spec(filters).to_where()
+        if where and rendered:
+            return f"({where}) AND ({rendered})"
+        return where or rendered
     
     async def close(self):
         """Close MCP connection"""
@@ -223,19 +398,19 @@ async def example_headless_bi_app():
         print("\n" + "="*60)
         print("STEP 2: Query Metrics (Executes on Databricks)")
         print("="*60)
-        result = await client.query_metrics(
+        frame = await client.query_frame(
             metrics=["total_revenue", "total_orders"],
             dimensions=["store__store_type"],
             limit=10
         )
         
         print("\nQuery Results from Databricks:")
-        if result and "data" in result:
-            for row in result["data"]:
-                store_type = row.get("store__store_type", "N/A")
-                revenue = row.get("total_revenue", 0)
-                orders = row.get("total_orders", 0)
-                print(f"  {store_type}: ${revenue:,.2f} revenue, {orders} orders")
+        for store_type, revenue, orders in zip(
+            frame.format("store__store_type", "text"),
+            frame.format("total_revenue", "currency"),
+            frame.format("total_orders", "integer"),
+        ):
+            print(f"  {store_type}: {revenue} revenue, {orders} orders")
         
         # Step 4: Get the SQL that was executed
         print("\n" + "="*60)
@@ -252,7 +427,7 @@ async def example_headless_bi_app():
         print("\n" + "="*60)
         print("STEP 4: Query with Filters")
         print("="*60)
-        result = await client.query_metrics(
+        frame = await client.query_frame(
             metrics=["completed_revenue"],
             dimensions=["order__order_date__month"],
             where="{{ TimeDimension('order__order_date__month') }} >= '2024-01'",
@@ -260,11 +435,7 @@ async def example_headless_bi_app():
         )
         
         print("\nCompleted Revenue by Month (from Databricks):")
-        if result and "data" in result:
-            for row in result["data"]:
-                month = row.get("order__order_date__month", "N/A")
-                revenue = row.get("completed_revenue", 0)
-                print(f"  {month}: ${revenue:,.2f}")
+        print(frame.to_text({"completed_revenue": "currency"}))
         
     except Exception as e:
         print(f"Error: {e}")
@@ -279,37 +450,29 @@ async def example_headless_bi_app():
 # ============================================================================
 
 async def generate_daily_report():
-    """Example: Automated daily report using MCP"""
-    
-    client = HeadlessBIClient()
+    """Example: Automated daily report using MCP (reuses the shared connection)"""
     
-    try:
-        await client.connect()
-        
+    async with HeadlessBIClient.shared() as client:
         # Query today's metrics
-        result = await client.query_metrics(
+        frame = await client.query_frame(
             metrics=["total_revenue", "total_orders", "average_order_value"],
             dimensions=["order__order_date__day"],
             where="{{ TimeDimension('order__order_date__day') }} = CURRENT_DATE",
             limit=1
         )
+    
+    # Process results
+    if len(frame) > 0:
+        print("Daily Report:")
+        print(f"  Revenue: {frame.format('total_revenue', 'currency')[0]}")
+        print(f"  Orders: {frame.format('total_orders', 'integer')[0]}")
+        print(f"  AOV: {frame.format('average_order_value', 'currency')[0]}")
         
-        # Process results
-        if result and "data" in result and len(result["data"]) > 0:
-            data = result["data"][0]
-            print("Daily Report:")
-            print(f"  Revenue: ${data.get('total_revenue', 0):,.2f}")
-            print(f"  Orders: {data.get('total_orders', 0)}")
-            print(f"  AOV: ${data.get('average_order_value', 0):,.2f}")
-            
-            # In production: Send email, save to file, etc.
-            return data
-        else:
-            print("No data for today")
-            return None
-            
-    finally:
-        await client.close()
+        # In production: Send email, save to file, etc.
+        return frame.rows()[0]
+    else:
+        print("No data for today")
+        return None
 
 
 # ============================================================================
@@ -317,33 +480,21 @@ async def generate_daily_report():
 # ============================================================================
 
 async def get_dashboard_data():
-    """Example: Get data for a real-time dashboard"""
+    """Example: Get data for a real-time dashboard (queries run concurrently)"""
     
-    client = HeadlessBIClient()
+    async with HeadlessBIClient.shared() as client:
+        revenue_by_store, conversions = await client.query_many([
+            # Revenue by store type
+            {"metrics": ["total_revenue"], "dimensions": ["store__store_type"]},
+            # Conversion rates
+            {"metrics": ["order_completion_rate", "credit_card_adoption_rate"]},
+        ], as_frames=True)
     
-    try:
-        await client.connect()
-        
-        # Get multiple metrics for dashboard
-        dashboard_data = {}
-        
-        # Revenue by store type
-        revenue_by_store = await client.query_metrics(
-            metrics=["total_revenue"],
-            dimensions=["store__store_type"]
-        )
-        dashboard_data["revenue_by_store"] = revenue_by_store
-        
-        # Conversion rates
-        conversions = await client.query_metrics(
-            metrics=["order_completion_rate", "credit_card_adoption_rate"]
-        )
-        dashboard_data["conversions"] = conversions
-        
-        return dashboard_data
-        
-    finally:
-        await client.close()
+    # Columnar payloads: {"columns": [...], "data": {column: [...]}}
+    return {
+        "revenue_by_store": revenue_by_store.to_dict(),
+        "conversions": conversions.to_dict(),
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+"""
+Local dbt Lineage Graph
+
+Loads target/manifest.json into a compact adjacency-list graph with integer
+node IDs so /dbt/models and /dbt/lineage can be answered without an MCP call:
+- upstream / downstream lineage, optionally depth-limited
+- transitive closure (depth=None)
+- memoized results, invalidated only when edges change
+
+When the manifest changes, nodes are diffed by checksum and dependencies, so
+only changed nodes are re-linked and node IDs stay stable across reloads.
+"""
+
+import json
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+MANIFEST = os.path.join("target", "manifest.json")
+MAX_MEMO_ENTRIES = 10_000               # memoized walks kept (oldest dropped first)
+
+LINEAGE_RESOURCE_TYPES = (
+    "model", "seed", "snapshot", "source", "exposure", "semantic_model", "metric",
+)
+
+SUMMARY_FIELDS = (
+    "name", "resource_type", "package_name", "schema", "database",
+    "description", "original_file_path", "tags",
+)
+
+
+def _node_signature(node: Dict[str, Any]) -> Tuple[Any, ...]:
+    """What decides whether a node must be re-linked or re-summarized."""
+    checksum = (node.get("checksum") or {}).get("checksum")
+    parents = tuple(sorted((node.get("depends_on") or {}).get("nodes") or []))
+    config = json.dumps(node.get("config") or {}, sort_keys=True, default=str)
+    return (checksum, parents, node.get("description"), config)
+
+
+def _node_summary(unique_id: str, node: Dict[str, Any]) -> Dict[str, Any]:
+    summary = {"unique_id": unique_id}
+    summary.update({key: node.get(key) for key in SUMMARY_FIELDS if key in node})
+    materialized = (node.get("config") or {}).get("materialized")
+    if materialized:
+        summary["materialized"] = materialized
+    return summary
+
+
+class LineageGraph:
+    """Adjacency lists over integer node IDs, with memoized lineage queries."""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}           # unique_id -> node id
+        self.unique_ids: List[str] = []         # node id -> unique_id
+        self.alive: List[bool] = []
+        self.parents: List[List[int]] = []
+        self.children: List[List[int]] = []
+        self.summaries: List[Optional[Dict[str, Any]]] = []
+        self.signatures: List[Optional[Tuple[Any, ...]]] = []
+        self.by_name: Dict[str, int] = {}       # model/seed/snapshot name -> node id
+        self._memo: Dict[Tuple[int, str, Optional[int]], Dict[int, int]] = {}
+
+    # -- building ----------------------------------------------------------
+
+    def _node_id(self, unique_id: str) -> int:
+        node_id = self.ids.get(unique_id)
+        if node_id is None:
+            node_id = len(self.unique_ids)
+            self.ids[unique_id] = node_id
+            self.unique_ids.append(unique_id)
+            self.alive.append(False)
+            self.parents.append([])
+            self.children.append([])
+            self.summaries.append(None)
+            self.signatures.append(None)
+        return node_id
+
+    def _set_parents(self, node_id: int, parent_ids: List[int]):
+        for old in self.parents[node_id]:
+            self.children[old].remove(node_id)
+        self.parents[node_id] = parent_ids
+        for parent in parent_ids:
+            self.children[parent].append(node_id)
+
+    def refresh(self, manifest: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Apply a (new) manifest, re-linking only added, changed or removed nodes.
+
+        Returns counts of what changed.
+        """
+        incoming: Dict[str, Dict[str, Any]] = {}
+        for section in ("nodes", "sources", "exposures", "metrics", "semantic_models"):
+            for unique_id, node in (manifest.get(section) or {}).items():
+                if node.get("resource_type") in LINEAGE_RESOURCE_TYPES:
+                    incoming[unique_id] = node
+
+        stats = {"added": 0, "changed": 0, "removed": 0}
+        edges_changed = False
+
+        for unique_id, node in incoming.items():
+            node_id = self._node_id(unique_id)
+            signature = _node_signature(node)
+            if self.alive[node_id] and self.signatures[node_id] == signature:
+                continue
+
+            stats["changed" if self.alive[node_id] else "added"] += 1
+            old_parents = self.signatures[node_id][1] if self.signatures[node_id] else None
+            self.alive[node_id] = True
+            self.signatures[node_id] = signature
+            self.summaries[node_id] = _node_summary(unique_id, node)
+            if signature[1] != old_parents:
+                parent_ids = [self._node_id(p) for p in signature[1]]
+                self._set_parents(node_id, parent_ids)
+                edges_changed = True
+
+        for node_id, unique_id in enumerate(self.unique_ids):
+            if self.alive[node_id] and unique_id not in incoming:
+                self.alive[node_id] = False
+                self.summaries[node_id] = None
+                self.signatures[node_id] = None
+                self._set_parents(node_id, [])
+                stats["removed"] += 1
+                edges_changed = True
+
+        self.by_name = {
+            summary["name"]: node_id
+            for node_id, summary in enumerate(self.summaries)
+            if summary and summary.get("resource_type") in ("model", "seed", "snapshot")
+        }
+        if edges_changed:
+            self._memo.clear()
+        return stats
+
+    # -- queries -----------------------------------------------------------
+
+    def resolve(self, name: str) -> Optional[int]:
+        """Look up a node by model name or unique_id."""
+        if name in self.by_name:
+            return self.by_name[name]
+        node_id = self.ids.get(name)
+        if node_id is not None and self.alive[node_id]:
+            return node_id
+        return None
+
+    def models(self) -> List[Dict[str, Any]]:
+        return [
+            summary
+            for summary in self.summaries
+            if summary and summary.get("resource_type") == "model"
+        ]
+
+    def walk(self, node_id: int, direction: str, depth: Optional[int] = None) -> Dict[int, int]:
+        """{node_id: distance} upstream or downstream; depth=None is the transitive closure."""
+        # No path is longer than the node count, so deeper walks are the closure
+        # (keeps user-supplied depths from adding memo entries without bound)
+        if depth is not None and depth >= len(self.unique_ids):
+            depth = None
+        key = (node_id, direction, depth)
+        if key in self._memo:
+            return self._memo[key]
+
+        edges = self.parents if direction == "upstream" else self.children
+        distances: Dict[int, int] = {}
+        queue = deque([(node_id, 0)])
+        while queue:
+            current, distance = queue.popleft()
+            if depth is not None and distance >= depth:
+                continue
+            for neighbour in edges[current]:
+                if neighbour not in distances and neighbour != node_id:
+                    distances[neighbour] = distance + 1
+                    queue.append((neighbour, distance + 1))
+
+        if len(self._memo) >= MAX_MEMO_ENTRIES:
+            self._memo.pop(next(iter(self._memo)))      # oldest first
+        self._memo[key] = distances
+        return distances
+
+    def describe(self, node_id: int, distance: Optional[int] = None) -> Dict[str, Any]:
+        summary = self.summaries[node_id] or {"unique_id": self.unique_ids[node_id]}
+        if distance is None:
+            return summary
+        return {**summary, "depth": distance}
+
+    def lineage(self, node_id: int, direction: str = "both", depth: Optional[int] = None) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"node": self.describe(node_id)}
+        for side in ("upstream", "downstream"):
+            if direction in (side, "both"):
+                walked = self.walk(node_id, side, depth)
+                result[side] = [
+                    self.describe(other, distance)
+                    for other, distance in sorted(
+                        walked.items(), key=lambda item: (item[1], self.unique_ids[item[0]])
+                    )
+                ]
+        return result
+
+    def model_details(self, node_id: int) -> Dict[str, Any]:
+        return {
+            **self.describe(node_id),
+            "depends_on": [self.unique_ids[p] for p in self.parents[node_id]],
+            "referenced_by": [self.unique_ids[c] for c in self.children[node_id]],
+        }
+
+
+# -----------------------------
+# Loading (incremental reload when the manifest changes)
+# -----------------------------
+
+_lineage_cache: Dict[str, Tuple[float, LineageGraph]] = {}
+
+
+def load_lineage_graph(project_dir: str) -> Optional[LineageGraph]:
+    """
+    Return the lineage graph for a dbt project, applying manifest changes
+    incrementally. Returns None if target/manifest.json does not exist.
+    """
+    path = os.path.join(project_dir, MANIFEST)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _lineage_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    graph = cached[1] if cached else LineageGraph()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠ Could not load dbt manifest: {e}")
+        return graph if cached else None
+
+    stats = graph.refresh(manifest)
+    print(f"✓ Lineage graph refreshed ({stats['added']} added, "
+          f"{stats['changed']} changed, {stats['removed']} removed)")
+    _lineage_cache[path] = (mtime, graph)
+    return graph
@@ -0,0 +1,456 @@
+"""
+Structured Metric Filters for MetricFlow Queries
+
+Replaces hand-built `{{ Dimension('x') }} = 'v'` strings with a small filter
+model that can be:
+- validated against the semantic catalog (known dimensions and their types)
+- normalized into a canonical order, so equivalent filters compare equal
+- rendered into MetricFlow where syntax
+
+The canonical form is also what every cache key is built from
+(see `query_cache_key`).
+
+Filter spec format (JSON / dict):
+    {"store__store_type": "Premium"}                      -> eq
+    {"order__order_status": ["completed", "shipped"]}     -> in
+    {"order__amount": {"gte": 10, "lt": 100}}             -> range
+    {"order__order_status": {"not": "returned"}}          -> not
+    {"customer__customer_region": None}                   -> is null
+    {"customer__customer_region": {"is_null": False}}     -> not is null
+    {"order__order_date__day": {"start": "2024-01-01",
+                                "end": "2024-02-01"}}     -> time range [start, end)
+"""
+
+import hashlib
+import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, List, Mapping, Optional, Tuple
+
+TIME_GRANULARITIES = ("day", "week", "month", "quarter", "year")
+
+# Approximate length of each granularity in days
+GRAIN_DAYS = {"day": 1, "week": 7, "month": 31, "quarter": 92, "year": 366}
+
+RANGE_OPERATORS = {"gte": ">=", "gt": ">", "lte": "<=", "lt": "<"}
+
+# Placeholder literal for a bind parameter in parameterized filters (see
+# MetricFilter.parameterized); zero-padded so sentinels sort like their values'
+# positions and never collide with real filter values
+PARAM_SENTINEL = "__mfparam_{:03d}__"
+
+
+class FilterError(ValueError):
+    """Raised when a filter spec is malformed or does not match the catalog."""
+
+
+# -----------------------------
+# Dimension References & Literals
+# -----------------------------
+
+def is_time_dimension(name: str, catalog: Optional[Mapping[str, str]] = None) -> bool:
+    """Return True if `name` refers to a time dimension."""
+    if catalog is not None and name in catalog:
+        return catalog[name] == "time"
+    if name == "metric_time" or name.startswith("metric_time__"):
+        return True
+    return name.rsplit("__", 1)[-1] in TIME_GRANULARITIES and name.count("__") >= 2
+
+
+def period_start(today: date, grain: str) -> str:
+    """Start of the period containing `today`, as an ISO date."""
+    if grain == "week":
+        today -= timedelta(days=today.weekday())
+    elif grain == "month":
+        today = today.replace(day=1)
+    elif grain == "quarter":
+        today = today.replace(month=3 * ((today.month - 1) // 3) + 1, day=1)
+    elif grain == "year":
+        today = today.replace(month=1, day=1)
+    return today.isoformat()
+
+
+def add_periods(day: date, grain: str, n: int) -> date:
+    """Bucket start `n` buckets after `day` (negative goes back)."""
+    if grain == "day":
+        return day + timedelta(days=n)
+    if grain == "week":
+        return day + timedelta(weeks=n)
+    months = {"month": 1, "quarter": 3, "year": 12}[grain] * n
+    index = day.year * 12 + day.month - 1 + months
+    return day.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def render_dimension(name: str, catalog: Optional[Mapping[str, str]] = None) -> str:
+    """Render a dimension reference in MetricFlow jinja syntax."""
+    if not is_time_dimension(name, catalog):
+        return f"{{{{ Dimension('{name}') }}}}"
+
+    base, _, grain = name.rpartition("__")
+    if base and grain in TIME_GRANULARITIES:
+        return f"{{{{ TimeDimension('{base}', '{grain}') }}}}"
+    return f"{{{{ TimeDimension('{name}') }}}}"
+
+
+def render_literal(value: Any) -> str:
+    """Render a Python value as a SQL literal (strings are quote-escaped)."""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise FilterError(f"Unsupported filter value type: {type(value).__name__}")
+
+
+def _normalize_value(value: Any) -> Any:
+    """Coerce a filter value into its canonical, JSON-friendly form."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise FilterError(f"Unsupported filter value type: {type(value).__name__}")
+
+
+def _value_sort_key(value: Any) -> Tuple[str, str]:
+    return (type(value).__name__, json.dumps(value))
+
+
+# -----------------------------
+# Filter Nodes
+# -----------------------------
+
+@dataclass(frozen=True)
+class Condition(ABC):
+    """Base class for a single filter condition on one dimension."""
+
+    dimension: str
+
+    op = ""
+
+    def operands(self) -> Tuple[Any, ...]:
+        return ()
+
+    def canonical(self) -> Tuple[Any, ...]:
+        """Canonical tuple form used for ordering, equality and cache keys."""
+        return (self.dimension, self.op, self.operands())
+
+    def normalized(self) -> "Condition":
+        return self
+
+    @abstractmethod
+    def render(self, catalog: Optional[Mapping[str, str]] = None) -> str:
+        """The condition in MetricFlow where syntax."""
+
+
+@dataclass(frozen=True)
+class Eq(Condition):
+    value: Any = None
+
+    op = "eq"
+
+    def operands(self):
+        return (self.value,)
+
+    def render(self, catalog=None):
+        return f"{render_dimension(self.dimension, catalog)} = {render_literal(self.value)}"
+
+
+@dataclass(frozen=True)
+class In(Condition):
+    values: Tuple[Any, ...] = ()
+
+    op = "in"
+
+    def operands(self):
+        return self.values
+
+    def normalized(self):
+        # Dedup on (type, value): set() would merge 1, 1.0 and True
+        unique = {_value_sort_key(v): v for v in self.values}
+        values = tuple(unique[key] for key in sorted(unique))
+        if not values:
+            raise FilterError(f"Empty IN list for dimension '{self.dimension}'")
+        if len(values) == 1:
+            return Eq(self.dimension, values[0])
+        return In(self.dimension, values)
+
+    def render(self, catalog=None):
+        literals = ", ".join(render_literal(v) for v in self.values)
+        return f"{render_dimension(self.dimension, catalog)} IN ({literals})"
+
+
+@dataclass(frozen=True)
+class Range(Condition):
+    gte: Any = None
+    gt: Any = None
+    lte: Any = None
+    lt: Any = None
+
+    op = "range"
+
+    def bounds(self) -> List[Tuple[str, Any]]:
+        return [
+            (key, getattr(self, key))
+            for key in RANGE_OPERATORS
+            if getattr(self, key) is not None
+        ]
+
+    def operands(self):
+        return tuple(self.bounds())
+
+    def normalized(self):
+        if not self.bounds():
+            raise FilterError(f"Range filter on '{self.dimension}' has no bounds")
+        if self.gte is not None and self.gt is not None:
+            raise FilterError(f"Range filter on '{self.dimension}' sets both gte and gt")
+        if self.lte is not None and self.lt is not None:
+            raise FilterError(f"Range filter on '{self.dimension}' sets both lte and lt")
+        return self
+
+    def render(self, catalog=None):
+        ref = render_dimension(self.dimension, catalog)
+        return " AND ".join(
+            f"{ref} {RANGE_OPERATORS[key]} {render_literal(value)}"
+            for key, value in self.bounds()
+        )
+
+
+@dataclass(frozen=True)
+class TimeRange(Condition):
+    """Half-open time range: start <= dimension < end."""
+
+    start: Any = None
+    end: Any = None
+
+    op = "time_range"
+
+    def operands(self):
+        return (self.start, self.end)
+
+    def normalized(self):
+        if self.start is None and self.end is None:
+            raise FilterError(f"Time range on '{self.dimension}' has no start or end")
+        for bound in (self.start, self.end):
+            if bound is not None and not isinstance(bound, str):
+                raise FilterError(
+                    f"Time range on '{self.dimension}' needs date/time strings, got {type(bound).__name__}"
+                )
+        if self.start is not None and self.end is not None and self.start >= self.end:
+            raise FilterError(f"Time range on '{self.dimension}' is empty (start >= end)")
+        return self
+
+    def render(self, catalog=None):
+        ref = render_dimension(self.dimension, catalog)
+        parts = []
+        if self.start is not None:
+            parts.append(f"{ref} >= {render_literal(self.start)}")
+        if self.end is not None:
+            parts.append(f"{ref} < {render_literal(self.end)}")
+        return " AND ".join(parts)
+
+
+@dataclass(frozen=True)
+class IsNull(Condition):
+    op = "is_null"
+
+    def render(self, catalog=None):
+        return f"{render_dimension(self.dimension, catalog)} IS NULL"
+
+
+@dataclass(frozen=True)
+class Not(Condition):
+    operand: Optional[Condition] = None
+
+    op = "not"
+
+    def operands(self):
+        return self.operand.canonical()
+
+    def normalized(self):
+        inner = self.operand.normalized()
+        if isinstance(inner, Not):
+            return inner.operand
+        return Not(self.dimension, inner)
+
+    def render(self, catalog=None):
+        return f"NOT ({self.operand.render(catalog)})"
+
+
+# -----------------------------
+# Filter Expression (conjunction)
+# -----------------------------
+
+@dataclass(frozen=True)
+class MetricFilter:
+    """A conjunction (AND) of conditions."""
+
+    conditions: Tuple[Condition, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.conditions)
+
+    @classmethod
+    def from_spec(cls, spec: Optional[Mapping[str, Any]]) -> "MetricFilter":
+        """Build a filter from a {dimension: value-or-operator-dict} mapping."""
+        if spec is None:
+            return cls()
+        if isinstance(spec, MetricFilter):
+            return spec
+        if not isinstance(spec, Mapping):
+            raise FilterError("Filters must be a JSON object of {dimension: condition}")
+        return cls(tuple(_parse_condition(str(k), v) for k, v in spec.items()))
+
+    @classmethod
+    def from_json(cls, text: Optional[str]) -> "MetricFilter":
+        if not text:
+            return cls()
+        try:
+            spec = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise FilterError(f"Filters are not valid JSON: {e}")
+        return cls.from_spec(spec)
+
+    def dimensions(self) -> List[str]:
+        return sorted({c.dimension for c in self.conditions})
+
+    def validate(self, catalog: Optional[Mapping[str, str]]) -> "MetricFilter":
+        """
+        Check every condition against the catalog ({dimension_name: type}).
+
+        Unknown dimensions and time ranges over non-time dimensions are rejected.
+        A catalog of None skips validation (e.g. manifest not available yet).
+        """
+        if catalog is None:
+            return self
+
+        unknown = [d for d in self.dimensions() if d not in catalog]
+        if unknown:
+            raise FilterError(f"Unknown filter dimension(s): {', '.join(unknown)}")
+
+        for condition in self.conditions:
+            inner = condition.operand if isinstance(condition, Not) else condition
+            if isinstance(inner, TimeRange) and catalog[inner.dimension] != "time":
+                raise FilterError(
+                    f"Time range filter requires a time dimension, "
+                    f"'{inner.dimension}' is {catalog[inner.dimension]}"
+                )
+        return self
+
+    def normalized(self) -> "MetricFilter":
+        """Return the canonical form: normalized conditions, deduplicated and sorted."""
+        unique = {}
+        for condition in self.conditions:
+            condition = condition.normalized()
+            unique[condition.canonical()] = condition
+        ordered = sorted(unique.items(), key=lambda item: json.dumps(item[0], default=str))
+        return MetricFilter(tuple(condition for _, condition in ordered))
+
+    def canonical(self) -> List[Any]:
+        return [c.canonical() for c in self.normalized().conditions]
+
+    def canonical_json(self) -> str:
+        return json.dumps(self.canonical(), separators=(",", ":"), default=str)
+
+    def to_where(self, catalog: Optional[Mapping[str, str]] = None) -> Optional[str]:
+        """Render the canonical filter as a MetricFlow where clause."""
+        conditions = self.normalized().conditions
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0].render(catalog)
+        return " AND ".join(f"({c.render(catalog)})" for c in conditions)
+
+    def parameterized(self) -> Tuple["MetricFilter", dict]:
+        """
+        Split the canonical filter into a shape and its string values.
+
+        Every string value is replaced by a PARAM_SENTINEL literal; returns
+        (template filter, {param name: value}). Filters that differ only in
+        those values share one template, which compiles to SQL once and is
+        executed with bind parameters (see warehouse.py).
+        """
+        params: dict = {}
+        conditions = tuple(_parameterize(c, params) for c in self.normalized().conditions)
+        return MetricFilter(conditions), params
+
+
+def _parameterize(condition: Condition, params: dict) -> Condition:
+    def sentinel(value):
+        if not isinstance(value, str):
+            return value
+        name = f"p{len(params)}"
+        params[name] = value
+        return PARAM_SENTINEL.format(len(params) - 1)
+
+    if isinstance(condition, Not):
+        return Not(condition.dimension, _parameterize(condition.operand, params))
+    if isinstance(condition, Eq):
+        return Eq(condition.dimension, sentinel(condition.value))
+    if isinstance(condition, In):
+        return In(condition.dimension, tuple(sentinel(v) for v in condition.values))
+    if isinstance(condition, Range):
+        return Range(condition.dimension, **{k: sentinel(v) for k, v in condition.bounds()})
+    if isinstance(condition, TimeRange):
+        return TimeRange(condition.dimension, sentinel(condition.start), sentinel(condition.end))
+    return condition
+
+
+def _parse_condition(dimension: str, value: Any) -> Condition:
+    if value is None:
+        return IsNull(dimension)
+    if isinstance(value, (list, tuple, set)):
+        return In(dimension, tuple(_normalize_value(v) for v in value))
+    if not isinstance(value, Mapping):
+        return Eq(dimension, _normalize_value(value))
+
+    keys = set(value)
+    if keys == {"eq"}:
+        return Eq(dimension, _normalize_value(value["eq"]))
+    if keys == {"in"}:
+        return _parse_condition(dimension, list(value["in"]))
+    if keys == {"not"}:
+        return Not(dimension, _parse_condition(dimension, value["not"]))
+    if keys == {"is_null"}:
+        return IsNull(dimension) if value["is_null"] else Not(dimension, IsNull(dimension))
+    if keys and keys <= {"start", "end"}:
+        return TimeRange(
+            dimension,
+            start=_normalize_value(value.get("start")),
+            end=_normalize_value(value.get("end")),
+        )
+    if keys and keys <= set(RANGE_OPERATORS):
+        return Range(dimension, **{k: _normalize_value(v) for k, v in value.items()})
+
+    raise FilterError(f"Unsupported filter operator(s) for '{dimension}': {sorted(keys)}")
+
+
+# -----------------------------
+# Cache Keys
+# -----------------------------
+
+def query_cache_key(
+    metrics: List[str],
+    dimensions: Optional[List[str]] = None,
+    filters: Optional[MetricFilter] = None,
+    **extra: Any,
+) -> str:
+    """
+    Stable cache key for a metric query.
+
+    Metric and dimension order do not change the result set, and filters are
+    keyed by their canonical form, so equivalent requests share one key.
+    """
+    payload = {
+        "metrics": sorted(set(metrics)),
+        "dimensions": sorted(set(dimensions or [])),
+        "filters": (filters or MetricFilter()).canonical(),
+        **{k: v for k, v in sorted(extra.items()) if v is not None},
+    }
+    encoded = json.dumps(payload, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
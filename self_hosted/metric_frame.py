@@ -0,0 +1,306 @@
+"""
+Columnar Metric Results
+
+`MetricFrame` holds a query result as typed NumPy columns instead of a list
+of per-row dicts:
+- numeric metrics -> float64 (int64 when integral without nulls, NaN for nulls)
+- time dimensions (`..__day`, `..__month`, ...) -> datetime64
+- other dimensions -> object arrays
+
+Rows are only materialized when asked for (`rows()`), formatting works on
+whole columns (`format()`), and conversion to pandas / Polars / Arrow hands
+the NumPy buffers over without copying where the target library allows it.
+
+Usage:
+    frame = await client.query_frame(metrics=["total_revenue"], dimensions=["store__store_type"])
+    for store, revenue in zip(frame["store__store_type"], frame.format("total_revenue", "currency")):
+        print(f"{store}: {revenue}")
+    df = frame.to_pandas()
+"""
+
+import json
+import warnings
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from metric_filters import is_time_dimension
+
+FORMAT_STYLES = ("number", "integer", "currency", "percent", "text")
+
+
+# -----------------------------
+# Decoding
+# -----------------------------
+
+class ResultDecodeError(ValueError):
+    """Raised when query output isn't JSON rows (e.g. an MCP error message)."""
+
+
+def _decode(result: Any) -> Any:
+    """Unwrap MCP content (TextContent items / their JSON dumps) and JSON strings."""
+    if isinstance(result, str):
+        if not result.strip():
+            return []
+        try:
+            loaded = json.loads(result)
+        except ValueError:
+            raise ResultDecodeError(f"Query result is not JSON: {result[:200]}")
+        return _decode(loaded)
+    if hasattr(result, "text") and not isinstance(result, dict):
+        return _decode(result.text)
+    if isinstance(result, dict) and result.get("type") == "text" and "text" in result:
+        return _decode(result["text"])
+    if isinstance(result, list) and result and (
+        hasattr(result[0], "text") or (isinstance(result[0], dict) and result[0].get("type") == "text")
+    ):
+        rows: List[Any] = []
+        for item in result:
+            decoded = _decode(item)
+            rows.extend(decoded if isinstance(decoded, list) else _decode_rows(decoded))
+        return rows
+    return result
+
+
+def _decode_rows(payload: Any) -> List[Dict[str, Any]]:
+    if isinstance(payload, dict):
+        data = payload.get("data")
+        if isinstance(data, list) and isinstance(payload.get("columns"), list) and data and isinstance(data[0], (list, tuple)):
+            names = payload["columns"]
+            return [dict(zip(names, values)) for values in data]
+        if isinstance(data, list):
+            return data
+        return []
+    if isinstance(payload, list):
+        return [row for row in payload if isinstance(row, dict)]
+    return []
+
+
+def _to_column(name: str, values: List[Any]) -> np.ndarray:
+    """Pick the tightest NumPy dtype for a column of JSON values."""
+    present = [v for v in values if v is not None]
+
+    if present and all(isinstance(v, bool) for v in present):
+        if len(present) == len(values):
+            return np.array(values, dtype=bool)
+        return np.array(values, dtype=object)
+
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        if len(present) == len(values) and all(isinstance(v, int) for v in present):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+    if present and is_time_dimension(name) and all(isinstance(v, str) for v in present):
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                return np.array(
+                    [v.rstrip("Z") if v is not None else "NaT" for v in values],
+                    dtype="datetime64[s]",
+                )
+        except ValueError:
+            pass
+
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+# -----------------------------
+# Formatting
+# -----------------------------
+
+def format_values(values: np.ndarray, style: str = "number", decimals: int = 2, missing: str = "N/A") -> np.ndarray:
+    """Format a whole column at once; NaN/None become `missing`."""
+    if style not in FORMAT_STYLES:
+        raise ValueError(f"Unknown format style '{style}' (expected one of {FORMAT_STYLES})")
+
+    if style == "text" or values.dtype.kind not in "biuf":
+        if values.dtype.kind == "M":
+            text = np.datetime_as_string(values, unit="D").astype(object)
+            text[np.isnat(values)] = missing
+            return text
+        return np.array([missing if v is None else str(v) for v in values.tolist()], dtype=object)
+
+    numbers = values.astype(np.float64, copy=False)
+    if style == "percent":
+        numbers = numbers * 100
+    if style == "integer":
+        decimals = 0
+    numbers = np.round(numbers, decimals)
+
+    spec = f"{{:,.{decimals}f}}"
+    if style == "currency":
+        text = np.array([spec.format(v) for v in np.abs(numbers).tolist()], dtype=object)
+        text = np.where(numbers < 0, "-$", "$").astype(object) + text
+    else:
+        text = np.array([spec.format(v) for v in numbers.tolist()], dtype=object)
+    if style == "percent":
+        text = text + "%"
+    text[np.isnan(numbers)] = missing
+    return text
+
+
+# -----------------------------
+# MetricFrame
+# -----------------------------
+
+class MetricFrame:
+    """A metric query result stored column-wise."""
+
+    def __init__(self, columns: Optional[Dict[str, np.ndarray]] = None):
+        self.columns: Dict[str, np.ndarray] = dict(columns or {})
+        lengths = {len(column) for column in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+        self._length = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict[str, Any]]) -> "MetricFrame":
+        names: Dict[str, None] = {}
+        for row in rows:
+            for name in row:
+                names.setdefault(name)
+        return cls({name: _to_column(name, [row.get(name) for row in rows]) for name in names})
+
+    @classmethod
+    def from_result(cls, result: Any) -> "MetricFrame":
+        """
+        Build a frame from query_metrics output (MCP content, {"data": rows}, rows, or JSON).
+
+        Raises ResultDecodeError for text that isn't JSON, so a failed query
+        doesn't pass for an empty result.
+        """
+        if isinstance(result, MetricFrame):
+            return result
+        return cls.from_rows(_decode_rows(_decode(result)))
+
+    # -- access --------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __repr__(self) -> str:
+        dtypes = ", ".join(f"{name}: {column.dtype}" for name, column in self.columns.items())
+        return f"MetricFrame({self._length} rows; {dtypes})"
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns)
+
+    def column(self, name: str, fill: Any = np.nan) -> np.ndarray:
+        """A column, or an array of `fill` if the result doesn't have it."""
+        if name in self.columns:
+            return self.columns[name]
+        return np.full(self._length, fill, dtype=np.float64 if isinstance(fill, float) else object)
+
+    def select(self, names: Sequence[str]) -> "MetricFrame":
+        return MetricFrame({name: self.columns[name] for name in names if name in self.columns})
+
+    def filter(self, mask: np.ndarray) -> "MetricFrame":
+        return MetricFrame({name: column[mask] for name, column in self.columns.items()})
+
+    def sort_by(self, name: str, descending: bool = False) -> "MetricFrame":
+        order = np.argsort(self.columns[name], kind="stable")
+        if descending:
+            order = order[::-1]
+        return MetricFrame({n: column[order] for n, column in self.columns.items()})
+
+    def head(self, n: int = 10) -> "MetricFrame":
+        return MetricFrame({name: column[:n] for name, column in self.columns.items()})
+
+    # -- rows (on demand) ----------------------------------------------
+
+    def iter_rows(self) -> Iterator[Dict[str, Any]]:
+        names = self.column_names
+        values = [_python_values(self.columns[name]) for name in names]
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return list(self.iter_rows())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly columnar payload: {"columns": [...], "data": {name: [...]}}"""
+        return {
+            "columns": self.column_names,
+            "data": {name: _python_values(column) for name, column in self.columns.items()},
+        }
+
+    # -- formatting ----------------------------------------------------
+
+    def format(self, name: str, style: str = "number", decimals: int = 2, missing: str = "N/A") -> np.ndarray:
+        return format_values(self.column(name), style, decimals, missing)
+
+    def to_text(self, styles: Optional[Dict[str, str]] = None, names: Optional[Sequence[str]] = None) -> str:
+        """Render an aligned text table; `styles` maps column -> format style."""
+        styles = styles or {}
+        names = list(names or self.column_names)
+        cells = [self.format(name, styles.get(name, _default_style(self.column(name)))) for name in names]
+        widths = [max([len(name)] + [len(cell) for cell in column]) for name, column in zip(names, cells)]
+
+        lines = ["  ".join(name.ljust(width) for name, width in zip(names, widths))]
+        lines.append("  ".join("-" * width for width in widths))
+        for row in zip(*cells):
+            lines.append("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+        return "\n".join(lines)
+
+    # -- interop -------------------------------------------------------
+
+    def to_pandas(self):
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("to_pandas() needs pandas: pip install pandas") from e
+        return pd.DataFrame(self.columns, copy=False)
+
+    def to_polars(self):
+        try:
+            import polars as pl
+        except ImportError as e:
+            raise ImportError("to_polars() needs polars: pip install polars") from e
+        return pl.DataFrame(
+            {name: column.tolist() if column.dtype == object else column for name, column in self.columns.items()}
+        )
+
+    def to_arrow(self):
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("to_arrow() needs pyarrow: pip install pyarrow") from e
+        return pa.table(
+            {
+                name: pa.array(column, from_pandas=column.dtype.kind == "f")
+                if column.dtype != object else pa.array(column.tolist())
+                for name, column in self.columns.items()
+            }
+        )
+
+
+def _default_style(column: np.ndarray) -> str:
+    if column.dtype.kind in "iu":
+        return "integer"
+    if column.dtype.kind == "f":
+        return "number"
+    return "text"
+
+
+def _python_values(column: np.ndarray) -> List[Any]:
+    """Column values as plain Python objects (NaN/NaT -> None, datetimes -> ISO strings)."""
+    if column.dtype.kind == "M":
+        valid = ~np.isnat(column)
+        midnight = (column[valid].astype("datetime64[D]") == column[valid]).all()
+        text = np.datetime_as_string(column, unit="D" if midnight else "s").astype(object)
+        text[np.isnat(column)] = None
+        return text.tolist()
+    if column.dtype.kind == "f":
+        values = column.astype(object)
+        values[np.isnan(column)] = None
+        return values.tolist()
+    return column.tolist()
@@ -0,0 +1,238 @@
+"""
+Period-over-Period Comparison
+
+"Revenue this month vs last month vs the same month last year" used to take
+one query_metrics call per period. `/api/query?compare=...` answers it with
+one query:
+
+1. the base periods are the buckets of the query's time dimension
+   (`metric_time__month`, `order__order_date__week`, ...) selected by its time
+   filter (a range, a single bucket or a list of buckets)
+2. every base bucket is shifted by each requested offset:
+
+       previous_period   one bucket back (month over month, week over week, ...)
+       year_over_year    one year back (52 weeks at week grain, so weekdays line up)
+       <n>_periods       n buckets back
+
+3. the time filter is replaced by the union of the base and shifted buckets
+   (an IN list on the time dimension), so a single scan covers every period;
+   it runs through the query cache like any other query
+4. the rows are pivoted: each base row gets the value at every offset plus
+   the delta and percent change
+
+Percent changes are null when the earlier value is missing or zero.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from metric_filters import (
+    TIME_GRANULARITIES, Eq, In, MetricFilter, Range, TimeRange, add_periods, is_time_dimension, period_start,
+)
+from metric_frame import MetricFrame
+
+MAX_COMPARISON_BUCKETS = int(os.environ.get("MAX_COMPARISON_BUCKETS", 1000))
+
+OFFSET_ALIASES = {"previous_period": 1, "previous": 1, "pop": 1}
+YEAR_ALIASES = {"year_over_year", "yoy"}
+BUCKETS_PER_YEAR = {"week": 52, "month": 12, "quarter": 4, "year": 1}
+
+_N_PERIODS = re.compile(r"^(\d+)_periods?$")
+
+
+class ComparisonError(ValueError):
+    """Raised when a comparison can't be planned from the query."""
+
+
+# -----------------------------
+# Bucket Arithmetic
+# -----------------------------
+
+@dataclass(frozen=True)
+class ComparisonOffset:
+    name: str
+    periods: int = 0            # buckets back
+    years: int = 0              # calendar years back (day grain)
+
+    def shift(self, day: date, grain: str) -> date:
+        if self.years:
+            if grain == "day":
+                try:
+                    return day.replace(year=day.year - self.years)
+                except ValueError:      # Feb 29
+                    return day.replace(year=day.year - self.years, day=28)
+            return add_periods(day, grain, -self.years * BUCKETS_PER_YEAR[grain])
+        return add_periods(day, grain, -self.periods)
+
+
+def parse_offset(spec: str) -> ComparisonOffset:
+    name = str(spec).strip().lower()
+    if name in OFFSET_ALIASES:
+        return ComparisonOffset("previous_period", periods=OFFSET_ALIASES[name])
+    if name in YEAR_ALIASES:
+        return ComparisonOffset("year_over_year", years=1)
+    match = _N_PERIODS.match(name)
+    if match and int(match.group(1)) > 0:
+        return ComparisonOffset(f"{int(match.group(1))}_periods", periods=int(match.group(1)))
+    raise ComparisonError(
+        f"Unknown comparison '{spec}' (expected previous_period, year_over_year or <n>_periods)"
+    )
+
+
+def _bucket(value: Any, grain: str) -> date:
+    return date.fromisoformat(period_start(date.fromisoformat(str(value)[:10]), grain))
+
+
+# -----------------------------
+# Planning
+# -----------------------------
+
+@dataclass
+class ComparisonPlan:
+    dimension: str                      # the time dimension compared along
+    grain: str
+    offsets: List[ComparisonOffset]
+    base_buckets: List[date]
+    buckets: List[date]                 # base + shifted, queried in one scan
+    metric_filter: MetricFilter         # the query's filter with the time filter replaced
+    shifted: Dict[str, Dict[date, date]] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "dimension": self.dimension,
+            "grain": self.grain,
+            "offsets": [o.name for o in self.offsets],
+            "base_periods": [b.isoformat() for b in self.base_buckets],
+            "periods_queried": len(self.buckets),
+        }
+
+
+def _time_dimension(dimensions: List[str]) -> Tuple[str, str]:
+    grained = [
+        d for d in dimensions
+        if is_time_dimension(d) and d.rsplit("__", 1)[-1] in TIME_GRANULARITIES
+    ]
+    if len(grained) != 1:
+        raise ComparisonError(
+            "Comparisons need exactly one time dimension with a grain in dimensions "
+            "(e.g. metric_time__month)"
+        )
+    return grained[0], grained[0].rsplit("__", 1)[-1]
+
+
+def _base_buckets(metric_filter: MetricFilter, dimension: str, grain: str) -> List[date]:
+    """Buckets selected by the time filter on `dimension`."""
+    conditions = [c for c in metric_filter.conditions if c.dimension == dimension]
+    if len(conditions) != 1:
+        raise ComparisonError(f"Comparisons need one time filter on {dimension} selecting the base periods")
+    condition = conditions[0]
+
+    if isinstance(condition, Eq):
+        return [_bucket(condition.value, grain)]
+    if isinstance(condition, In):
+        return sorted({_bucket(v, grain) for v in condition.values})
+
+    if isinstance(condition, TimeRange):
+        start, end, end_inclusive = condition.start, condition.end, False
+    elif isinstance(condition, Range) and condition.gt is None:
+        start = condition.gte
+        end, end_inclusive = (condition.lte, True) if condition.lte is not None else (condition.lt, False)
+    else:
+        raise ComparisonError(f"Unsupported time filter on {dimension} for comparisons")
+    if start is None or end is None:
+        raise ComparisonError(f"The time filter on {dimension} needs both a start and an end")
+
+    first = _bucket(start, grain)
+    stop = date.fromisoformat(str(end)[:10])
+    buckets = []
+    day = first
+    while day < stop or (end_inclusive and day == stop):
+        buckets.append(day)
+        if len(buckets) > MAX_COMPARISON_BUCKETS:
+            raise ComparisonError(f"Too many {grain} periods to compare (max {MAX_COMPARISON_BUCKETS})")
+        day = add_periods(day, grain, 1)
+    if not buckets:
+        raise ComparisonError(f"The time filter on {dimension} selects no {grain} periods")
+    return buckets
+
+
+def plan_comparison(
+    dimensions: Optional[List[str]],
+    metric_filter: Optional[MetricFilter],
+    offsets: List[str],
+) -> ComparisonPlan:
+    """Work out the base periods, the shifted periods and the single query covering them."""
+    metric_filter = metric_filter or MetricFilter()
+    dimension, grain = _time_dimension(list(dimensions or []))
+    parsed = list({o.name: o for o in (parse_offset(s) for s in offsets)}.values())
+    base = _base_buckets(metric_filter, dimension, grain)
+
+    shifted = {o.name: {b: o.shift(b, grain) for b in base} for o in parsed}
+    buckets = sorted(set(base).union(*(set(m.values()) for m in shifted.values())))
+    if len(buckets) > MAX_COMPARISON_BUCKETS:
+        raise ComparisonError(f"Too many {grain} periods to compare (max {MAX_COMPARISON_BUCKETS})")
+
+    others = tuple(c for c in metric_filter.conditions if c.dimension != dimension)
+    union = In(dimension, tuple(b.isoformat() for b in buckets)).normalized()
+    return ComparisonPlan(
+        dimension=dimension,
+        grain=grain,
+        offsets=parsed,
+        base_buckets=base,
+        buckets=buckets,
+        metric_filter=MetricFilter(others + (union,)),
+        shifted=shifted,
+    )
+
+
+# -----------------------------
+# Pivot
+# -----------------------------
+
+def compare_rows(
+    plan: ComparisonPlan,
+    result: Any,
+    metrics: List[str],
+    dimensions: List[str],
+) -> List[Dict[str, Any]]:
+    """
+    One row per base period and slice: the metric values, and per offset the
+    earlier value, the delta and the percent change.
+    """
+    names = {name.lower(): name for name in list(dimensions) + list(metrics)}
+    slices = [d for d in dimensions if d != plan.dimension]
+
+    indexed: Dict[Tuple[Any, ...], Dict[date, Dict[str, Any]]] = {}
+    for raw in MetricFrame.from_result(result).iter_rows():
+        row = {names.get(k.lower(), k): v for k, v in raw.items()}
+        if row.get(plan.dimension) is None:
+            continue
+        key = tuple(row.get(d) for d in slices)
+        indexed.setdefault(key, {})[_bucket(row[plan.dimension], plan.grain)] = row
+
+    base = set(plan.base_buckets)
+    rows = []
+    for key, periods in indexed.items():
+        for bucket in sorted(b for b in periods if b in base):
+            current = periods[bucket]
+            out: Dict[str, Any] = {d: v for d, v in zip(slices, key)}
+            out[plan.dimension] = bucket.isoformat()
+            for metric in metrics:
+                value = current.get(metric)
+                out[metric] = value
+                for offset in plan.offsets:
+                    earlier = plan.shifted[offset.name][bucket]
+                    before = (periods.get(earlier) or {}).get(metric)
+                    delta = value - before if value is not None and before is not None else None
+                    out[f"{metric}__{offset.name}"] = before
+                    out[f"{metric}__{offset.name}__delta"] = delta
+                    out[f"{metric}__{offset.name}__pct_change"] = (
+                        delta / abs(before) if delta is not None and before else None
+                    )
+            rows.append(out)
+
+    rows.sort(key=lambda r: (r[plan.dimension], [str(r.get(d)) for d in slices]))
+    return rows
@@ -0,0 +1,301 @@
+"""
+Multi-Project Registry for dbt-MCP Backends
+
+headless_bi_fastapi_mcp.py serves every dbt project listed in projects.yml.
+Each project gets its own dbt-MCP stdio subprocess (its "backend"):
+
+- a request picks its project by URL prefix (`/projects/<name>/metrics`) or
+  the `X-Dbt-Project` header, else the default project
+- a backend starts lazily on the first request for its project
+- at most MAX_MCP_BACKENDS backends run at once, and their declared
+  `memory_mb` may not add up to more than MAX_MCP_MEMORY_MB; starting one past
+  either cap stops the least recently used idle backends (no calls in flight).
+  If every running backend is busy, the request waits up to
+  MCP_ACQUIRE_TIMEOUT seconds for one to become idle, then gets a 503
+- backends idle for MCP_IDLE_SECONDS are stopped by a background sweep
+
+Without projects.yml (see projects.yml.example) the registry serves a single
+default project, configured by the server (DBT_PROJECT_DIR / DBT_PROFILES_DIR /
+DBT_PATH).
+"""
+
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import yaml
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from server_stats import stats
+
+PROJECTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "projects.yml")
+
+MAX_MCP_BACKENDS = int(os.environ.get("MAX_MCP_BACKENDS", 2))
+MAX_MCP_MEMORY_MB = int(os.environ.get("MAX_MCP_MEMORY_MB", 4096))
+MCP_IDLE_SECONDS = int(os.environ.get("MCP_IDLE_SECONDS", 900))
+MCP_ACQUIRE_TIMEOUT = float(os.environ.get("MCP_ACQUIRE_TIMEOUT", 30))
+MCP_INIT_TIMEOUT_SECONDS = 900  # 15 minutes (first run)
+DEFAULT_MEMORY_MB = 1024
+
+
+class ProjectError(Exception):
+    """Unknown project, or no backend capacity within the acquire timeout."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+@dataclass
+class ProjectConfig:
+    name: str
+    project_dir: str
+    profiles_dir: str
+    dbt_path: str
+    memory_mb: int = DEFAULT_MEMORY_MB      # expected resident size of its dbt-MCP process
+
+
+# -----------------------------
+# Backend (one dbt-MCP subprocess)
+# -----------------------------
+
+class Backend:
+    def __init__(self, project: ProjectConfig):
+        self.project = project
+        self.session: Optional[ClientSession] = None
+        self.transport = None
+        self.active = False             # holds a slot (starting or running)
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        self.started_at: Optional[float] = None
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """Start and initialize dbt-MCP for this project (no-op when running)."""
+        async with self._start_lock:
+            if self.session:
+                return
+            server_params = StdioServerParameters(
+                command=sys.executable,
+                args=["-m", "dbt_mcp.main"],
+                env={
+                    "DBT_PROJECT_DIR": self.project.project_dir,
+                    "DBT_PROFILES_DIR": self.project.profiles_dir,
+                    "DBT_PATH": self.project.dbt_path,
+                },
+            )
+            print(f"Connecting to dbt-MCP server for project '{self.project.name}'...")
+            transport = stdio_client(server_params)
+            read_stream, write_stream = await transport.__aenter__()
+            session = ClientSession(read_stream, write_stream)
+            try:
+                print("Initializing MCP session (first run may take several minutes)...")
+                await asyncio.wait_for(session.initialize(), timeout=MCP_INIT_TIMEOUT_SECONDS)
+            except BaseException:
+                await transport.__aexit__(None, None, None)
+                raise
+            self.transport, self.session = transport, session
+            self.started_at = time.monotonic()
+            print(f"✓ dbt-MCP connected and ready ({self.project.name})")
+
+    async def stop(self):
+        """Shut the subprocess down."""
+        async with self._start_lock:
+            transport, self.transport, self.session = self.transport, None, None
+            self.started_at = None
+            if transport:
+                await transport.__aexit__(None, None, None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "running": self.session is not None,
+            "in_flight": self.in_flight,
+            "memory_mb": self.project.memory_mb,
+            "idle_seconds": round(now - self.last_used, 1) if self.active and not self.in_flight else None,
+            "uptime_seconds": round(now - self.started_at, 1) if self.started_at else None,
+        }
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+
+class ProjectRegistry:
+    """Routes requests to per-project backends under global process / memory caps."""
+
+    def __init__(
+        self,
+        projects: List[ProjectConfig],
+        default: Optional[str] = None,
+        max_backends: int = MAX_MCP_BACKENDS,
+        max_memory_mb: int = MAX_MCP_MEMORY_MB,
+        idle_seconds: int = MCP_IDLE_SECONDS,
+        acquire_timeout: float = MCP_ACQUIRE_TIMEOUT,
+    ):
+        if not projects:
+            raise ValueError("at least one project is required")
+        self.backends: Dict[str, Backend] = {p.name: Backend(p) for p in projects}
+        self.default = default or projects[0].name
+        self.max_backends = max(1, max_backends)
+        self.max_memory_mb = max_memory_mb
+        self.idle_seconds = idle_seconds
+        self.acquire_timeout = acquire_timeout
+        self._changed = asyncio.Condition()
+
+        for project in projects:
+            if project.memory_mb > max_memory_mb:
+                print(f"⚠ Project '{project.name}' declares {project.memory_mb} MB, over MAX_MCP_MEMORY_MB; "
+                      "it will only run alone")
+
+    @classmethod
+    def from_file(cls, fallback: ProjectConfig, path: str = PROJECTS_FILE) -> "ProjectRegistry":
+        """Projects from projects.yml, or just `fallback` when the file is missing."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = yaml.safe_load(f) or {}
+        except OSError:
+            return cls([fallback])
+
+        projects = [
+            ProjectConfig(
+                name=entry["name"],
+                project_dir=entry["project_dir"],
+                profiles_dir=entry.get("profiles_dir", entry["project_dir"]),
+                dbt_path=entry.get("dbt_path", fallback.dbt_path),
+                memory_mb=int(entry.get("memory_mb", DEFAULT_MEMORY_MB)),
+            )
+            for entry in raw.get("projects", [])
+        ]
+        return cls(projects or [fallback], default=raw.get("default"))
+
+    # -- lookup ------------------------------------------------------------
+
+    def project(self, name: Optional[str] = None) -> ProjectConfig:
+        backend = self.backends.get(name or self.default)
+        if backend is None:
+            raise ProjectError(404, f"Unknown dbt project '{name}' (known: {', '.join(sorted(self.backends))})")
+        return backend.project
+
+    # -- capacity ------------------------------------------------------------
+
+    def _room_for(self, backend: Backend) -> Optional[List[Backend]]:
+        """Idle backends to stop so `backend` fits under the caps, or None if it can't fit yet."""
+        active = [b for b in self.backends.values() if b.active]
+        memory = sum(b.project.memory_mb for b in active)
+        idle = sorted((b for b in active if b.in_flight == 0), key=lambda b: b.last_used)
+
+        victims: List[Backend] = []
+        while len(active) - len(victims) >= self.max_backends or (
+            memory + backend.project.memory_mb > self.max_memory_mb and len(active) > len(victims)
+        ):
+            if not idle:
+                return None
+            victim = idle.pop(0)
+            victims.append(victim)
+            memory -= victim.project.memory_mb
+        return victims
+
+    async def _stop(self, backends: List[Backend], reason: str):
+        for backend in backends:
+            print(f"  Stopping dbt-MCP for '{backend.project.name}' ({reason})")
+            stats.increment("mcp_backends", event=reason, project=backend.project.name)
+            try:
+                await backend.stop()
+            except Exception as e:
+                print(f"⚠ Error stopping dbt-MCP for '{backend.project.name}': {e}")
+
+    @asynccontextmanager
+    async def session(self, name: Optional[str] = None) -> AsyncIterator[ClientSession]:
+        """The project's MCP session, starting its backend (and evicting others) if needed."""
+        backend = self.backends[self.project(name).name]
+        victims: List[Backend] = []
+        deadline = time.monotonic() + self.acquire_timeout
+
+        async with self._changed:
+            while not backend.active:
+                room = self._room_for(backend)
+                if room is not None:
+                    for victim in room:
+                        victim.active = False
+                    victims = room
+                    backend.active = True
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=max(remaining, 0))
+                except asyncio.TimeoutError:
+                    stats.increment("mcp_backends", event="busy", project=backend.project.name)
+                    running = sum(1 for b in self.backends.values() if b.active)
+                    raise ProjectError(
+                        503,
+                        f"All {running} running dbt-MCP backends are busy; try again shortly",
+                        retry_after=max(1, int(self.acquire_timeout)),
+                    )
+            backend.in_flight += 1
+
+        try:
+            await self._stop(victims, "evict")
+            if backend.session is None:
+                stats.increment("mcp_backends", event="start", project=backend.project.name)
+                await backend.start()
+        except BaseException:
+            async with self._changed:
+                backend.in_flight -= 1
+                if backend.session is None and backend.in_flight == 0:
+                    backend.active = False
+                self._changed.notify_all()
+            raise
+
+        try:
+            yield backend.session
+        finally:
+            async with self._changed:
+                backend.in_flight -= 1
+                backend.last_used = time.monotonic()
+                self._changed.notify_all()
+
+    # -- idle eviction -------------------------------------------------------
+
+    async def stop_idle(self) -> int:
+        """Stop backends idle for longer than idle_seconds; returns how many."""
+        cutoff = time.monotonic() - self.idle_seconds
+        async with self._changed:
+            idle = [b for b in self.backends.values() if b.active and b.in_flight == 0 and b.last_used < cutoff]
+            for backend in idle:
+                backend.active = False
+            self._changed.notify_all()
+        await self._stop(idle, "idle")
+        return len(idle)
+
+    async def run_forever(self):
+        """Background sweep for idle backends."""
+        while True:
+            await asyncio.sleep(max(1, min(60, self.idle_seconds // 4)))
+            await self.stop_idle()
+
+    async def close(self):
+        async with self._changed:
+            running = [b for b in self.backends.values() if b.active or b.session]
+            for backend in running:
+                backend.active = False
+        await self._stop(running, "shutdown")
+
+    def snapshot(self) -> Dict[str, Any]:
+        active = [b for b in self.backends.values() if b.active]
+        return {
+            "default": self.default,
+            "max_backends": self.max_backends,
+            "max_memory_mb": self.max_memory_mb,
+            "idle_seconds": self.idle_seconds,
+            "running": len(active),
+            "memory_mb": sum(b.project.memory_mb for b in active),
+            "projects": {name: b.to_dict() for name, b in self.backends.items()},
+        }
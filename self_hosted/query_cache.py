@@ -0,0 +1,310 @@
+"""
+Two-Tier Server Query Cache
+
+Different semantic requests often compile to the same SQL (metric components,
+equivalent filters written differently). Caching only by the semantic request
+misses those, so the server caches in two tiers:
+
+    semantic key (metric_filters.query_cache_key)  ->  compiled SQL      (SQL tier)
+      (valid for the semantic manifest it was compiled against)
+    normalized SQL hash + limit + data version     ->  query result      (result tier)
+      (+ bound parameter values for SQL templates, see warehouse.py)
+
+A request first resolves its compiled SQL (one MCP compile on a miss, cached
+afterwards), then looks the result up by the SQL's hash; equivalent requests
+share one warehouse result. Execution still goes through MCP query_metrics.
+
+The data version token changes whenever dbt rebuilds the project
+(target/run_results.json) or the semantic manifest changes, so results never
+outlive the data they were computed from; compiled SQL is likewise dropped
+when the manifest hash changes (a metric, measure or join was redefined).
+Concurrent misses for the same key
+are coalesced into one compile / execution.
+
+Disable with QUERY_CACHE=false.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from client_cache import manifest_hash, to_jsonable
+from server_stats import stats
+
+QUERY_CACHE = os.environ.get("QUERY_CACHE", "true").lower() == "true"
+
+RUN_RESULTS = os.path.join("target", "run_results.json")
+
+SQL_TTL_SECONDS = int(os.environ.get("QUERY_CACHE_SQL_TTL", 24 * 3600))
+RESULT_TTL_SECONDS = int(os.environ.get("QUERY_CACHE_RESULT_TTL", 3600))
+MAX_RESULT_BYTES = int(os.environ.get("QUERY_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+MAX_SQL_ENTRIES = 10_000
+
+
+# -----------------------------
+# SQL Normalization
+# -----------------------------
+
+_STRING_OR_IDENT = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`)")
+_LINE_COMMENT = re.compile(r"--[^\n]*")
+_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_WHITESPACE = re.compile(r"\s+")
+_SUBQUERY_ALIAS = re.compile(r"\bsubq_\d+\b")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical SQL text for hashing: comments removed, whitespace collapsed,
+    keywords/identifiers lower-cased outside quoted literals, MetricFlow's
+    generated subquery aliases (subq_N) renumbered by first appearance.
+    """
+    parts = _STRING_OR_IDENT.split(sql)
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2:                                   # quoted literal / identifier: keep as is
+            normalized.append(part)
+            continue
+        part = _BLOCK_COMMENT.sub(" ", _LINE_COMMENT.sub(" ", part))
+        normalized.append(_WHITESPACE.sub(" ", part).lower())
+    text = "".join(normalized).strip().rstrip(";").strip()
+
+    aliases: Dict[str, str] = {}
+    return _SUBQUERY_ALIAS.sub(
+        lambda m: aliases.setdefault(m.group(0), f"subq_{len(aliases)}"), text
+    )
+
+
+def sql_hash(sql: str) -> str:
+    return hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()
+
+
+# dbt commands that rebuild warehouse data; other commands (compile, test, docs)
+# also rewrite run_results.json but leave cached results valid
+DATA_COMMANDS = {"run", "build", "seed", "snapshot"}
+
+_run_versions: Dict[str, Tuple[float, str]] = {}
+
+
+def load_run_results(project_dir: str) -> Optional[Dict[str, Any]]:
+    """target/run_results.json of the last dbt invocation, or None."""
+    try:
+        with open(os.path.join(project_dir, RUN_RESULTS), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def data_version(project_dir: str) -> str:
+    """Token that changes when dbt rebuilds models or the semantic manifest changes."""
+    path = os.path.join(project_dir, RUN_RESULTS)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return f"no-run:{manifest_hash(project_dir)[:16]}"
+
+    cached = _run_versions.get(path)
+    if not cached or cached[0] != mtime:
+        run_results = load_run_results(project_dir) or {}
+        command = (run_results.get("args") or {}).get("which")
+        if cached and command and command not in DATA_COMMANDS:
+            version = cached[1]
+        else:
+            version = (run_results.get("metadata") or {}).get("generated_at", str(mtime))
+        cached = (mtime, version)
+        _run_versions[path] = cached
+    return f"{cached[1]}:{manifest_hash(project_dir)[:16]}"
+
+
+# -----------------------------
+# Cache
+# -----------------------------
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    size: int = 0
+
+
+class QueryCache:
+    """In-memory SQL tier + result tier with TTLs, LRU eviction and miss coalescing."""
+
+    def __init__(
+        self,
+        sql_ttl_seconds: int = SQL_TTL_SECONDS,
+        result_ttl_seconds: int = RESULT_TTL_SECONDS,
+        max_result_bytes: int = MAX_RESULT_BYTES,
+        max_sql_entries: int = MAX_SQL_ENTRIES,
+    ):
+        self.sql_ttl_seconds = sql_ttl_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_result_bytes = max_result_bytes
+        self.max_sql_entries = max_sql_entries
+        self._sql: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._results: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._result_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    # -- tiers -----------------------------------------------------------
+
+    @staticmethod
+    def _get(store: "OrderedDict[str, _Entry]", key: str) -> Optional[_Entry]:
+        entry = store.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.time():
+            return None
+        store.move_to_end(key)
+        return entry
+
+    def _put_sql(self, key: str, sql: str, manifest: str = ""):
+        self._sql[key] = _Entry((sql, sql_hash(sql), manifest), time.time() + self.sql_ttl_seconds)
+        self._sql.move_to_end(key)
+        while len(self._sql) > self.max_sql_entries:
+            self._sql.popitem(last=False)
+
+    def _put_result(self, key: str, value: Any):
+        size = len(json.dumps(to_jsonable(value), default=str))
+        if size > self.max_result_bytes:
+            return
+        old = self._results.pop(key, None)
+        if old:
+            self._result_bytes -= old.size
+        self._results[key] = _Entry(value, time.time() + self.result_ttl_seconds, size)
+        self._result_bytes += size
+        while self._result_bytes > self.max_result_bytes and self._results:
+            _, evicted = self._results.popitem(last=False)
+            self._result_bytes -= evicted.size
+        stats.set_gauge("query_cache_result_bytes", self._result_bytes)
+        stats.set_gauge("query_cache_result_entries", len(self._results))
+
+    async def _single_flight(self, key: str, produce: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `produce` once per key; concurrent callers await the same result.
+
+        `produce` runs in its own task, so a caller that is cancelled (client
+        disconnect) only stops waiting: the others still get the result.
+        """
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(produce())
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda task: self._flight_done(key, task))
+        return await asyncio.shield(pending)
+
+    def _flight_done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()        # mark retrieved; waiters re-raise it themselves
+
+    # -- lookup ----------------------------------------------------------
+
+    async def compiled_sql(
+        self,
+        semantic_key: str,
+        compile_sql: Callable[[], Awaitable[str]],
+        manifest: str = "",
+    ) -> Tuple[str, str, bool]:
+        """
+        (compiled SQL, its normalized hash, hit?) for a semantic request.
+
+        `manifest` is the semantic manifest hash (client_cache.manifest_hash);
+        SQL compiled against a different manifest counts as a miss.
+        """
+        entry = self._get(self._sql, semantic_key)
+        if entry is not None and entry.value[2] == manifest:
+            stats.increment("query_cache_hits", tier="sql")
+            sql, digest, _ = entry.value
+            return sql, digest, True
+
+        stats.increment("query_cache_misses", tier="sql")
+
+        async def produce():
+            sql = await compile_sql()
+            if sql:
+                self._put_sql(semantic_key, sql, manifest)
+            return sql
+
+        sql = await self._single_flight(f"sql:{semantic_key}:{manifest}", produce)
+        return sql, sql_hash(sql) if sql else "", False
+
+    async def fetch(
+        self,
+        semantic_key: str,
+        compile_sql: Callable[[], Awaitable[str]],
+        execute: Callable[[], Awaitable[Any]],
+        version: str,
+        limit: Optional[int] = None,
+        manifest: str = "",
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Result for a semantic request: semantic key -> compiled SQL -> result.
+
+        Returns (result, cache info). If compilation fails the query is
+        executed uncached.
+        """
+        start = time.perf_counter()
+        try:
+            sql, digest, sql_hit = await self.compiled_sql(semantic_key, compile_sql, manifest)
+        except Exception as e:
+            print(f"⚠ Query cache: compile failed ({type(e).__name__}: {e}); executing uncached")
+            sql, digest, sql_hit = "", "", False
+        if not digest:
+            return await execute(), {"sql": "unavailable", "result": "bypass"}
+
+        value, result_hit = await self.result(digest, execute, version, limit)
+        if result_hit:
+            stats.observe("query_cache_lookup_ms", (time.perf_counter() - start) * 1000)
+        return value, {
+            "sql": "hit" if sql_hit else "miss",
+            "result": "hit" if result_hit else "miss",
+            "sql_hash": digest[:16],
+        }
+
+    async def result(
+        self,
+        digest: str,
+        execute: Callable[[], Awaitable[Any]],
+        version: str,
+        limit: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[Any, bool]:
+        """(result, hit?) from the result tier for a SQL hash and its bound parameters."""
+        result_key = f"{digest}:{limit}:{version}"
+        if params:
+            result_key += ":" + json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+
+        entry = self._get(self._results, result_key)
+        if entry is not None:
+            stats.increment("query_cache_hits", tier="result")
+            return entry.value, True
+
+        stats.increment("query_cache_misses", tier="result")
+
+        async def produce():
+            value = await execute()
+            self._put_result(result_key, value)
+            return value
+
+        return await self._single_flight(f"result:{result_key}", produce), False
+
+    def clear(self):
+        self._sql.clear()
+        self._results.clear()
+        self._result_bytes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": QUERY_CACHE,
+            "sql_entries": len(self._sql),
+            "result_entries": len(self._results),
+            "result_bytes": self._result_bytes,
+            "max_result_bytes": self.max_result_bytes,
+        }
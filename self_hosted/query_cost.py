@@ -0,0 +1,392 @@
+"""
+Query Cost Estimation
+
+Estimates what a metric query will cost before it reaches MCP / the warehouse,
+from the semantic graph plus statistics gathered from the marts:
+
+- rows scanned:  row count of each measure model, scaled down by the requested
+                 time range vs the model's data range, plus joined models
+- groups:        product of the requested dimensions' cardinalities (distinct
+                 values, or periods in the time range for time dimensions)
+- rows returned: groups capped by `limit`
+
+Statistics live in target/dimension_stats.json and are gathered with:
+
+    python query_cost.py --collect
+
+(one `dbt show` query per semantic model: row count, distinct values per
+categorical dimension, min/max per time dimension). Without the file every
+model falls back to DEFAULT_ROW_COUNT / DEFAULT_CARDINALITY.
+
+The estimate picks the admission tier (see admission.py): cheap queries are
+`interactive`, the rest `batch`; queries above MAX_QUERY_COST are rejected.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from metric_filters import GRAIN_DAYS, TIME_GRANULARITIES, Eq, In, MetricFilter, Range, TimeRange
+from semantic_graph import SEMANTIC_MANIFEST, DimensionPath, SemanticGraph
+
+DIMENSION_STATS = os.path.join("target", "dimension_stats.json")
+
+DEFAULT_ROW_COUNT = 1_000_000
+DEFAULT_CARDINALITY = 100
+DEFAULT_TIME_RANGE_DAYS = 3 * 365
+
+JOIN_WEIGHT = 0.5          # each join adds half a scan
+GROUP_WEIGHT = 2.0         # aggregation state per group
+ROW_WEIGHT = 20.0          # serializing and returning a row
+QUEUE_COST_UNIT = 1_000_000  # cost per unit of work in fair queuing (admission.py)
+
+INTERACTIVE_MAX_COST = float(os.environ.get("INTERACTIVE_MAX_COST", 5_000_000))
+MAX_QUERY_COST = float(os.environ.get("MAX_QUERY_COST", 500_000_000))
+
+TIER_INTERACTIVE = "interactive"
+TIER_BATCH = "batch"
+
+
+# -----------------------------
+# Dimension Statistics
+# -----------------------------
+
+@dataclass
+class ModelStats:
+    row_count: int
+    cardinality: Dict[str, int] = field(default_factory=dict)                # dimension -> distinct values
+    time_range: Dict[str, Tuple[str, str]] = field(default_factory=dict)     # dimension -> (min, max)
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+_stats_cache: Dict[str, Tuple[float, Dict[str, ModelStats]]] = {}
+
+
+def load_dimension_stats(project_dir: str) -> Dict[str, ModelStats]:
+    """Per-semantic-model statistics, reloaded when the stats file changes ({} if missing)."""
+    path = os.path.join(project_dir, DIMENSION_STATS)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+
+    cached = _stats_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        models = {
+            name: ModelStats(
+                row_count=int(entry.get("row_count", DEFAULT_ROW_COUNT)),
+                cardinality={k: int(v) for k, v in entry.get("cardinality", {}).items()},
+                time_range={k: tuple(v) for k, v in entry.get("time_range", {}).items()},
+            )
+            for name, entry in raw.get("models", {}).items()
+        }
+    except (OSError, ValueError, TypeError) as e:
+        print(f"⚠ Could not load dimension stats: {e}")
+        return cached[1] if cached else {}
+
+    _stats_cache[path] = (mtime, models)
+    return models
+
+
+def _relation(raw_model: Dict[str, Any]) -> Optional[str]:
+    """The model a semantic model reads from, as a ref() for `dbt show --inline`."""
+    relation = raw_model.get("node_relation") or {}
+    if relation.get("alias"):
+        return f"{{{{ ref('{relation['alias']}') }}}}"
+    match = re.search(r"ref\(\s*['\"]([^'\"]+)['\"]\s*\)", str(raw_model.get("model", "")))
+    return f"{{{{ ref('{match.group(1)}') }}}}" if match else None
+
+
+def stats_query(raw_model: Dict[str, Any]) -> Optional[str]:
+    """One aggregate query over a semantic model's table covering all its dimensions."""
+    relation = _relation(raw_model)
+    if not relation:
+        return None
+
+    columns = ["count(*) as row_count"]
+    for dim in raw_model.get("dimensions", []):
+        expr = dim.get("expr") or dim["name"]
+        if str(dim.get("type", "")).lower() == "time":
+            columns.append(f"cast(min({expr}) as string) as {dim['name']}__min")
+            columns.append(f"cast(max({expr}) as string) as {dim['name']}__max")
+        else:
+            columns.append(f"count(distinct {expr}) as {dim['name']}")
+    for entity in raw_model.get("entities", []):
+        columns.append(f"count(distinct {entity.get('expr') or entity['name']}) as {entity['name']}")
+    return f"select {', '.join(columns)} from {relation}"
+
+
+def _run_dbt_show(sql: str, project_dir: str, profiles_dir: str, dbt_path: str) -> Dict[str, Any]:
+    result = subprocess.run(
+        [dbt_path, "show", "--inline", sql, "--output", "json", "--limit", "1", "--quiet"],
+        cwd=project_dir,
+        env={**os.environ, "DBT_PROFILES_DIR": profiles_dir},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or result.stdout.strip())
+    payload = json.loads(result.stdout[result.stdout.index("{"):])
+    rows = payload.get("show") or []
+    return {k.lower(): v for k, v in rows[0].items()} if rows else {}
+
+
+def collect_dimension_stats(project_dir: str, profiles_dir: str, dbt_path: str) -> str:
+    """Query the marts for row counts / cardinalities and write target/dimension_stats.json."""
+    with open(os.path.join(project_dir, SEMANTIC_MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    models = {}
+    for raw_model in manifest.get("semantic_models", []):
+        sql = stats_query(raw_model)
+        if not sql:
+            print(f"  ⚠ {raw_model['name']}: no underlying model, skipped")
+            continue
+        try:
+            row = _run_dbt_show(sql, project_dir, profiles_dir, dbt_path)
+        except Exception as e:
+            print(f"  ⚠ {raw_model['name']}: {e}")
+            continue
+
+        entry = {"row_count": int(row.get("row_count") or 0), "cardinality": {}, "time_range": {}}
+        for dim in raw_model.get("dimensions", []) + raw_model.get("entities", []):
+            name = dim["name"]
+            if f"{name}__min" in row:
+                entry["time_range"][name] = [row[f"{name}__min"], row[f"{name}__max"]]
+            elif name in row:
+                entry["cardinality"][name] = int(row[name] or 0)
+        models[raw_model["name"]] = entry
+        print(f"  ✓ {raw_model['name']}: {entry['row_count']:,} rows")
+
+    path = os.path.join(project_dir, DIMENSION_STATS)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"generated_at": datetime.now().isoformat(), "models": models}, f, indent=2)
+    return path
+
+
+# -----------------------------
+# Estimation
+# -----------------------------
+
+@dataclass
+class QueryCost:
+    scan_rows: float
+    groups: float
+    rows_returned: float
+    joins: int
+    time_range_days: Optional[float]
+    cost: float
+    tier: str
+    notes: List[str] = field(default_factory=list)
+
+    @property
+    def size(self) -> float:
+        """Work units for fair queuing; at least one per query."""
+        return max(1.0, self.cost / QUEUE_COST_UNIT)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "scan_rows": round(self.scan_rows),
+            "groups": round(self.groups),
+            "rows_returned": round(self.rows_returned),
+            "joins": self.joins,
+            "time_range_days": self.time_range_days,
+            "cost": round(self.cost),
+            "tier": self.tier,
+            "notes": self.notes,
+        }
+
+
+def _split_dimension(name: str) -> Tuple[str, Optional[str]]:
+    """`customer__customer_region` -> ("customer_region", None); `order__order_date__month` -> ("order_date", "month")."""
+    parts = name.split("__")
+    grain = None
+    if len(parts) >= 2 and parts[-1] in TIME_GRANULARITIES:
+        grain = parts.pop()
+    return parts[-1], grain
+
+
+def _time_window(
+    metric_filter: Optional[MetricFilter], paths: Dict[str, DimensionPath]
+) -> Tuple[Optional[date], Optional[date], Optional[int]]:
+    """
+    [start, end) implied by filters on time dimensions (None where unbounded),
+    and the days actually selected when the filter lists buckets (eq / in),
+    which can be far fewer than the span of a sparse IN list.
+    """
+    start, end, covered = None, None, None
+    for condition in (metric_filter.conditions if metric_filter else ()):
+        path = paths.get(condition.dimension)
+        if path is None or path.type != "time":
+            continue
+        lower = upper = None
+        if isinstance(condition, TimeRange):
+            lower, upper = _parse_date(condition.start), _parse_date(condition.end)
+        elif isinstance(condition, Range):
+            lower = _parse_date(condition.gte if condition.gte is not None else condition.gt)
+            upper = _parse_date(condition.lt if condition.lt is not None else condition.lte)
+            if upper and condition.lte is not None:
+                upper += timedelta(days=1)
+        elif isinstance(condition, (Eq, In)):
+            values = (condition.value,) if isinstance(condition, Eq) else condition.values
+            buckets = sorted({d for d in (_parse_date(v) for v in values) if d})
+            grain_days = GRAIN_DAYS[_split_dimension(condition.dimension)[1] or "day"]
+            if buckets:
+                lower, upper = buckets[0], buckets[-1] + timedelta(days=grain_days)
+                days = len(buckets) * grain_days
+                covered = days if covered is None else min(covered, days)
+        if lower and (start is None or lower > start):
+            start = lower
+        if upper and (end is None or upper < end):
+            end = upper
+    return start, end, covered
+
+
+class CostEstimator:
+    """Estimates query cost from the semantic graph and dimension statistics."""
+
+    def __init__(self, graph: SemanticGraph, model_stats: Optional[Dict[str, ModelStats]] = None):
+        self.graph = graph
+        self.stats = model_stats or {}
+
+    def _row_count(self, model: str) -> int:
+        stats = self.stats.get(model)
+        return stats.row_count if stats else DEFAULT_ROW_COUNT
+
+    def _data_range(self, model: str) -> Optional[Tuple[date, date]]:
+        """Time range of a model's aggregation time dimension, from stats."""
+        stats = self.stats.get(model)
+        node = self.graph.models.get(model)
+        if not stats or not node or node.agg_time_dimension not in stats.time_range:
+            return None
+        low, high = (_parse_date(v) for v in stats.time_range[node.agg_time_dimension])
+        if not low or not high:
+            return None
+        return low, high + timedelta(days=1)
+
+    def _cardinality(self, path: DimensionPath, metric_filter: Optional[MetricFilter], time_days: float) -> float:
+        base, grain = _split_dimension(path.name)
+        for condition in (metric_filter.conditions if metric_filter else ()):
+            if condition.dimension == path.name and isinstance(condition, Eq):
+                return 1
+            if condition.dimension == path.name and isinstance(condition, In):
+                return len(condition.values)
+
+        if path.type == "time":
+            return max(1.0, time_days / GRAIN_DAYS[grain or "day"])
+        if path.type == "entity":
+            owner = self.graph.entity_owners.get(base, path.semantic_model)
+            return self._row_count(owner)
+        stats = self.stats.get(path.semantic_model)
+        if stats and base in stats.cardinality:
+            return max(1, stats.cardinality[base])
+        return DEFAULT_CARDINALITY
+
+    def estimate(
+        self,
+        metrics: List[str],
+        dimensions: Optional[List[str]] = None,
+        metric_filter: Optional[MetricFilter] = None,
+        limit: Optional[int] = None,
+    ) -> QueryCost:
+        dimensions = dimensions or []
+        notes = []
+
+        paths: Dict[str, DimensionPath] = {}
+        for metric in metrics:
+            for name, path in self.graph.dimension_index.get(metric, {}).items():
+                paths.setdefault(name, path)
+        measure_models = sorted({m for metric in metrics for m in self.graph.metric_models(metric)})
+        if not self.stats:
+            notes.append("no dimension stats (run `python query_cost.py --collect`); using defaults")
+
+        # Rows scanned: measure models scaled to the requested time range
+        start, end, covered = _time_window(metric_filter, paths)
+        scan_rows = 0.0
+        time_days = None
+        for model in measure_models:
+            rows = self._row_count(model)
+            data_range = self._data_range(model)
+            if data_range:
+                low, high = data_range
+                window_low, window_high = max(start or low, low), min(end or high, high)
+                width = max(0, (window_high - window_low).days)
+                if covered is not None:
+                    width = min(width, covered)
+                rows *= width / max(1, (high - low).days)
+            elif start and end:
+                width = (end - start).days if covered is None else min((end - start).days, covered)
+                rows *= min(1.0, width / DEFAULT_TIME_RANGE_DAYS)
+            else:
+                width = ((end or date.today()) - (start or date.today() - timedelta(days=DEFAULT_TIME_RANGE_DAYS))).days
+            # A zero-width window still selects (at most) one day, not the default range
+            time_days = max(time_days or 1, width, 1)
+            scan_rows += rows
+
+        # Joins: every model reached by a grouped or filtered dimension
+        filter_dims = metric_filter.dimensions() if metric_filter else []
+        joined = {
+            model
+            for name in list(dimensions) + list(filter_dims) if name in paths
+            for model in paths[name].join_path[1:]
+        }
+        scan_rows += sum(self._row_count(model) for model in joined)
+        joins = max((paths[name].hops for name in list(dimensions) + list(filter_dims) if name in paths), default=0)
+
+        groups = 1.0
+        for name in dimensions:
+            if name in paths:
+                groups *= self._cardinality(
+                    paths[name], metric_filter, time_days if time_days is not None else DEFAULT_TIME_RANGE_DAYS
+                )
+        groups = min(groups, max(scan_rows, 1.0))
+        rows_returned = min(groups, limit) if limit else groups
+
+        cost = scan_rows * (1 + JOIN_WEIGHT * joins) + GROUP_WEIGHT * groups + ROW_WEIGHT * rows_returned
+        tier = TIER_INTERACTIVE if cost <= INTERACTIVE_MAX_COST else TIER_BATCH
+        if tier == TIER_BATCH:
+            notes.append(f"cost above interactive budget ({INTERACTIVE_MAX_COST:,.0f})")
+
+        return QueryCost(
+            scan_rows=scan_rows,
+            groups=groups,
+            rows_returned=rows_returned,
+            joins=joins,
+            time_range_days=time_days,
+            cost=cost,
+            tier=tier,
+            notes=notes,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gather dimension statistics for query cost estimation")
+    parser.add_argument("--collect", action="store_true", help="Query the marts and write target/dimension_stats.json")
+    parser.add_argument("--project-dir", default=r"C:\Rif\dbt_poc\metricflow_poc")
+    parser.add_argument("--profiles-dir", default=r"C:\Rif\dbt_poc\metricflow_poc")
+    parser.add_argument("--dbt-path", default=r"C:\Users\Timer\.local\bin\dbt.exe")
+    args = parser.parse_args()
+
+    if args.collect:
+        print("Collecting dimension statistics...")
+        written = collect_dimension_stats(args.project_dir, args.profiles_dir, args.dbt_path)
+        print(f"✓ Wrote {written}")
+    else:
+        parser.print_help()
@@ -0,0 +1,400 @@
+"""
+Scheduled Report Engine
+
+Runs the report definitions in reports.yml (daily revenue report, weekly
+executive summary, ...) from one process and one shared MCP connection:
+
+1. Collect every report due in the current window
+2. Merge their queries: identical queries run once, and queries that differ
+   only in metrics (same dimensions, filters and limit) become one query
+3. Run the merged queries with bounded parallelism (HeadlessBIClient.query_many)
+4. Fan results back out to each report's renderer
+5. Record the run: timing, queries requested vs executed, queries saved
+
+Usage:
+    python report_scheduler.py            # run reports due now
+    python report_scheduler.py --all      # run every report now
+    python report_scheduler.py --loop     # keep running, checking every minute
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from headless_bi_mcp_client import HeadlessBIClient
+from metric_filters import MetricFilter
+from metric_frame import MetricFrame, ResultDecodeError
+from semantic_graph import SemanticValidationError, load_semantic_graph
+
+REPORTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports.yml")
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+# -----------------------------
+# Report Definitions
+# -----------------------------
+
+@dataclass
+class ReportQuery:
+    id: str
+    metrics: List[str]
+    dimensions: List[str] = field(default_factory=list)
+    filters: Dict[str, Any] = field(default_factory=dict)
+    limit: Optional[int] = None
+
+
+@dataclass
+class ReportDefinition:
+    name: str
+    queries: List[ReportQuery]
+    renderer: str = "table"
+    schedule: str = "daily"          # daily | weekly
+    at: str = "07:00"
+    weekday: Optional[str] = None    # for weekly reports
+    exposure: Optional[str] = None
+
+    def scheduled_time(self, day: date) -> Optional[datetime]:
+        """When this report should run on `day`, or None if it doesn't run that day."""
+        if self.schedule == "weekly" and WEEKDAYS[day.weekday()] != (self.weekday or "monday"):
+            return None
+        hour, minute = (int(part) for part in self.at.split(":"))
+        return datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute)
+
+
+def load_report_definitions(path: str = REPORTS_FILE) -> List[ReportDefinition]:
+    with open(path, "r", encoding="utf-8") as f:
+        raw = yaml.safe_load(f) or {}
+
+    reports = []
+    for entry in raw.get("reports", []):
+        queries = [ReportQuery(**query) for query in entry.pop("queries", [])]
+        reports.append(ReportDefinition(queries=queries, **entry))
+    return reports
+
+
+def date_context(today: date) -> Dict[str, str]:
+    """Values for the {today}/{week_ago}/... placeholders in report filters."""
+    return {
+        "today": today.isoformat(),
+        "yesterday": (today - timedelta(days=1)).isoformat(),
+        "week_ago": (today - timedelta(days=7)).isoformat(),
+        "month_ago": (today - timedelta(days=30)).isoformat(),
+        "year_ago": (today - timedelta(days=365)).isoformat(),
+    }
+
+
+def resolve_placeholders(value: Any, context: Dict[str, str]) -> Any:
+    """Fill date placeholders in a (nested) filter spec."""
+    if isinstance(value, str):
+        return value.format(**context)
+    if isinstance(value, dict):
+        return {k: resolve_placeholders(v, context) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_placeholders(v, context) for v in value]
+    return value
+
+
+# -----------------------------
+# Query Merging
+# -----------------------------
+
+@dataclass
+class MergedQuery:
+    metrics: List[str]
+    dimensions: List[str]
+    metric_filter: MetricFilter
+    limit: Optional[int]
+    consumers: List[Tuple[str, ReportQuery]] = field(default_factory=list)   # (report, query)
+
+    def to_kwargs(self, catalog: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        kwargs = {"metrics": self.metrics, "dimensions": self.dimensions or None, "limit": self.limit}
+        where = self.metric_filter.to_where(catalog)
+        if where:
+            kwargs["where"] = where
+        return kwargs
+
+
+def merge_queries(
+    reports: List[ReportDefinition],
+    today: date,
+    project_dir: Optional[str] = None,
+) -> Tuple[List[MergedQuery], int]:
+    """
+    Merge the queries of all due reports.
+
+    Queries are grouped by (dimensions, canonical filters, limit) and their
+    metrics unioned. If the semantic graph says a merged metric set has no
+    common dimensions, that metric gets its own query instead.
+
+    Returns the merged queries and the number of queries originally requested.
+    """
+    context = date_context(today)
+    graph = load_semantic_graph(project_dir) if project_dir else None
+    groups: Dict[Tuple[Any, ...], List[MergedQuery]] = {}
+    requested = 0
+
+    for report in reports:
+        for query in report.queries:
+            requested += 1
+            metric_filter = MetricFilter.from_spec(
+                resolve_placeholders(query.filters, context)
+            ).normalized()
+            dimensions = sorted(set(query.dimensions))
+            key = (tuple(dimensions), metric_filter.canonical_json(), query.limit)
+
+            candidates = groups.setdefault(key, [])
+            target = None
+            for merged in candidates:
+                if graph is None or _compatible(graph, merged.metrics + query.metrics, dimensions, metric_filter):
+                    target = merged
+                    break
+            if target is None:
+                target = MergedQuery([], dimensions, metric_filter, query.limit)
+                candidates.append(target)
+
+            target.metrics = sorted(set(target.metrics) | set(query.metrics))
+            target.consumers.append((report.name, query))
+
+    merged = [query for candidates in groups.values() for query in candidates]
+    return merged, requested
+
+
+def _compatible(graph, metrics: List[str], dimensions: List[str], metric_filter: MetricFilter) -> bool:
+    try:
+        graph.validate_query(sorted(set(metrics)), dimensions, metric_filter)
+        return True
+    except SemanticValidationError:
+        return False
+
+
+def project_result(result: Any, query: ReportQuery) -> Dict[str, Any]:
+    """
+    Decode a merged result into {"data": rows} cut down to the columns one
+    report query asked for.
+
+    Accepts MCP content (TextContent items holding JSON rows) as well as
+    {"data": rows}; raises ResultDecodeError when the content isn't rows.
+    """
+    columns = set(query.metrics) | set(query.dimensions)
+    rows = [
+        {k: v for k, v in row.items() if k in columns}
+        for row in MetricFrame.from_result(result).iter_rows()
+    ]
+    return {"data": rows}
+
+
+# -----------------------------
+# Renderers
+# -----------------------------
+
+Renderer = Callable[[ReportDefinition, Dict[str, Any]], None]
+RENDERERS: Dict[str, Renderer] = {}
+
+
+def renderer(name: str):
+    """Register a report renderer: fn(report, {query_id: result})."""
+    def register(fn: Renderer) -> Renderer:
+        RENDERERS[name] = fn
+        return fn
+    return register
+
+
+def _rows(result: Any) -> List[Dict[str, Any]]:
+    if isinstance(result, dict) and isinstance(result.get("data"), list):
+        return result["data"]
+    return []
+
+
+@renderer("table")
+def render_table(report: ReportDefinition, results: Dict[str, Any]):
+    print(f"\n{report.name}")
+    print("-" * 60)
+    for query_id, result in results.items():
+        print(f"[{query_id}]")
+        for row in _rows(result):
+            print("  " + ", ".join(f"{k}={v}" for k, v in row.items()))
+
+
+@renderer("daily_revenue")
+def render_daily_revenue(report: ReportDefinition, results: Dict[str, Any]):
+    print("\nDaily Revenue Report (Last 7 Days):")
+    print("-" * 60)
+    for row in _rows(results.get("last_7_days")):
+        print(f"Date: {row.get('order__order_date__day', 'N/A')}")
+        print(f"  Total Revenue: ${row.get('total_revenue') or 0:,.2f}")
+        print(f"  Completed Revenue: ${row.get('completed_revenue') or 0:,.2f}")
+        print(f"  Total Orders: {row.get('total_orders', 0)}")
+
+    today = _rows(results.get("today"))
+    if today:
+        print("Today:")
+        print(f"  Revenue: ${today[0].get('total_revenue') or 0:,.2f}")
+        print(f"  Orders: {today[0].get('total_orders', 0)}")
+        print(f"  AOV: ${today[0].get('average_order_value') or 0:,.2f}")
+
+
+@renderer("executive_summary")
+def render_executive_summary(report: ReportDefinition, results: Dict[str, Any]):
+    days = _rows(results.get("last_7_days"))
+    revenue = sum(row.get("total_revenue", 0) or 0 for row in days)
+    orders = sum(row.get("total_orders", 0) or 0 for row in days)
+    print("\nWeekly Executive Summary:")
+    print("-" * 60)
+    print(f"  Revenue (7d): ${revenue:,.2f}")
+    print(f"  Orders (7d): {orders}")
+    for row in _rows(results.get("by_store_type")):
+        print(f"  {row.get('store__store_type', 'Unknown')}: ${row.get('total_revenue') or 0:,.2f}")
+    for row in _rows(results.get("rates")):
+        print(f"  Order Completion: {row.get('order_completion_rate') or 0:.2%}")
+        print(f"  Credit Card Adoption: {row.get('credit_card_adoption_rate') or 0:.2%}")
+
+
+# -----------------------------
+# Scheduler
+# -----------------------------
+
+@dataclass
+class RunRecord:
+    started_at: str
+    duration_ms: float
+    reports: List[str]
+    queries_requested: int
+    queries_executed: int
+    queries_saved: int
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+class ReportScheduler:
+    """Runs due reports together, deduplicating their queries."""
+
+    def __init__(
+        self,
+        client: HeadlessBIClient,
+        reports: List[ReportDefinition],
+        max_parallel: int = 4,
+        window: timedelta = timedelta(minutes=15),
+        run_log: Optional[str] = "report_runs.jsonl",
+    ):
+        self.client = client
+        self.reports = reports
+        self.max_parallel = max_parallel
+        self.window = window
+        self.run_log = run_log
+        self.history: List[RunRecord] = []
+        self._last_run: Dict[str, datetime] = {}    # report -> scheduled time last run
+
+    def due_reports(self, now: datetime) -> List[ReportDefinition]:
+        """Reports whose scheduled time falls in (now - window, now] and haven't run yet."""
+        due = []
+        for report in self.reports:
+            scheduled = report.scheduled_time(now.date())
+            if scheduled is None or not (now - self.window < scheduled <= now):
+                continue
+            if self._last_run.get(report.name) == scheduled:
+                continue
+            due.append(report)
+        return due
+
+    async def run_reports(self, reports: List[ReportDefinition], now: Optional[datetime] = None) -> RunRecord:
+        now = now or datetime.now()
+        start = time.perf_counter()
+
+        merged, requested = merge_queries(reports, now.date(), self.client.project_dir)
+        graph = load_semantic_graph(self.client.project_dir)
+        catalog = graph.dimension_catalog() if graph else None
+        results = await self.client.query_many(
+            [query.to_kwargs(catalog) for query in merged],
+            concurrency=self.max_parallel,
+            return_exceptions=True,
+        )
+
+        per_report: Dict[str, Dict[str, Any]] = {report.name: {} for report in reports}
+        errors: Dict[str, str] = {}
+        for query, result in zip(merged, results):
+            for report_name, report_query in query.consumers:
+                if isinstance(result, Exception):
+                    errors[f"{report_name}.{report_query.id}"] = f"{type(result).__name__}: {result}"
+                    continue
+                try:
+                    per_report[report_name][report_query.id] = project_result(result, report_query)
+                except ResultDecodeError as e:
+                    errors[f"{report_name}.{report_query.id}"] = f"{type(e).__name__}: {e}"
+
+        for report in reports:
+            render = RENDERERS.get(report.renderer, render_table)
+            try:
+                render(report, per_report[report.name])
+            except Exception as e:
+                errors[report.name] = f"{type(e).__name__}: {e}"
+            scheduled = report.scheduled_time(now.date())
+            if scheduled:
+                self._last_run[report.name] = scheduled
+
+        record = RunRecord(
+            started_at=now.isoformat(),
+            duration_ms=round((time.perf_counter() - start) * 1000, 1),
+            reports=[report.name for report in reports],
+            queries_requested=requested,
+            queries_executed=len(merged),
+            queries_saved=requested - len(merged),
+            errors=errors,
+        )
+        self._record(record)
+        return record
+
+    async def run_due(self, now: Optional[datetime] = None) -> Optional[RunRecord]:
+        now = now or datetime.now()
+        due = self.due_reports(now)
+        if not due:
+            return None
+        return await self.run_reports(due, now)
+
+    async def run_forever(self, poll_seconds: int = 60):
+        while True:
+            await self.run_due()
+            await asyncio.sleep(poll_seconds)
+
+    def _record(self, record: RunRecord):
+        self.history.append(record)
+        print(
+            f"✓ Ran {len(record.reports)} report(s) in {record.duration_ms:.0f} ms: "
+            f"{record.queries_executed}/{record.queries_requested} queries executed "
+            f"({record.queries_saved} saved)"
+        )
+        for name, error in record.errors.items():
+            print(f"  ⚠ {name}: {error}")
+        if self.run_log:
+            with open(self.run_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record.__dict__) + "\n")
+
+
+async def main(run_all: bool = False, loop: bool = False):
+    client = HeadlessBIClient.shared()
+    scheduler = ReportScheduler(client, load_report_definitions())
+    try:
+        if run_all:
+            await scheduler.run_reports(scheduler.reports)
+        elif loop:
+            await scheduler.run_forever()
+        else:
+            if await scheduler.run_due() is None:
+                print("No reports due")
+    finally:
+        await HeadlessBIClient.close_shared()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run scheduled headless BI reports")
+    parser.add_argument("--all", action="store_true", help="Run every report now")
+    parser.add_argument("--loop", action="store_true", help="Keep running and check every minute")
+    args = parser.parse_args()
+
+    asyncio.run(main(run_all=args.all, loop=args.loop))
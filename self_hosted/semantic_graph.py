@@ -0,0 +1,379 @@
+"""
+In-Process Semantic Graph
+
+Built from target/semantic_manifest.json so metric/dimension requests can be
+validated locally, before they consume an MCP slot:
+
+    metrics -> measures -> semantic models -> entities -> join paths
+
+A dimension is valid for a metric when it belongs to the semantic model that
+owns the metric's measures, or to a model reachable by joining on one of its
+entities (e.g. orders -> customers via `customer`, orders -> stores via `store`),
+up to MAX_JOIN_HOPS joins away. Multi-hop dimensions are named by their entity
+path, e.g. `customer__country__country_name`.
+
+All reachable dimensions are precomputed per metric when the graph is built,
+so discovery and validation are dictionary lookups until the manifest changes.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from metric_filters import TIME_GRANULARITIES, MetricFilter
+
+SEMANTIC_MANIFEST = os.path.join("target", "semantic_manifest.json")
+
+MAX_JOIN_HOPS = 2
+
+# Measure aggregations whose per-day values sum to the value over a range
+ADDITIVE_AGGS = {"sum", "count", "sum_boolean"}
+# ... and those that are zero (not unknown) for a period without rows
+ZERO_WHEN_EMPTY_AGGS = ADDITIVE_AGGS | {"count_distinct"}
+
+
+class SemanticValidationError(ValueError):
+    """Raised when a request references unknown metrics or unreachable dimensions."""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+# -----------------------------
+# Graph Nodes
+# -----------------------------
+
+@dataclass
+class SemanticModelNode:
+    name: str
+    primary_entity: Optional[str]
+    entities: Dict[str, str] = field(default_factory=dict)      # entity -> primary/foreign/unique
+    dimensions: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    measures: Set[str] = field(default_factory=set)
+    agg_time_dimension: Optional[str] = None
+
+
+@dataclass
+class MetricNode:
+    name: str
+    type: str
+    measures: Set[str] = field(default_factory=set)
+    input_metrics: Set[str] = field(default_factory=set)
+
+
+@dataclass(frozen=True)
+class DimensionPath:
+    """How a dimension is reached from the semantic model that owns a metric's measures."""
+
+    name: str
+    type: str
+    semantic_model: str
+    join_path: Tuple[str, ...]      # semantic models joined, starting at the measure's model
+    entity_path: Tuple[str, ...]    # entities joined on (empty for local dimensions)
+
+    @property
+    def hops(self) -> int:
+        return len(self.entity_path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "type": self.type,
+            "semantic_model": self.semantic_model,
+            "join_path": list(self.join_path),
+            "entity_path": list(self.entity_path),
+            "hops": self.hops,
+        }
+
+
+def _ref_name(ref: Any) -> Optional[str]:
+    """Metric/measure references are either plain names or {"name": ...} objects."""
+    if isinstance(ref, dict):
+        return ref.get("name")
+    return ref
+
+
+def _time_names(name: str, grain: Optional[str]) -> Dict[str, str]:
+    """A time dimension plus every coarser-or-equal granularity suffix."""
+    names = {name: "time"}
+    start = TIME_GRANULARITIES.index(grain) if grain in TIME_GRANULARITIES else 0
+    names.update({f"{name}__{g}": "time" for g in TIME_GRANULARITIES[start:]})
+    return names
+
+
+# -----------------------------
+# Semantic Graph
+# -----------------------------
+
+class SemanticGraph:
+    """Metrics, measures, semantic models and entity join edges from one manifest."""
+
+    def __init__(self, manifest: Dict[str, Any]):
+        self.models: Dict[str, SemanticModelNode] = {}
+        self.metrics: Dict[str, MetricNode] = {}
+        self.measure_models: Dict[str, str] = {}
+        self.measure_aggs: Dict[str, str] = {}          # measure -> agg (sum, count_distinct, ...)
+        self.entity_owners: Dict[str, str] = {}     # entity -> model where it is primary
+
+        for raw in manifest.get("semantic_models", []):
+            self._add_model(raw)
+        for raw in manifest.get("metrics", []):
+            self._add_metric(raw)
+
+        # Precomputed join-path index: metric -> {dimension_name: DimensionPath}
+        self.dimension_index: Dict[str, Dict[str, DimensionPath]] = {
+            name: self._reachable_dimensions(name) for name in self.metrics
+        }
+        self._dimension_types: Dict[str, Dict[str, str]] = {
+            name: {d.name: d.type for d in paths.values()}
+            for name, paths in self.dimension_index.items()
+        }
+        self._catalog: Dict[str, str] = {}
+        for types in self._dimension_types.values():
+            self._catalog.update(types)
+
+    def _add_model(self, raw: Dict[str, Any]):
+        entities = {e["name"]: str(e.get("type", "")).lower() for e in raw.get("entities", [])}
+        primary = next((name for name, kind in entities.items() if kind == "primary"), None)
+        model = SemanticModelNode(
+            name=raw["name"],
+            primary_entity=primary,
+            entities=entities,
+            dimensions={d["name"]: d for d in raw.get("dimensions", [])},
+            measures={m["name"] for m in raw.get("measures", [])},
+            agg_time_dimension=(raw.get("defaults") or {}).get("agg_time_dimension"),
+        )
+        self.models[model.name] = model
+        for measure in model.measures:
+            self.measure_models[measure] = model.name
+        for measure in raw.get("measures", []):
+            self.measure_aggs[measure["name"]] = str(measure.get("agg", "")).lower()
+        if primary:
+            self.entity_owners[primary] = model.name
+
+    def _add_metric(self, raw: Dict[str, Any]):
+        params = raw.get("type_params") or {}
+        metric = MetricNode(name=raw["name"], type=str(raw.get("type", "")).lower())
+
+        measure = _ref_name(params.get("measure"))
+        if measure:
+            metric.measures.add(measure)
+        for ref in params.get("input_measures") or []:
+            metric.measures.add(_ref_name(ref))
+        for key in ("numerator", "denominator"):
+            if params.get(key):
+                metric.input_metrics.add(_ref_name(params[key]))
+        for ref in params.get("metrics") or []:
+            metric.input_metrics.add(_ref_name(ref))
+
+        self.metrics[metric.name] = metric
+
+    def is_additive(self, metric_name: str) -> bool:
+        """True for simple metrics whose daily values can be summed over a date range."""
+        metric = self.metrics.get(metric_name)
+        if metric is None or metric.type != "simple" or not metric.measures:
+            return False
+        return all(self.measure_aggs.get(m) in ADDITIVE_AGGS for m in metric.measures)
+
+    def is_zero_when_empty(self, metric_name: str) -> bool:
+        """True for simple sum / count metrics, whose value for a period with no rows is 0."""
+        metric = self.metrics.get(metric_name)
+        if metric is None or metric.type != "simple" or not metric.measures:
+            return False
+        return all(self.measure_aggs.get(m) in ZERO_WHEN_EMPTY_AGGS for m in metric.measures)
+
+    # -- traversal ---------------------------------------------------------
+
+    def metric_measures(self, metric_name: str, _seen: Optional[Set[str]] = None) -> Set[str]:
+        """All measures a metric depends on, resolving ratio/derived inputs."""
+        seen = _seen if _seen is not None else set()
+        if metric_name in seen or metric_name not in self.metrics:
+            return set()
+        seen.add(metric_name)
+
+        metric = self.metrics[metric_name]
+        measures = set(metric.measures)
+        for child in metric.input_metrics:
+            measures |= self.metric_measures(child, seen)
+        return measures
+
+    def metric_models(self, metric_name: str) -> Set[str]:
+        return {
+            self.measure_models[m]
+            for m in self.metric_measures(metric_name)
+            if m in self.measure_models
+        }
+
+    def model_dimensions(
+        self,
+        model: SemanticModelNode,
+        prefix: str,
+        join_path: Tuple[str, ...],
+        entity_path: Tuple[str, ...],
+    ) -> List[DimensionPath]:
+        """Dimensions of one model, qualified by the entity path used to reach it."""
+        paths = []
+        for dim in model.dimensions.values():
+            qualified = f"{prefix}__{dim['name']}"
+            if str(dim.get("type", "")).lower() == "time":
+                grain = (dim.get("type_params") or {}).get("time_granularity")
+                names = _time_names(qualified, str(grain).lower() if grain else None)
+            else:
+                names = {qualified: "categorical"}
+            paths.extend(
+                DimensionPath(name, dim_type, model.name, join_path, entity_path)
+                for name, dim_type in names.items()
+            )
+        return paths
+
+    def join_paths(self, model: SemanticModelNode) -> List[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+        """
+        Every (entity_path, join_path) reachable from a model within MAX_JOIN_HOPS,
+        joining on an entity to the model where that entity is primary.
+        """
+        found = []
+        frontier = [((), (model.name,))]
+        for _ in range(MAX_JOIN_HOPS):
+            next_frontier = []
+            for entity_path, join_path in frontier:
+                current = self.models[join_path[-1]]
+                for entity in current.entities:
+                    owner = self.entity_owners.get(entity)
+                    if not owner or owner in join_path or entity in entity_path:
+                        continue
+                    step = (entity_path + (entity,), join_path + (owner,))
+                    found.append(step)
+                    next_frontier.append(step)
+            frontier = next_frontier
+        return found
+
+    def _reachable_dimensions(self, metric_name: str) -> Dict[str, DimensionPath]:
+        paths: Dict[str, DimensionPath] = {}
+
+        def add(candidates: Iterable[DimensionPath]):
+            for candidate in candidates:
+                existing = paths.get(candidate.name)
+                if existing is None or candidate.hops < existing.hops:
+                    paths[candidate.name] = candidate
+
+        for model_name in sorted(self.metric_models(metric_name)):
+            model = self.models[model_name]
+            add(
+                DimensionPath(name, dim_type, model_name, (model_name,), ())
+                for name, dim_type in _time_names("metric_time", "day").items()
+            )
+            add(
+                DimensionPath(entity, "entity", model_name, (model_name,), ())
+                for entity in model.entities
+            )
+            if model.primary_entity:
+                add(self.model_dimensions(model, model.primary_entity, (model_name,), ()))
+            for entity_path, join_path in self.join_paths(model):
+                joined = self.models[join_path[-1]]
+                add(self.model_dimensions(joined, "__".join(entity_path), join_path, entity_path))
+        return paths
+
+    def valid_dimensions(self, metric_name: str) -> Dict[str, str]:
+        """{dimension_name: type} that can group or filter the metric."""
+        if metric_name not in self._dimension_types:
+            raise SemanticValidationError([f"Unknown metric: {metric_name}"])
+        return self._dimension_types[metric_name]
+
+    def dimension_paths(self, metric_name: str) -> List[DimensionPath]:
+        """Reachable dimensions for a metric with their join paths, for discovery."""
+        if metric_name not in self.dimension_index:
+            raise SemanticValidationError([f"Unknown metric: {metric_name}"])
+        return sorted(self.dimension_index[metric_name].values(), key=lambda d: (d.hops, d.name))
+
+    def common_dimensions(self, metric_names: Iterable[str]) -> Dict[str, str]:
+        """Dimensions valid for every metric in a multi-metric query."""
+        metric_names = list(metric_names)
+        if not metric_names:
+            return {}
+        common = dict(self.valid_dimensions(metric_names[0]))
+        for name in metric_names[1:]:
+            valid = self.valid_dimensions(name)
+            common = {k: v for k, v in common.items() if k in valid}
+        return common
+
+    def dimension_catalog(self) -> Dict[str, str]:
+        """Every groupable name across all metrics, for filter validation."""
+        return self._catalog
+
+    # -- validation --------------------------------------------------------
+
+    def validate_query(
+        self,
+        metrics: List[str],
+        dimensions: Optional[List[str]] = None,
+        metric_filter: Optional[MetricFilter] = None,
+    ) -> Dict[str, str]:
+        """
+        Validate a metric query and return the dimensions valid for all of its metrics.
+
+        Raises SemanticValidationError listing every problem found.
+        """
+        unknown = [m for m in metrics if m not in self.metrics]
+        if unknown:
+            raise SemanticValidationError([f"Unknown metric(s): {', '.join(unknown)}"])
+
+        valid = self.common_dimensions(metrics)
+        errors = []
+        invalid = [d for d in (dimensions or []) if d not in valid]
+        if invalid:
+            errors.append(
+                f"Dimension(s) not available for {', '.join(metrics)}: {', '.join(invalid)}"
+            )
+        if metric_filter:
+            invalid = [d for d in metric_filter.dimensions() if d not in valid]
+            if invalid:
+                errors.append(f"Filter dimension(s) not available: {', '.join(invalid)}")
+        if errors:
+            raise SemanticValidationError(errors)
+        return valid
+
+    def check_dimensions(self, metric_name: str, dimensions: List[str]) -> Dict[str, Any]:
+        """Response body for /metrics/validate-dimensions."""
+        valid = self.valid_dimensions(metric_name)
+        invalid = [d for d in dimensions if d not in valid]
+        return {
+            "metric_name": metric_name,
+            "valid": not invalid,
+            "invalid_dimensions": invalid,
+            "valid_dimensions": sorted(valid),
+        }
+
+
+# -----------------------------
+# Loading (reloaded when the manifest changes)
+# -----------------------------
+
+_graph_cache: Dict[str, Tuple[float, SemanticGraph]] = {}
+
+
+def load_semantic_graph(project_dir: str) -> Optional[SemanticGraph]:
+    """
+    Return the semantic graph for a dbt project, rebuilding it only when
+    target/semantic_manifest.json changes. Returns None if no manifest exists.
+    """
+    path = os.path.join(project_dir, SEMANTIC_MANIFEST)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _graph_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            graph = SemanticGraph(json.load(f))
+    except (OSError, json.JSONDecodeError, KeyError) as e:
+        print(f"⚠ Could not load semantic manifest: {e}")
+        return cached[1] if cached else None
+
+    _graph_cache[path] = (mtime, graph)
+    return graph
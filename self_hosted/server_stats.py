@@ -0,0 +1,69 @@
+"""
+In-Process Server Stats
+
+Small counters/timings registry shared by the API servers and exposed over
+HTTP (`/api/stats`, `/stats`). Labels are folded into the metric name, e.g.
+`response_bytes{encoding=gzip}`.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+class ServerStats:
+    """Thread-safe counters, gauges and timing summaries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, milliseconds: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            timing = self.timings.setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            timing["count"] += 1
+            timing["total_ms"] += milliseconds
+            timing["max_ms"] = max(timing["max_ms"], milliseconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            timings = {
+                key: {**t, "avg_ms": t["total_ms"] / t["count"] if t["count"] else 0.0}
+                for key, t in self.timings.items()
+            }
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timings": timings,
+            }
+
+
+stats = ServerStats()
@@ -0,0 +1,181 @@
+"""
+Tenants: Identification, Rate Limits and Usage
+
+Several teams share one API server (the exposure owners in
+models/exposures.yml). Each request is attributed to a tenant:
+
+1. `X-API-Key` header -> tenant whose key (from the env var named in
+   tenants.yml) matches; an unknown key is rejected with 401
+2. otherwise          -> the `default` tenant (`X-Tenant` naming any other
+   tenant is rejected with 401: only a key grants a tenant's weight and limits)
+
+Every tenant in tenants.yml other than `default` must name an `api_key_env`
+that is set; the registry refuses to load otherwise. Exposure owners without
+an entry in tenants.yml have no key and are only listed for reporting.
+
+Per tenant:
+- a token bucket limits the request rate (429 + Retry-After when empty)
+- `weight` sets its share of MCP / warehouse capacity; admission.py orders
+  waiting requests with weighted fair queuing on it
+- requests, latency, status codes, waits and estimated cost are recorded in
+  server_stats with a `tenant` label
+"""
+
+import hmac
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import yaml
+
+from admission import DEFAULT_TENANT
+
+TENANTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tenants.yml")
+EXPOSURES_FILE = os.path.join("models", "exposures.yml")
+
+
+class TenantError(Exception):
+    """A request that can't be attributed to a tenant, or is over its rate limit."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, tokens: float = 1.0) -> float:
+        """Take tokens; returns 0 on success, else seconds until enough are available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+@dataclass
+class Tenant:
+    id: str
+    name: str = ""
+    weight: float = 1.0
+    rate_per_second: float = 5.0
+    burst: float = 20.0
+    api_key_env: Optional[str] = None
+    bucket: TokenBucket = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.bucket = TokenBucket(self.rate_per_second, self.burst)
+
+    @property
+    def api_key(self) -> Optional[str]:
+        return os.environ.get(self.api_key_env) if self.api_key_env else None
+
+
+def _exposure_owners(project_dir: str) -> Dict[str, str]:
+    """{tenant id: owner name} for every exposure owner with an email."""
+    path = os.path.join(project_dir, EXPOSURES_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = yaml.safe_load(f) or {}
+    except OSError:
+        return {}
+
+    owners = {}
+    for exposure in raw.get("exposures", []):
+        owner = exposure.get("owner") or {}
+        email = owner.get("email", "")
+        if "@" in email:
+            tenant_id = re.sub(r"[^a-z0-9_-]", "-", email.split("@")[0].lower())
+            owners.setdefault(tenant_id, owner.get("name", tenant_id))
+    return owners
+
+
+class TenantRegistry:
+    """Known tenants, identified per request."""
+
+    def __init__(self, project_dir: str, tenants_file: str = TENANTS_FILE):
+        with open(tenants_file, "r", encoding="utf-8") as f:
+            raw = yaml.safe_load(f) or {}
+        defaults = raw.get("defaults", {})
+
+        entries: Dict[str, Dict[str, Any]] = {
+            tenant_id: {"id": tenant_id, "name": name}
+            for tenant_id, name in _exposure_owners(project_dir).items()
+        }
+        entries.setdefault(DEFAULT_TENANT, {"id": DEFAULT_TENANT})
+        for entry in raw.get("tenants", []):
+            entries.setdefault(entry["id"], {}).update(entry)
+
+        self.tenants: Dict[str, Tenant] = {
+            tenant_id: Tenant(**{**defaults, **entry}) for tenant_id, entry in entries.items()
+        }
+
+        configured = [entry["id"] for entry in raw.get("tenants", []) if entry["id"] != DEFAULT_TENANT]
+        unkeyed = [tenant_id for tenant_id in configured if not self.tenants[tenant_id].api_key_env]
+        if unkeyed:
+            raise ValueError(f"Tenants without api_key_env in {tenants_file}: {', '.join(unkeyed)}")
+        missing = [self.tenants[t].api_key_env for t in configured if not self.tenants[t].api_key]
+        if missing:
+            raise ValueError(f"API key environment variable(s) not set: {', '.join(missing)}")
+
+    def _by_api_key(self, api_key: str) -> Optional[Tenant]:
+        supplied = api_key.encode()
+        match = None
+        for tenant in self.tenants.values():
+            # Constant-time comparison, and no early exit on a match
+            if tenant.api_key and hmac.compare_digest(tenant.api_key.encode(), supplied):
+                match = tenant
+        return match
+
+    def identify(self, headers: Any) -> Tenant:
+        """Tenant for a request's headers; raises TenantError (401/400) when it can't be attributed."""
+        api_key = headers.get("x-api-key")
+        if api_key:
+            tenant = self._by_api_key(api_key)
+            if tenant is None:
+                raise TenantError(401, "Unknown API key")
+            return tenant
+
+        tenant_id = headers.get("x-tenant")
+        if tenant_id and tenant_id != DEFAULT_TENANT:
+            if tenant_id not in self.tenants:
+                raise TenantError(400, f"Unknown tenant '{tenant_id}'")
+            raise TenantError(401, f"Tenant '{tenant_id}' requires an API key (X-API-Key)")
+
+        return self.tenants[DEFAULT_TENANT]
+
+    def check_rate(self, tenant: Tenant):
+        """Charge one request to the tenant's token bucket; raises TenantError(429) when empty."""
+        wait = tenant.bucket.take()
+        if wait:
+            raise TenantError(
+                429,
+                f"Rate limit exceeded for tenant '{tenant.id}' ({tenant.rate_per_second}/s, burst {tenant.burst})",
+                retry_after=max(1, int(wait + 0.999)),
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            tenant.id: {
+                "name": tenant.name,
+                "weight": tenant.weight,
+                "rate_per_second": tenant.rate_per_second,
+                "burst": tenant.burst,
+                "tokens": round(tenant.bucket.tokens, 2),
+                "api_key": bool(tenant.api_key),
+            }
+            for tenant in self.tenants.values()
+        }
@@ -0,0 +1,35 @@
+"""
+Query cache test: compiled SQL is reused for the same semantic manifest and
+recompiled once the manifest changes (no MCP server or warehouse needed)
+"""
+import asyncio
+
+from query_cache import QueryCache
+
+
+def test_manifest_change_recompiles():
+    cache = QueryCache()
+    compiles = []
+
+    async def compile_sql():
+        compiles.append(1)
+        return f"SELECT {len(compiles)} AS revision"
+
+    async def run():
+        first = await cache.compiled_sql("revenue", compile_sql, "manifest-a")
+        again = await cache.compiled_sql("revenue", compile_sql, "manifest-a")
+        changed = await cache.compiled_sql("revenue", compile_sql, "manifest-b")
+        return first, again, changed
+
+    first, again, changed = asyncio.run(run())
+    assert first[2] is False and again[2] is True
+    assert again[0] == first[0]
+    assert changed[2] is False
+    assert changed[0] == "SELECT 2 AS revision"
+    assert changed[1] != first[1]
+    assert len(compiles) == 2
+
+
+if __name__ == "__main__":
+    test_manifest_change_recompiles()
+    print("✓ Manifest change recompiles cached SQL")
@@ -0,0 +1,132 @@
+"""
+Direct Warehouse Execution with Bind Parameters
+
+Filtered dashboard queries (`/api/query/revenue?store_type=Premium`, then
+`?store_type=Basic`, ...) differ only in literal values, yet each one used to
+go through a full MetricFlow compile. With a warehouse connection configured,
+headless_bi_api_server.py instead:
+
+1. replaces every string filter value with a sentinel literal
+   (MetricFilter.parameterized) and compiles that query shape once over MCP;
+   the SQL is cached per shape in the query cache's SQL tier
+2. turns the compiled SQL into a template: each quoted sentinel becomes a
+   named parameter marker (`:p0`, `:p1`, ...)
+3. executes the template on Databricks with the values bound by
+   databricks-sql-connector, so values are never interpolated into SQL text
+
+If a sentinel doesn't survive compilation unchanged, or no warehouse is
+configured, the query runs through MCP query_metrics as before.
+
+Configuration (the same warehouse as the dbt profile):
+    DATABRICKS_SERVER_HOSTNAME, DATABRICKS_HTTP_PATH, DATABRICKS_TOKEN
+
+Requires: pip install databricks-sql-connector>=3.0
+"""
+
+import asyncio
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from metric_filters import PARAM_SENTINEL
+
+WAREHOUSE_POOL_SIZE = int(os.environ.get("WAREHOUSE_POOL_SIZE", 4))
+
+_SENTINEL_LITERAL = re.compile("'" + PARAM_SENTINEL.replace("{:03d}", r"(\d{3})") + "'")
+
+
+@dataclass(frozen=True)
+class SqlTemplate:
+    """Compiled SQL with named parameter markers in place of filter values."""
+
+    sql: str
+    params: tuple           # parameter names the SQL references
+
+    @classmethod
+    def from_compiled(cls, compiled_sql: str, params: Dict[str, Any]) -> Optional["SqlTemplate"]:
+        """
+        Template for SQL compiled from a parameterized filter, or None if any
+        sentinel was rewritten by the compiler (the caller falls back to MCP).
+        """
+        found = set()
+
+        def marker(match):
+            name = f"p{int(match.group(1))}"
+            found.add(name)
+            return f":{name}"
+
+        sql = _SENTINEL_LITERAL.sub(marker, compiled_sql)
+        if found != set(params) or "__mfparam_" in sql:
+            return None
+        return cls(sql, tuple(sorted(found)))
+
+    def limited(self, limit: Optional[int]) -> str:
+        if not limit:
+            return self.sql
+        return f"SELECT * FROM (\n{self.sql.rstrip().rstrip(';')}\n) AS metric_query LIMIT {int(limit)}"
+
+
+class Warehouse:
+    """Small connection pool over databricks-sql-connector; queries run in worker threads."""
+
+    def __init__(
+        self,
+        server_hostname: Optional[str] = None,
+        http_path: Optional[str] = None,
+        access_token: Optional[str] = None,
+        pool_size: int = WAREHOUSE_POOL_SIZE,
+    ):
+        self.server_hostname = server_hostname or os.environ.get("DATABRICKS_SERVER_HOSTNAME")
+        self.http_path = http_path or os.environ.get("DATABRICKS_HTTP_PATH")
+        self.access_token = access_token or os.environ.get("DATABRICKS_TOKEN")
+        self.pool_size = pool_size
+        self._idle: List[Any] = []
+        self._sql = None
+
+        if self.configured:
+            try:
+                from databricks import sql
+                self._sql = sql
+            except ImportError:
+                print("⚠ Warehouse: install databricks-sql-connector for parameterized execution; using MCP")
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.server_hostname and self.http_path and self.access_token)
+
+    @property
+    def enabled(self) -> bool:
+        return self._sql is not None
+
+    def _connect(self):
+        return self._sql.connect(
+            server_hostname=self.server_hostname,
+            http_path=self.http_path,
+            access_token=self.access_token,
+        )
+
+    def _execute(self, sql: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        connection = self._idle.pop() if self._idle else self._connect()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                columns = [c[0] for c in cursor.description or []]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except Exception:
+            connection.close()
+            raise
+        if len(self._idle) < self.pool_size:
+            self._idle.append(connection)
+        else:
+            connection.close()
+        return rows
+
+    async def execute(self, template: SqlTemplate, params: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Run a template with its values bound; returns rows as dicts."""
+        bound = {name: params[name] for name in template.params}
+        return await asyncio.to_thread(self._execute, template.limited(limit), bound)
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
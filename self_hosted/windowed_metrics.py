@@ -0,0 +1,264 @@
+"""
+Cumulative and Rolling Metrics from Prefix Sums
+
+Running totals and trailing N-day windows (`total_revenue` cumulative, 7 and
+30 day rolling) over the daily time spine, without rescanning history:
+
+1. per-day base values of each metric (metric_time__day) are fetched once
+   through the normal query path and kept per metric and filter, from the
+   series origin (the `aggregates_begin` var in dbt_project.yml) onwards;
+   days without rows are zero, so the series is contiguous like the spine
+2. each series keeps prefix sums next to the daily values:
+
+       cumulative(d)      = prefix[d + 1]
+       rolling(d, n days) = prefix[d + 1] - prefix[d + 1 - n]
+
+   so every windowed value is O(1), and extending the range by one day is
+   one fetched day and one appended prefix sum
+3. when dbt rebuilds (the query cache's data version changes) only the last
+   WINDOW_REFRESH_DAYS days are refetched, matching the incremental marts'
+   lookback; a full refresh or a semantic manifest change resets the series.
+   Series never extend past today, so no future day is cached as zero
+
+Only additive metrics qualify (simple metrics over sum / count measures):
+distinct counts and ratios can't be summed across days.
+"""
+
+import asyncio
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from metric_filters import MetricFilter
+from metric_frame import MetricFrame
+from query_cache import load_run_results
+
+WINDOW_REFRESH_DAYS = int(os.environ.get("WINDOW_REFRESH_DAYS", 3))
+WINDOW_MAX_SERIES = int(os.environ.get("WINDOW_MAX_SERIES", 256))
+DEFAULT_ORIGIN = date(2020, 1, 1)
+
+DAY_DIMENSION = "metric_time__day"
+
+# (metrics, filter, first day, last day) -> {day: {metric: value}}
+FetchDaily = Callable[[List[str], MetricFilter, date, date], Awaitable[Dict[date, Dict[str, float]]]]
+
+
+class WindowError(ValueError):
+    """Raised for unsupported window specs or non-additive metrics."""
+
+
+def parse_window(spec: str) -> Optional[int]:
+    """'cumulative' -> None, '7d' / '7' -> 7."""
+    text = str(spec).strip().lower()
+    if text == "cumulative":
+        return None
+    try:
+        days = int(text[:-1] if text.endswith("d") else text)
+    except ValueError:
+        raise WindowError(f"Unknown window '{spec}' (expected 'cumulative' or a day count like '7d')")
+    if days < 1:
+        raise WindowError(f"Window '{spec}' must be at least one day")
+    return days
+
+
+def window_column(metric: str, days: Optional[int]) -> str:
+    return f"{metric}__cumulative" if days is None else f"{metric}__rolling_{days}d"
+
+
+def daily_values(result: Any) -> Dict[date, Dict[str, float]]:
+    """{day: {metric: value}} from a query result grouped by metric_time__day."""
+    values: Dict[date, Dict[str, float]] = {}
+    for row in MetricFrame.from_result(result).iter_rows():
+        row = {name.lower(): value for name, value in row.items()}
+        day = row.pop(DAY_DIMENSION, None)
+        if day:
+            values[date.fromisoformat(str(day)[:10])] = row
+    return values
+
+
+def series_origin(project_dir: str) -> date:
+    """First day of the daily series: the aggregates_begin var, like the rollups."""
+    try:
+        with open(os.path.join(project_dir, "dbt_project.yml"), "r", encoding="utf-8") as f:
+            begin = ((yaml.safe_load(f) or {}).get("vars") or {}).get("aggregates_begin")
+        return date.fromisoformat(str(begin)[:10]) if begin else DEFAULT_ORIGIN
+    except (OSError, ValueError):
+        return DEFAULT_ORIGIN
+
+
+# -----------------------------
+# Prefix-Sum Series
+# -----------------------------
+
+@dataclass
+class PrefixSeries:
+    """Daily values from `origin` plus their prefix sums."""
+
+    origin: date
+    daily: List[float] = field(default_factory=list)
+    prefix: List[float] = field(default_factory=lambda: [0.0])
+
+    @property
+    def end(self) -> date:
+        """Last day covered (the day before origin when empty)."""
+        return self.origin + timedelta(days=len(self.daily) - 1)
+
+    def index(self, day: date) -> int:
+        return (day - self.origin).days
+
+    def append(self, value: float):
+        self.daily.append(value)
+        self.prefix.append(self.prefix[-1] + value)
+
+    def truncate(self, day: date):
+        """Drop `day` and everything after it."""
+        keep = max(0, self.index(day))
+        del self.daily[keep:]
+        del self.prefix[keep + 1:]
+
+    def value(self, day: date) -> float:
+        return self.daily[self.index(day)]
+
+    def cumulative(self, day: date) -> float:
+        return self.prefix[self.index(day) + 1]
+
+    def rolling(self, day: date, days: int) -> float:
+        i = self.index(day) + 1
+        return self.prefix[i] - self.prefix[max(0, i - days)]
+
+
+@dataclass
+class _SeriesGroup:
+    """The series of every metric queried with one filter."""
+
+    version: Optional[str] = None
+    series: Dict[str, PrefixSeries] = field(default_factory=dict)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+# -----------------------------
+# Windowed Metrics
+# -----------------------------
+
+class WindowedMetrics:
+    """Keeps prefix-sum series per (filter, metric) and answers window queries from them."""
+
+    def __init__(
+        self,
+        project_dir: str,
+        refresh_days: int = WINDOW_REFRESH_DAYS,
+        max_series: int = WINDOW_MAX_SERIES,
+    ):
+        self.project_dir = project_dir
+        self.refresh_days = refresh_days
+        self.max_series = max_series
+        self._groups: "OrderedDict[str, _SeriesGroup]" = OrderedDict()
+
+    def _group(self, key: str) -> _SeriesGroup:
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _SeriesGroup()
+        self._groups.move_to_end(key)
+        while sum(len(g.series) for g in self._groups.values()) > self.max_series and len(self._groups) > 1:
+            self._groups.popitem(last=False)
+        return group
+
+    def _invalidate(self, group: _SeriesGroup, version: str):
+        """On a new data version, drop the tail the rebuild may have changed (or everything)."""
+        if group.version is None or group.version == version:
+            group.version = version
+            return
+        manifest_changed = group.version.rsplit(":", 1)[-1] != version.rsplit(":", 1)[-1]
+        run_results = load_run_results(self.project_dir) or {}
+        if manifest_changed or (run_results.get("args") or {}).get("full_refresh"):
+            group.series.clear()
+        else:
+            for series in group.series.values():
+                series.truncate(series.end - timedelta(days=self.refresh_days - 1))
+        group.version = version
+
+    async def _extend(
+        self,
+        group: _SeriesGroup,
+        metrics: List[str],
+        metric_filter: MetricFilter,
+        end: date,
+        fetch_daily: FetchDaily,
+    ) -> int:
+        """Fetch the days the group's series are missing up to `end`; returns days fetched."""
+        origin = series_origin(self.project_dir)
+        for metric in metrics:
+            group.series.setdefault(metric, PrefixSeries(origin))
+        # One fetch per distinct series end, so a newly added metric's history
+        # doesn't refetch the metrics that only need today
+        stale: Dict[date, List[str]] = {}
+        for metric in metrics:
+            if group.series[metric].end < end:
+                stale.setdefault(group.series[metric].end, []).append(metric)
+
+        fetched = 0
+        for last_known, names in sorted(stale.items()):
+            first = last_known + timedelta(days=1)
+            values = await fetch_daily(names, metric_filter, first, end)
+            for metric in names:
+                for offset in range((end - first).days + 1):
+                    day = first + timedelta(days=offset)
+                    group.series[metric].append(float((values.get(day) or {}).get(metric) or 0.0))
+            fetched = max(fetched, (end - first).days + 1)
+        return fetched
+
+    async def query(
+        self,
+        metrics: List[str],
+        windows: List[Optional[int]],
+        start: date,
+        end: date,
+        metric_filter: Optional[MetricFilter],
+        version: str,
+        fetch_daily: FetchDaily,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Daily rows from start to end with each metric's value and windowed values.
+
+        Days the cached series don't cover yet are fetched with `fetch_daily`.
+        """
+        metric_filter = metric_filter or MetricFilter()
+        if start > end:
+            raise WindowError("start must not be after end")
+        if end > date.today():
+            # Future days would be cached as zeros beyond the refresh tail
+            raise WindowError(f"end must not be after today ({date.today().isoformat()})")
+        origin = series_origin(self.project_dir)
+        if start < origin:
+            raise WindowError(f"start is before the series origin {origin.isoformat()}")
+
+        group = self._group(metric_filter.canonical_json())
+        async with group.lock:
+            self._invalidate(group, version)
+            fetched = await self._extend(group, metrics, metric_filter, end, fetch_daily)
+
+            rows = []
+            day = start
+            while day <= end:
+                row: Dict[str, Any] = {DAY_DIMENSION: day.isoformat()}
+                for metric in metrics:
+                    series = group.series[metric]
+                    row[metric] = series.value(day)
+                    for days in windows:
+                        column = window_column(metric, days)
+                        row[column] = series.cumulative(day) if days is None else series.rolling(day, days)
+                rows.append(row)
+                day += timedelta(days=1)
+
+        return rows, {"origin": origin.isoformat(), "days_fetched": fetched, "days_returned": len(rows)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "filters": len(self._groups),
+            "series": sum(len(g.series) for g in self._groups.values()),
+            "days": sum(len(s.daily) for g in self._groups.values() for s in g.series.values()),
+        }